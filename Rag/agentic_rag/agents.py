@@ -1,157 +1,342 @@
+from __future__ import annotations
+
 import os
-from typing import List, Tuple
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from openai import OpenAI as OpenAIClient
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import (TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional,
+                    Sequence, Tuple, Union)
 from dotenv import load_dotenv
 from file_manager import FileManager
-import os
+from runtime import RAGRuntime, get_runtime
+from compactor import Compactor
+from streaming import StreamingIngest
+from instrumentation import instrumentation
+from bm25_index import reciprocal_rank_fusion
+from context import DEFAULT_CONTEXT_TOKENS, assemble_context
+
+if TYPE_CHECKING:
+    # langchain and openai take seconds to import; agents load them on first use
+    from langchain.schema import Document
+    from llm_gateway import LLMGateway
 
 # Load environment variables
 load_dotenv()
 
-from langchain_community.vectorstores import Chroma
+# Async callable returning the embedding of a query (e.g. a micro-batcher)
+QueryEmbedder = Callable[[str], Awaitable[List[float]]]
+# A query is scoped to one file ID or to several, retrieved concurrently
+FileScope = Union[str, Sequence[str]]
 
 
 class DeleteAgent:
     """Agent for deleting files and their data from the database"""
 
-    def __init__(self, chroma_path: str = "chroma", metadata_path: str = "file_metadata.json"):
+    def __init__(self, chroma_path: str = "chroma", metadata_path: str = "file_metadata.json",
+                 runtime: Optional[RAGRuntime] = None, file_manager: Optional[FileManager] = None,
+                 compactor: Optional[Compactor] = None):
         self.chroma_path = chroma_path
         self.metadata_path = metadata_path
-        self.file_manager = FileManager(metadata_path)
-        self.embedding_function = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        self.file_manager = file_manager or FileManager(metadata_path)
+        self.runtime = runtime or get_runtime(chroma_path)
+        # Chunks are purged in the background; start() also resumes unfinished purges
+        self.compactor = compactor or Compactor(self.runtime, self.file_manager)
+        self.compactor.start()
 
     def delete_file_by_number(self, number: str) -> str:
-        """Delete a file and its data by number (1-based index)"""
+        """Delete a file by number (1-based index).
+
+        The file is tombstoned, so it drops out of listings and queries at
+        once; its chunks are removed from the vector store by the compactor.
+        """
         try:
             # Get file ID from number
-            files = list(self.file_manager.get_all_files().items())
-            try:
-                index = int(number) - 1
-                if 0 <= index < len(files):
-                    file_id = files[index][0]
-                else:
-                    return f"Invalid file number: {number}. Use 'list' to see available files."
-            except ValueError:
+            if not number.isdigit():
                 return f"Invalid file number: {number}. Please provide a valid number."
+            with instrumentation.span("delete.lookup"):
+                file_id = self.file_manager.get_file_id_by_number(number)
+                if not file_id:
+                    return f"Invalid file number: {number}. Use 'list' to see available files."
 
-            # Get file info
-            file_info = self.file_manager.get_file_info(file_id)
-            if not file_info:
-                return f"File ID not found: {file_id}"
-
-            # Delete from Chroma database
-            if os.path.exists(self.chroma_path):
-                db = Chroma(persist_directory=self.chroma_path, embedding_function=self.embedding_function)
-                # Use the correct method to get and delete documents
-                # First, get all documents with matching file_id metadata
-                results = db.get(where={"file_id": file_id})
-
-                if results and results.get("ids"):
-                    # Delete the documents using their IDs
-                    db.delete(ids=results["ids"])
-                    print(f"Deleted {len(results['ids'])} document chunks from vector database")
-                else:
-                    print("No documents found in vector database for this file")
+                # Get file info
+                file_info = self.file_manager.get_file_info(file_id)
+                if not file_info:
+                    return f"File ID not found: {file_id}"
 
-            # Delete from metadata (updates file_metadata.json)
-            filename = file_info['filename']
-            del self.file_manager.metadata[file_id]
-            self.file_manager._save_metadata()  # Save changes to file_metadata.json
+            chunk_count = len(self.runtime.bm25.file_docs.get(file_id, ()))
+            with instrumentation.span("delete.metadata"):
+                self.file_manager.tombstone_file(file_id, chunk_count=chunk_count)
+            self.runtime.bm25.remove_file(file_id)
+            self.runtime.query_cache.invalidate_file(file_id)
+            self.compactor.submit(file_id, dict(file_info, chunk_count=chunk_count))
 
-            return f"Successfully deleted file: {filename} (ID: {file_id})"
+            return f"Successfully deleted file: {file_info['filename']} (ID: {file_id})"
 
         except Exception as e:
+            instrumentation.record_error("delete", e)
             return f"Error deleting file: {str(e)}"
 
 
 class FileLoaderAgent:
     """Agent for loading and processing PDF and text files"""
 
-    def __init__(self, chroma_path: str = "chroma"):
+    def __init__(self, chroma_path: str = "chroma", runtime: Optional[RAGRuntime] = None,
+                 batch_size: int = 256):
         self.chroma_path = chroma_path
-        self.embedding_function = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-
-    def process_file(self, file_path: str, file_id: str) -> Tuple[bool, str]:
-        """Process PDF or text file and store in vector database"""
+        self.runtime = runtime or get_runtime(chroma_path)
+        self.batch_size = batch_size
+        self._ingest: Optional[StreamingIngest] = None
+
+    @property
+    def ingest(self) -> StreamingIngest:
+        """Streaming ingester, created on first use"""
+        if self._ingest is None:
+            self._ingest = StreamingIngest(self.runtime, batch_size=self.batch_size)
+        return self._ingest
+
+    def process_file(self, file_path: str, file_id: str, content_hash: Optional[str] = None,
+                     on_progress: Optional[Callable[[str, Dict[str, int]], None]] = None
+                     ) -> Tuple[bool, str, Dict[str, int]]:
+        """Process PDF or text file and store in vector database.
+
+        Pages are loaded, split, embedded and written in bounded batches, so
+        memory stays flat for very large files; an interrupted run resumes
+        from the last committed page. `on_progress` is passed to StreamingIngest.run.
+        Returns (success, message, counts); counts are this call's chunk and cache
+        counts, empty on failure.
+        """
         try:
+            from langchain_community.document_loaders import TextLoader, PyPDFLoader
+
             file_ext = os.path.splitext(file_path)[1].lower()
             if file_ext == '.pdf':
                 loader = PyPDFLoader(file_path)
             elif file_ext == '.txt':
                 loader = TextLoader(file_path, encoding="utf-8")
             else:
-                return False, f"Unsupported file type: {file_ext}"
-
-            documents = loader.load()
-            for doc in documents:
-                doc.metadata["file_id"] = file_id
-                doc.metadata["file_type"] = file_ext[1:]  # Remove dot
-
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=500,
-                chunk_overlap=50,
-                length_function=len,
-                add_start_index=True,
-            )
-            chunks = text_splitter.split_documents(documents)
-            self._save_to_chroma(chunks)
-
-            return True, f"Successfully processed {file_ext[1:]} file! Created {len(chunks)} chunks."
+                return False, f"Unsupported file type: {file_ext}", {}
+
+            hits_before, misses_before = self.runtime.embedding_function.counters()
+            counts = self.ingest.run(file_path, file_id, loader, file_ext[1:], content_hash, on_progress)
+            hits, misses = self.runtime.embedding_function.counters()
+            chunks, added, removed, unchanged = counts["chunks"], counts["added"], counts["removed"], counts["unchanged"]
+            instrumentation.incr("ingest.documents", counts["pages"])
+            instrumentation.incr("ingest.chunks", chunks)
+            instrumentation.incr("ingest.embedded", added)
+            instrumentation.incr("embedding_cache.hits", hits - hits_before)
+            instrumentation.incr("embedding_cache.misses", misses - misses_before)
+            # Cached answers may quote chunks that just changed
+            self.runtime.query_cache.invalidate_file(file_id)
+
+            resumed = f" Resumed after page {counts['resumed_pages']}." if counts["resumed_pages"] else ""
+            message = (f"Successfully processed {file_ext[1:]} file! Created {chunks} chunks "
+                       f"({added} embedded, {unchanged} unchanged, {removed} removed; "
+                       f"embedding cache {hits - hits_before} hits, {misses - misses_before} misses).{resumed}")
+            return True, message, dict(counts, cache_hits=hits - hits_before, cache_misses=misses - misses_before)
 
         except Exception as e:
-            return False, f"Error processing file: {str(e)}"
-
-    def _save_to_chroma(self, chunks: List[Document]):
-        """Save chunks to Chroma database"""
-        if os.path.exists(self.chroma_path):
-            db = Chroma(persist_directory=self.chroma_path, embedding_function=self.embedding_function)
-            db.add_documents(chunks)
-        else:
-            db = Chroma.from_documents(
-                chunks, self.embedding_function, persist_directory=self.chroma_path
-            )
-        # Removed db.persist() as Chroma auto-persists since 0.0.4x
+            instrumentation.record_error("ingest", e)
+            return False, f"Error processing file: {str(e)}", {}
 
 
 class QueryAgent:
     """Agent for querying the vector database"""
 
-    def __init__(self, chroma_path: str = "chroma"):
+    def __init__(self, chroma_path: str = "chroma", runtime: Optional[RAGRuntime] = None,
+                 model: str = "qwen/qwen3-30b-a3b:free", k: int = 3, use_cache: bool = True,
+                 base_url: Optional[str] = None, hybrid: bool = True,
+                 context_tokens: Optional[int] = DEFAULT_CONTEXT_TOKENS, rerank: Optional[bool] = None,
+                 multi_file_k: int = 8, max_parallel_files: int = 8):
         self.chroma_path = chroma_path
-        self.embedding_function = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
-        self.client = OpenAIClient(
-            base_url="https://openrouter.ai/api/v1/",
-            api_key=os.getenv('API_KEY')
-        )
-
-    def query_database(self, query: str, file_id: str) -> str:
-        """Query the vector database for a specific file"""
+        self.runtime = runtime or get_runtime(chroma_path)
+        self.model = model
+        self.k = k
+        self.use_cache = use_cache
+        # Fuse BM25 keyword hits with vector hits so exact terms (acronyms, headings) are found at small k
+        self.hybrid = hybrid
+        # Token budget for retrieved context in the prompt (None disables packing)
+        self.context_tokens = context_tokens
+        # Re-score a wider candidate set with a cross-encoder and keep the best k
+        if rerank is None:
+            rerank = os.getenv('RERANK', '0').lower() in ('1', 'true', 'yes')
+        self.rerank = rerank
+        # Chunks kept after merging a multi-file query, and how many files are searched at once
+        self.multi_file_k = multi_file_k
+        self.max_parallel_files = max_parallel_files
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # LLM_BASE_URL points the agent at any OpenAI-compatible server (e.g. the benchmark mock)
+        self.base_url = base_url or os.getenv('LLM_BASE_URL', "https://openrouter.ai/api/v1/")
+
+    @property
+    def llm(self) -> LLMGateway:
+        """Pooled LLM client with timeouts, retries, hedging and fallback models (see llm_gateway)"""
+        return self.runtime.llm_gateway(self.model, self.base_url)
+
+    def query_database(self, query: str, file_id: FileScope) -> str:
+        """Query the vector database for a specific file or a list of files"""
         try:
-            if not os.path.exists(self.chroma_path):
-                return "No documents loaded yet. Please load a file first."
-
-            db = Chroma(persist_directory=self.chroma_path, embedding_function=self.embedding_function)
-            results = db.similarity_search_with_relevance_scores(
-                query,
-                k=3,
-                filter={"file_id": file_id}
+            answer, context = self._prepare_query(query, file_id)
+            if answer is not None:
+                return answer
+
+            with self.runtime.timed("query.llm"):
+                completion = self.llm.complete(
+                    messages=[{"role": "user", "content": context["prompt"]}],
+                    temperature=0.7,
+                    max_tokens=512
+                )
+            response_text = completion.choices[0].message.content
+            self._count_usage(completion)
+            return self._finish_query(query, file_id, context, response_text)
+
+        except Exception as e:
+            instrumentation.record_error("query", e)
+            return f"Error while searching: {str(e)}"
+
+    def stream_query(self, query: str, file_id: FileScope) -> Iterator[str]:
+        """Query a file and yield the answer as tokens arrive"""
+        try:
+            answer, context = self._prepare_query(query, file_id)
+            if answer is not None:
+                yield answer
+                return
+
+            llm_start = time.perf_counter()
+            stream = self.llm.stream(
+                messages=[{"role": "user", "content": context["prompt"]}],
+                temperature=0.7,
+                max_tokens=512
             )
+            parts = []
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if not parts:
+                    self.runtime.record("query.first_token", time.perf_counter() - llm_start)
+                parts.append(delta)
+                yield delta
+            self.runtime.record("query.llm", time.perf_counter() - llm_start)
+            instrumentation.incr("query.completion_tokens", len(parts))
+
+            answer = self._finish_query(query, file_id, context, "".join(parts))
+            yield answer[len("".join(parts)):]
 
-            if not results:
-                return "No relevant information found for your question.Try rephrasing or asking about something else."
+        except Exception as e:
+            instrumentation.record_error("query", e)
+            yield f"Error while searching: {str(e)}"
 
-            context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
+    async def aquery_database(self, query: str, file_id: FileScope, embed: Optional[QueryEmbedder] = None) -> str:
+        """Async variant of query_database for serving many sessions from one event loop.
+
+        Cache lookups, embedding and retrieval are blocking, so they run in a
+        worker thread; while one session retrieves, the event loop keeps
+        driving the LLM calls of the others. `embed` lets a server supply
+        query embeddings from a shared micro-batcher.
+        """
+        try:
+            answer, context = await self._aprepare_query(query, file_id, embed)
+            if answer is not None:
+                return answer
+
+            with self.runtime.timed("query.llm"):
+                completion = await self.llm.acomplete(
+                    messages=[{"role": "user", "content": context["prompt"]}],
+                    temperature=0.7,
+                    max_tokens=512
+                )
+            response_text = completion.choices[0].message.content
+            self._count_usage(completion)
+            return self._finish_query(query, file_id, context, response_text)
+
+        except Exception as e:
+            instrumentation.record_error("query", e)
+            return f"Error while searching: {str(e)}"
+
+    async def astream_query(self, query: str, file_id: FileScope,
+                            embed: Optional[QueryEmbedder] = None) -> AsyncIterator[str]:
+        """Async variant of stream_query"""
+        try:
+            answer, context = await self._aprepare_query(query, file_id, embed)
+            if answer is not None:
+                yield answer
+                return
+
+            llm_start = time.perf_counter()
+            stream = await self.llm.astream(
+                messages=[{"role": "user", "content": context["prompt"]}],
+                temperature=0.7,
+                max_tokens=512
+            )
+            parts = []
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if not parts:
+                    self.runtime.record("query.first_token", time.perf_counter() - llm_start)
+                parts.append(delta)
+                yield delta
+            self.runtime.record("query.llm", time.perf_counter() - llm_start)
+            instrumentation.incr("query.completion_tokens", len(parts))
+
+            answer = self._finish_query(query, file_id, context, "".join(parts))
+            yield answer[len("".join(parts)):]
+
+        except Exception as e:
+            instrumentation.record_error("query", e)
+            yield f"Error while searching: {str(e)}"
+
+    async def _aprepare_query(self, query: str, file_id: FileScope,
+                              embed: Optional[QueryEmbedder]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Run _prepare_query off the event loop, embedding through `embed` if given"""
+        query_embedding = None
+        if embed is not None and self.runtime.has_store():
+            cache_key = self._cache_key(file_id)
+            if cache_key:
+                cached = self.runtime.query_cache.get_exact(query, cache_key, self.k, self.model)
+                if cached is not None:
+                    instrumentation.incr("query_cache.exact_hits")
+                    return cached, None
+            query_embedding = await embed(query)
+        return await asyncio.to_thread(self._prepare_query, query, file_id, query_embedding)
+
+    def _prepare_query(self, query: str, file_id: FileScope,
+                       query_embedding: Optional[List[float]] = None) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """Run cache lookups and retrieval.
+
+        Returns (answer, None) when the question can be answered without the
+        LLM, otherwise (None, context) with everything needed to finish it.
+        """
+        if not self.runtime.has_store():
+            return "No documents loaded yet. Please load a file first.", None
+
+        start = time.perf_counter()
+        cache = self.runtime.query_cache
+        cache_key = self._cache_key(file_id)
+        if cache_key:
+            cached = cache.get_exact(query, cache_key, self.k, self.model)
+            if cached is not None:
+                instrumentation.incr("query_cache.exact_hits")
+                return cached, None
+
+        if query_embedding is None:
+            with self.runtime.timed("query.embed"):
+                query_embedding = self.runtime.embedding_function.embed_query(query)
+        if cache_key:
+            cached = cache.get_semantic(query_embedding, cache_key, self.k, self.model)
+            if cached is not None:
+                instrumentation.incr("query_cache.semantic_hits")
+                return cached, None
+            instrumentation.incr("query_cache.misses")
+
+        file_ids = [file_id] if isinstance(file_id, str) else list(dict.fromkeys(file_id))
+        results = self._retrieve(query, query_embedding, file_ids)
+        if not results:
+            return "No relevant information found for your question.Try rephrasing or asking about something else.", None
+
+        with instrumentation.span("query.prompt"):
+            context_text, results, context_tokens = assemble_context(results, self.context_tokens)
             prompt = f"""
             Answer the question based only on the following context:
 
@@ -161,16 +346,93 @@ class QueryAgent:
 
             Answer the question based on the above context: {query}
             """
-            completion = self.client.chat.completions.create(
-                model="qwen/qwen3-30b-a3b:free",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=512
-            )
-            response_text = completion.choices[0].message.content
-
-            sources = [f"Source: {os.path.basename(doc.metadata.get('source', 'Unknown'))}" for doc, _ in results]
-            return f"{response_text}\n\nSources:\n {', '.join(set(sources))}"
-
-        except Exception as e:
-            return f"Error while searching: {str(e)}"
+        instrumentation.incr("query.chunks", len(results))
+        instrumentation.incr("query.context_tokens", context_tokens)
+        return None, {"start": start, "embedding": query_embedding, "results": results, "prompt": prompt}
+
+    def _cache_key(self, file_id: FileScope) -> Optional[str]:
+        """File ID to cache answers under; multi-file answers are not cached"""
+        if not self.use_cache:
+            return None
+        if isinstance(file_id, str):
+            return file_id
+        file_ids = set(file_id)
+        return next(iter(file_ids)) if len(file_ids) == 1 else None
+
+    def _retrieve(self, query: str, query_embedding: List[float],
+                  file_ids: List[str]) -> List[Tuple[Document, float]]:
+        """Best chunks of one or more files: vector search, optional BM25 fusion and re-ranking.
+
+        Several files are searched concurrently, one filtered vector search
+        each; their hits are merged by relevance score, which is comparable
+        across files, and fused with one BM25 search over all of them.
+        """
+        limit = self.k if len(file_ids) == 1 else max(self.k, self.multi_file_k)
+        fetch_k = max(limit, self.runtime.reranker.max_candidates) if self.rerank else self.k
+        if len(file_ids) == 1:
+            results = self._vector_search(query_embedding, file_ids[0], fetch_k)
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_parallel_files,
+                                                    thread_name_prefix="rag-retrieve")
+            with instrumentation.span("query.fanout"):
+                per_file = self._executor.map(
+                    lambda file_id: self._vector_search(query_embedding, file_id, fetch_k), file_ids
+                )
+                results = sorted((item for hits in per_file for item in hits), key=lambda item: item[1], reverse=True)
+            instrumentation.incr("query.fanout_files", len(file_ids))
+
+        depth = limit
+        if self.rerank:
+            depth = self.runtime.reranker.candidate_depth([score for _, score in results], limit)
+        if self.hybrid:
+            with self.runtime.timed("query.bm25"):
+                keyword_hits = self.runtime.bm25.search(query, max(depth, limit), file_ids=file_ids)
+            results = self._fuse(results, keyword_hits, max(depth, limit))
+        if depth > limit:
+            with self.runtime.timed("query.rerank"):
+                results = self.runtime.reranker.rerank(query, results[:depth], limit)
+            instrumentation.incr("query.rerank_candidates", depth)
+        elif self.rerank:
+            self.runtime.reranker.record_skip()
+            instrumentation.incr("query.rerank_skipped")
+        return results[:limit]
+
+    def _vector_search(self, query_embedding: List[float], file_id: str, k: int) -> List[Tuple[Document, float]]:
+        with self.runtime.timed("query.search"):
+            return self.runtime.similarity_search_by_vector(query_embedding, k=k, filter={"file_id": file_id})
+
+    def _fuse(self, vector_results: List[Tuple[Document, float]], keyword_hits: List[Tuple[str, float]],
+              limit: Optional[int] = None) -> List[Tuple[Document, float]]:
+        """Combine vector and BM25 rankings with reciprocal-rank fusion, keeping the top `limit` (default k)"""
+        limit = limit or self.k
+        if not keyword_hits:
+            return vector_results[:limit]
+        documents = {}
+        vector_ranking = []
+        for doc, _score in vector_results:
+            chunk_id = doc.metadata.get("chunk_id") or getattr(doc, "id", None) or doc.page_content
+            documents[chunk_id] = doc
+            vector_ranking.append(chunk_id)
+        fused = reciprocal_rank_fusion([vector_ranking, [chunk_id for chunk_id, _ in keyword_hits]])[:limit]
+        documents.update(self.runtime.get_documents([chunk_id for chunk_id, _ in fused if chunk_id not in documents]))
+        return [(documents[chunk_id], score) for chunk_id, score in fused if chunk_id in documents]
+
+    @staticmethod
+    def _count_usage(completion):
+        """Add the token usage reported by the API to the counters"""
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            instrumentation.incr("query.prompt_tokens", usage.prompt_tokens or 0)
+            instrumentation.incr("query.completion_tokens", usage.completion_tokens or 0)
+
+    def _finish_query(self, query: str, file_id: FileScope, context: Dict[str, Any], response_text: str) -> str:
+        """Attach sources to the LLM answer and cache it"""
+        results = context["results"]
+        sources = [f"Source: {os.path.basename(doc.metadata.get('source', 'Unknown'))}" for doc, _ in results]
+        answer = f"{response_text}\n\nSources:\n {', '.join(set(sources))}"
+        cache_key = self._cache_key(file_id)
+        if cache_key and response_text:
+            self.runtime.query_cache.put(query, cache_key, self.k, self.model, context["embedding"], answer,
+                                         cost=time.perf_counter() - context["start"])
+        return answer
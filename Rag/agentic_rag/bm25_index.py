@@ -0,0 +1,153 @@
+import os
+import re
+import math
+import pickle
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it of on or that the this to was were what when where which "
+    "who why how with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class SegmentBuilder:
+    """Accumulates the postings of one file's segment chunk by chunk"""
+
+    def __init__(self):
+        self.chunk_ids: List[str] = []
+        self.lengths: List[int] = []
+        self.terms: Dict[str, List[Tuple[str, int]]] = {}
+
+    def add(self, chunk_id: str, text: str):
+        tokens = tokenize(text)
+        self.chunk_ids.append(chunk_id)
+        self.lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self.terms.setdefault(term, []).append((chunk_id, tf))
+
+    def segment(self) -> Dict:
+        return {"chunk_ids": self.chunk_ids, "lengths": self.lengths, "terms": self.terms}
+
+
+class BM25Index:
+    """In-process BM25 inverted index partitioned by file_id.
+
+    Each file is one segment pickled to `<index_dir>/<file_id>.pkl`, so
+    indexing or deleting a file rewrites only that file's segment. Posting
+    lists are keyed term -> file_id -> [(chunk_id, tf)], which makes
+    per-file filtering a dictionary lookup instead of a scan.
+    """
+
+    def __init__(self, index_dir: str, k1: float = 1.5, b: float = 0.75):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.postings: Dict[str, Dict[str, List[Tuple[str, int]]]] = {}
+        self.doc_freq: Counter = Counter()
+        self.doc_lengths: Dict[str, int] = {}
+        self.file_docs: Dict[str, List[str]] = {}
+        self.file_terms: Dict[str, List[str]] = {}
+        self.total_length = 0
+        self._load()
+
+    def index_file(self, file_id: str, chunk_ids: List[str], texts: List[str]):
+        """(Re)index every chunk of a file, replacing its previous segment"""
+        builder = SegmentBuilder()
+        for chunk_id, text in zip(chunk_ids, texts):
+            builder.add(chunk_id, text)
+        self.commit_segment(file_id, builder)
+
+    def commit_segment(self, file_id: str, builder: SegmentBuilder):
+        """Replace a file's segment with one built incrementally"""
+        segment = builder.segment()
+        with self._lock:
+            self._drop(file_id)
+            self._add(file_id, segment)
+            self._write_segment(file_id, segment)
+
+    def remove_file(self, file_id: str):
+        """Prune a file's postings and delete its segment"""
+        with self._lock:
+            self._drop(file_id)
+            path = self._segment_path(file_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def search(self, query: str, k: int, file_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Return the top-k (chunk_id, score) pairs, optionally limited to some files"""
+        with self._lock:
+            total_docs = len(self.doc_lengths)
+            if not total_docs:
+                return []
+            avg_length = self.total_length / total_docs
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                by_file = self.postings.get(term)
+                if not by_file:
+                    continue
+                df = self.doc_freq[term]
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                files = by_file.keys() if file_ids is None else [f for f in file_ids if f in by_file]
+                for file_id in files:
+                    for chunk_id, tf in by_file[file_id]:
+                        length_norm = 1 - self.b + self.b * self.doc_lengths[chunk_id] / avg_length
+                        score = idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+                        scores[chunk_id] = scores.get(chunk_id, 0.0) + score
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def _add(self, file_id: str, segment: Dict):
+        self.file_docs[file_id] = segment["chunk_ids"]
+        self.file_terms[file_id] = list(segment["terms"])
+        for chunk_id, length in zip(segment["chunk_ids"], segment["lengths"]):
+            self.doc_lengths[chunk_id] = length
+            self.total_length += length
+        for term, postings in segment["terms"].items():
+            self.postings.setdefault(term, {})[file_id] = postings
+            self.doc_freq[term] += len(postings)
+
+    def _drop(self, file_id: str):
+        chunk_ids = self.file_docs.pop(file_id, None)
+        if chunk_ids is None:
+            return
+        for chunk_id in chunk_ids:
+            self.total_length -= self.doc_lengths.pop(chunk_id, 0)
+        for term in self.file_terms.pop(file_id, ()):
+            self.doc_freq[term] -= len(self.postings[term].pop(file_id))
+            if not self.postings[term]:
+                del self.postings[term]
+                del self.doc_freq[term]
+
+    def _segment_path(self, file_id: str) -> str:
+        return os.path.join(self.index_dir, f"{file_id}.pkl")
+
+    def _write_segment(self, file_id: str, segment: Dict):
+        os.makedirs(self.index_dir, exist_ok=True)
+        path = self._segment_path(file_id)
+        with open(path + ".tmp", 'wb') as f:
+            pickle.dump(segment, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def _load(self):
+        if not os.path.isdir(self.index_dir):
+            return
+        for name in os.listdir(self.index_dir):
+            if name.endswith(".pkl"):
+                with open(os.path.join(self.index_dir, name), 'rb') as f:
+                    self._add(name[:-len(".pkl")], pickle.load(f))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists: score(id) = sum over lists of 1 / (k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+from context import count_tokens
+from incremental import assign_chunk_ids
+from instrumentation import instrumentation
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+# Splitting less text than this in a process pool costs more than it saves
+PARALLEL_MIN_CHARS = 1 << 21
+
+MARKDOWN_HEADING = r"^#{1,6}[ \t]+\S[^\n]*$"
+# "2.1 Search Methods", "Chapter 3 Planning", "IV. Results"; no trailing sentence punctuation
+NUMBERED_HEADING = r"^(?:\d+(?:\.\d+)*\.?|[IVX]+\.|(?:Chapter|CHAPTER|Section|SECTION)[ \t]+\d+:?)[ \t]+[A-Z][^\n]{0,78}[^\n.,;:]$"
+CAPS_HEADING = r"^[A-Z][A-Z0-9 &'\-]{3,78}[A-Z0-9]$"
+
+
+class ChunkProfile:
+    """How one file type is cut into chunks.
+
+    Chunks hold at most `chunk_tokens` tokens (tiktoken cl100k_base, or a
+    len/4 estimate without it) and repeat up to `overlap_tokens` tokens of
+    the previous chunk. A line matching `headings` always starts a new chunk,
+    and the heading is kept as the chunk's `section`.
+    """
+
+    def __init__(self, chunk_tokens: int = 128, overlap_tokens: int = 16, headings: Optional[str] = None,
+                 separators: Sequence[str] = SEPARATORS):
+        if chunk_tokens <= 0 or not 0 <= overlap_tokens < chunk_tokens:
+            raise ValueError(f"Invalid chunk profile: {chunk_tokens} tokens with {overlap_tokens} overlap")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.headings = re.compile(headings, re.MULTILINE) if headings else None
+        self.separators = tuple(separators)
+
+    def to_dict(self) -> Dict:
+        return {"chunk_tokens": self.chunk_tokens, "overlap_tokens": self.overlap_tokens,
+                "headings": self.headings.pattern if self.headings else None}
+
+    def fingerprint(self) -> str:
+        """Digest of every setting that decides where chunks start and end"""
+        settings = dict(self.to_dict(), separators=self.separators)
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def default_profiles() -> Dict[str, ChunkProfile]:
+    """Built-in profiles, overridden by CHUNK_TOKENS / CHUNK_OVERLAP_TOKENS for every
+    type and by CHUNK_PROFILES, e.g. '{"pdf": {"chunk_tokens": 256, "overlap_tokens": 32}}'
+    """
+    settings = {
+        # PDF text rarely keeps markdown; chapter numbers and capitalised titles survive extraction
+        "pdf": {"headings": f"{NUMBERED_HEADING}|{CAPS_HEADING}"},
+        "txt": {"headings": f"{MARKDOWN_HEADING}|{NUMBERED_HEADING}"},
+        "default": {"headings": None},
+    }
+    for setting in settings.values():
+        if os.getenv('CHUNK_TOKENS'):
+            setting["chunk_tokens"] = int(os.getenv('CHUNK_TOKENS'))
+        if os.getenv('CHUNK_OVERLAP_TOKENS'):
+            setting["overlap_tokens"] = int(os.getenv('CHUNK_OVERLAP_TOKENS'))
+    for file_type, overrides in json.loads(os.getenv('CHUNK_PROFILES') or "{}").items():
+        settings.setdefault(file_type.lower().lstrip("."), dict(settings["default"])).update(overrides)
+    return {file_type: ChunkProfile(**setting) for file_type, setting in settings.items()}
+
+
+def _sections(text: str, profile: ChunkProfile) -> List[Tuple[int, int, Optional[str]]]:
+    """Cut a page at its heading lines into (start, end, heading) spans"""
+    starts = []
+    if profile.headings is not None:
+        starts = [(match.start(), match.group(0).lstrip("#").strip()) for match in profile.headings.finditer(text)]
+    if not starts or starts[0][0] > 0:
+        starts.insert(0, (0, None))
+    sections = []
+    for (start, heading), (end, _) in zip(starts, starts[1:] + [(len(text), None)]):
+        # A heading with almost no text under it is folded into the next section
+        if sections and count_tokens(text[sections[-1][0]:start]) < profile.chunk_tokens // 8:
+            start, heading = sections[-1][0], sections[-1][2] or heading
+            sections.pop()
+        sections.append((start, end, heading))
+    return sections
+
+
+def _pieces(text: str, start: int, end: int, profile: ChunkProfile, level: int = 0) -> List[Tuple[int, int, int]]:
+    """Split a span into contiguous (start, end, tokens) pieces no longer than the chunk size,
+    trying coarser separators first. Whitespace stays at the start of the piece it
+    precedes (so piece token counts add up to the count of the joined text) and
+    punctuation stays with the sentence it ends.
+    """
+    tokens = count_tokens(text[start:end])
+    if tokens <= profile.chunk_tokens:
+        return [(start, end, tokens)]
+    if level >= len(profile.separators):
+        # No separator left (e.g. one enormous word): cut by length
+        step = max(1, (end - start) * profile.chunk_tokens // tokens)
+        return [piece for cut in range(start, end, step)
+                for piece in _pieces(text, cut, min(cut + step, end), profile, level)]
+    separator = profile.separators[level]
+    keep = len(separator.rstrip())
+    cuts = [start]
+    position = text.find(separator, start + 1, end)
+    while position != -1:
+        cuts.append(position + keep)
+        position = text.find(separator, position + len(separator), end)
+    cuts.append(end)
+    pieces = []
+    for piece_start, piece_end in zip(cuts, cuts[1:]):
+        if piece_end > piece_start:
+            pieces.extend(_pieces(text, piece_start, piece_end, profile, level + 1))
+    return pieces
+
+
+def _overlap(text: str, window: List[Tuple[int, int, int]], budget: int) -> List[Tuple[int, int, int]]:
+    """The tail of a finished chunk that the next one repeats: whole pieces from the end,
+    then the oldest of them trimmed at a word boundary, within `budget` tokens
+    """
+    tail, total = [], 0
+    for start, end, tokens in reversed(window):
+        if total + tokens <= budget:
+            tail.insert(0, (start, end, tokens))
+            total += tokens
+            continue
+        # The piece does not fit whole; its token count shrinks as the cut moves right
+        cuts = [start + match.start() for match in re.finditer(r"\s+", text[start:end]) if match.start()]
+        low, high = 0, len(cuts)
+        while low < high:
+            middle = (low + high) // 2
+            if count_tokens(text[cuts[middle]:end]) <= budget - total:
+                high = middle
+            else:
+                low = middle + 1
+        if low < len(cuts):
+            tail.insert(0, (cuts[low], end, count_tokens(text[cuts[low]:end])))
+        break
+    return tail
+
+
+def _merge(text: str, pieces: List[Tuple[int, int, int]], profile: ChunkProfile) -> List[Tuple[int, int, int]]:
+    """Pack consecutive pieces into (start, end, tokens) chunks, each repeating up to
+    `overlap_tokens` of the previous one
+    """
+    chunks, window, total = [], [], 0
+    for piece in pieces:
+        if window and total + piece[2] > profile.chunk_tokens:
+            chunks.append((window[0][0], window[-1][1], total))
+            # As much overlap as the next piece leaves room for
+            budget = min(profile.overlap_tokens, profile.chunk_tokens - piece[2])
+            window = _overlap(text, window, budget) if budget > 0 else []
+            total = sum(tokens for _, _, tokens in window)
+        window.append(piece)
+        total += piece[2]
+    if window:
+        chunks.append((window[0][0], window[-1][1], total))
+    return chunks
+
+
+def split_page(text: str, profile: ChunkProfile) -> List[Tuple[int, int, int, Optional[str]]]:
+    """Chunk one page into (start, end, tokens, section) spans of `text`, whitespace trimmed"""
+    spans = []
+    for section_start, section_end, heading in _sections(text, profile):
+        for start, end, tokens in _merge(text, _pieces(text, section_start, section_end, profile), profile):
+            chunk = text[start:end]
+            stripped = chunk.strip()
+            if not stripped:
+                continue
+            start += len(chunk) - len(chunk.lstrip())
+            spans.append((start, start + len(stripped), tokens, heading))
+    return spans
+
+
+def _profile_for(document: Document, profiles: Dict[str, ChunkProfile]) -> ChunkProfile:
+    file_type = document.metadata.get("file_type") or os.path.splitext(document.metadata.get("source", ""))[1][1:]
+    return profiles.get(file_type.lower(), profiles["default"])
+
+
+def split_pages(documents: List[Document], profiles: Dict[str, ChunkProfile]) -> List[Document]:
+    """Chunk a list of pages with the profile of each page's file type.
+
+    Module level (and free of engine state) so worker processes can run it.
+    """
+    from langchain.schema import Document
+
+    chunks = []
+    for document in documents:
+        text = document.page_content
+        for start, end, tokens, section in split_page(text, _profile_for(document, profiles)):
+            metadata = dict(document.metadata, start_index=start, end_index=end, tokens=tokens)
+            if section:
+                metadata["section"] = section
+            chunks.append(Document(page_content=text[start:end], metadata=metadata))
+    return chunks
+
+
+class ChunkStats:
+    """Throughput and chunk-size distribution of everything a ChunkingEngine split"""
+
+    def __init__(self):
+        self.documents = 0
+        self.characters = 0
+        self.chunks = 0
+        self.seconds = 0.0
+        self.sizes: Counter = Counter()
+
+    def add(self, documents: int, characters: int, chunks: List[Document], seconds: float):
+        self.documents += documents
+        self.characters += characters
+        self.chunks += len(chunks)
+        self.seconds += seconds
+        self.sizes.update(chunk.metadata["tokens"] for chunk in chunks)
+
+    def percentile(self, fraction: float) -> int:
+        """Chunk size in tokens at `fraction` of the distribution"""
+        rank, seen = fraction * (self.chunks - 1), 0
+        for size in sorted(self.sizes):
+            seen += self.sizes[size]
+            if seen > rank:
+                return size
+        return 0
+
+    def to_dict(self) -> Dict:
+        seconds = max(self.seconds, 1e-9)
+        return {
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "seconds": self.seconds,
+            "chunks_per_sec": self.chunks / seconds,
+            "mb_per_sec": self.characters / seconds / 1e6,
+            "tokens": {
+                "min": min(self.sizes) if self.sizes else 0,
+                "p50": self.percentile(0.5),
+                "p95": self.percentile(0.95),
+                "max": max(self.sizes) if self.sizes else 0,
+                "mean": sum(size * count for size, count in self.sizes.items()) / max(self.chunks, 1),
+            },
+        }
+
+    def summary(self) -> str:
+        stats = self.to_dict()
+        tokens = stats["tokens"]
+        return (f"chunking: {self.documents} pages -> {self.chunks} chunks in {self.seconds:.2f}s "
+                f"({stats['chunks_per_sec']:.0f} chunks/sec, {stats['mb_per_sec']:.2f} MB/sec); "
+                f"tokens per chunk min {tokens['min']}, p50 {tokens['p50']}, p95 {tokens['p95']}, "
+                f"max {tokens['max']}, mean {tokens['mean']:.1f}")
+
+
+class ChunkingEngine:
+    """Token-sized, heading- and page-aware splitter shared by every ingest path.
+
+    Pages never share a chunk, so `start_index`/`end_index` are offsets into the
+    page a chunk came from. Large batches of pages are split across `workers`
+    processes (CHUNK_WORKERS, default: CPU count); the result does not depend on it.
+    """
+
+    def __init__(self, profiles: Optional[Dict[str, ChunkProfile]] = None, workers: Optional[int] = None):
+        self.profiles = profiles or default_profiles()
+        self.workers = workers if workers is not None else int(os.getenv('CHUNK_WORKERS', '0')) or os.cpu_count() or 1
+        self.stats = ChunkStats()
+        self._lock = threading.Lock()
+
+    def split_documents(self, documents: List[Document], workers: Optional[int] = None) -> List[Document]:
+        """Chunk pages in order; drop-in for a LangChain text splitter"""
+        workers = self.workers if workers is None else workers
+        start = time.perf_counter()
+        characters = sum(len(document.page_content) for document in documents)
+        if workers > 1 and len(documents) > 1 and characters >= PARALLEL_MIN_CHARS:
+            size = -(-len(documents) // (workers * 4))
+            batches = [documents[i:i + size] for i in range(0, len(documents), size)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunks = [chunk for part in executor.map(split_pages, batches, [self.profiles] * len(batches))
+                          for chunk in part]
+        else:
+            chunks = split_pages(documents, self.profiles)
+        self.record(len(documents), characters, chunks, time.perf_counter() - start)
+        return chunks
+
+    def chunk_documents(self, documents: List[Document], namespace: str, seen: Optional[Dict[str, int]] = None,
+                        workers: Optional[int] = None) -> Tuple[List[Document], List[str]]:
+        """Split pages and give every chunk its stable content-derived ID"""
+        chunks = self.split_documents(documents, workers)
+        return chunks, assign_chunk_ids(chunks, namespace, seen)
+
+    def fingerprint(self, file_type: str) -> str:
+        """Fingerprint of the profile that chunks `file_type` files"""
+        return self.profiles.get(file_type.lower(), self.profiles["default"]).fingerprint()
+
+    def record(self, documents: int, characters: int, chunks: List[Document], seconds: float):
+        """Count chunks split elsewhere (e.g. in an ingest worker process) with these profiles"""
+        with self._lock:
+            self.stats.add(documents, characters, chunks, seconds)
+        instrumentation.observe("ingest.split", seconds)
+        instrumentation.incr("ingest.chunk_tokens", sum(chunk.metadata["tokens"] for chunk in chunks))
+
+    def report(self) -> Optional[str]:
+        with self._lock:
+            return self.stats.summary() if self.stats.documents else None
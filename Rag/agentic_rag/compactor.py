@@ -0,0 +1,163 @@
+import os
+import queue
+import threading
+from typing import Dict, Optional
+from file_manager import FileManager
+from runtime import RAGRuntime
+from instrumentation import instrumentation
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # removed while walking
+    return total
+
+
+class Compactor:
+    """Background worker that purges tombstoned files from the vector store.
+
+    Chunks are removed in batches of `batch_size` so a single large file
+    never holds the store for long, and the file's metadata row is dropped
+    only after its last chunk is gone. When the queue drains the store is
+    asked to reclaim the freed space and the shrinkage is reported as bytes
+    freed. Chroma only vacuums on its next open, so until then the space is
+    reported as pending and the vacuum's result is added once it runs.
+    Tombstones left by an interrupted run are picked up again by start().
+    """
+
+    def __init__(self, runtime: RAGRuntime, file_manager: FileManager, batch_size: int = 512):
+        self.runtime = runtime
+        self.file_manager = file_manager
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._cycle_start_size: Optional[int] = None
+        self.progress: Dict[str, Dict] = {}
+        self.files_compacted = 0
+        self.chunks_removed = 0
+        self.bytes_freed = 0
+        self.reclaim_pending = False
+        self.last_error = ""
+
+    def start(self):
+        """Start the worker and queue any tombstones left from an earlier run"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rag-compactor", daemon=True)
+                self._thread.start()
+        for file_id, info in self.file_manager.get_tombstoned_files().items():
+            self.submit(file_id, info)
+
+    def submit(self, file_id: str, info: Optional[Dict] = None):
+        """Queue a tombstoned file for compaction"""
+        info = info or {}
+        with self._lock:
+            if file_id in self._pending:
+                return
+            self._pending.add(file_id)
+            self.progress[file_id] = {"filename": info.get("filename", file_id),
+                                      "total": info.get("chunk_count"), "removed": 0}
+        self._queue.put(file_id)
+
+    def wait(self):
+        """Block until every queued file is compacted"""
+        self._queue.join()
+
+    def report(self) -> str:
+        self._collect_reclaimed()
+        with self._lock:
+            lines = []
+            for progress in self.progress.values():
+                total = progress["total"]
+                done = f"{progress['removed']}/{total}" if total else str(progress["removed"])
+                lines.append(f"  {progress['filename']}: {done} chunks removed")
+            summary = (f"Compaction: {self.files_compacted} files, {self.chunks_removed} chunks removed, "
+                       f"{self.bytes_freed / (1024 * 1024):.1f} MB freed")
+            if self.reclaim_pending:
+                summary += " (more pending until the store is next opened)"
+            if lines:
+                summary += f"; {len(lines)} pending:\n" + "\n".join(lines)
+            if self.last_error:
+                summary += f"\nLast compaction error: {self.last_error}"
+            return summary
+
+    def _run(self):
+        while True:
+            file_id = self._queue.get()
+            try:
+                if self._cycle_start_size is None:
+                    self._cycle_start_size = self._store_size()
+                with instrumentation.span("compact.file"):
+                    self._compact(file_id)
+            except Exception as e:
+                # Leave the tombstone in place so the next start() retries it
+                instrumentation.record_error("compact", e)
+                self.last_error = f"{file_id}: {e}"
+            finally:
+                with self._lock:
+                    self._pending.discard(file_id)
+                    self.progress.pop(file_id, None)
+                self._queue.task_done()
+            if self._queue.unfinished_tasks == 0:
+                self._reclaim()
+
+    def _compact(self, file_id: str):
+        if self.runtime.has_store():
+            store = self.runtime.store
+            previous = None
+            while True:
+                with instrumentation.span("compact.batch"):
+                    ids = store.ids(where={"file_id": file_id}, limit=self.batch_size)
+                    if not ids:
+                        break
+                    if set(ids) == previous:
+                        # Keeps the tombstone so the next start() retries the file
+                        raise RuntimeError(f"deleting {len(ids)} chunks made no progress")
+                    store.delete(ids)
+                    previous = set(ids)
+                instrumentation.incr("compact.chunks", len(ids))
+                with self._lock:
+                    self.progress[file_id]["removed"] += len(ids)
+                    self.chunks_removed += len(ids)
+        self.file_manager.delete_file(file_id)
+        with self._lock:
+            self.files_compacted += 1
+
+    def _store_size(self) -> int:
+        return dir_size(self.runtime.chroma_path) if os.path.isdir(self.runtime.chroma_path) else 0
+
+    def _reclaim(self):
+        """Hand freed space back through the store and count the bytes it gave back"""
+        deferred = False
+        if self.runtime.has_store():
+            try:
+                deferred = self.runtime.store.reclaim(self._cycle_start_size)
+            except Exception as e:
+                instrumentation.record_error("compact.reclaim", e)
+                self.last_error = f"reclaim: {e}"
+        if deferred:
+            # Counted by _collect_reclaimed() once the store has been reopened
+            with self._lock:
+                self.reclaim_pending = True
+        elif self._cycle_start_size is not None:
+            freed = max(0, self._cycle_start_size - self._store_size())
+            with self._lock:
+                self.bytes_freed += freed
+            instrumentation.incr("compact.bytes_freed", freed)
+        self._cycle_start_size = None
+
+    def _collect_reclaimed(self):
+        """Add the space a deferred reclaim gave back when the store was reopened"""
+        store = self.runtime.open_store()
+        freed = store.reclaimed() if store is not None else None
+        if freed is not None:
+            with self._lock:
+                self.bytes_freed += freed
+                self.reclaim_pending = False
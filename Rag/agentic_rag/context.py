@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import re
+import threading
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+DEFAULT_CONTEXT_TOKENS = 1500
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """Load the tiktoken encoding once; None if tiktoken is unavailable"""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    # No tiktoken or no cached encoding offline: fall back to an estimate
+                    _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def merge_adjacent(results: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+    """Merge chunks of the same page whose start_index ranges overlap or touch.
+
+    The merged chunk keeps the best score of its parts, so overlapping
+    chunk_overlap text is sent once instead of twice.
+    """
+    from langchain.schema import Document
+
+    groups = {}
+    loose = []
+    for doc, score in results:
+        start = doc.metadata.get("start_index")
+        if start is None:
+            loose.append((doc, score))
+            continue
+        key = (doc.metadata.get("file_id"), doc.metadata.get("source"), doc.metadata.get("page"))
+        groups.setdefault(key, []).append((doc, score))
+
+    def end_of(doc: Document) -> int:
+        return doc.metadata.get("end_index", doc.metadata["start_index"] + len(doc.page_content))
+
+    def combined(doc: Document, text: str, end: int) -> Document:
+        metadata = dict(doc.metadata)
+        # The span now runs to the end of the last merged chunk
+        if "end_index" in metadata:
+            metadata["end_index"] = end
+        if "tokens" in metadata:
+            metadata["tokens"] = count_tokens(text)
+        return Document(page_content=text, metadata=metadata)
+
+    merged = []
+    for items in groups.values():
+        items.sort(key=lambda item: item[0].metadata["start_index"])
+        current_doc, current_score = items[0]
+        current_text = current_doc.page_content
+        current_end = end_of(current_doc)
+        for doc, score in items[1:]:
+            start = doc.metadata["start_index"]
+            overlap = current_end - start
+            text = doc.page_content
+            if 0 < overlap <= len(text) and current_text.endswith(text[:overlap]):
+                current_text += text[overlap:]
+            elif -2 <= overlap <= 0:
+                current_text += " " + text
+            elif overlap > len(text):
+                pass  # fully contained in the current chunk
+            else:
+                merged.append((combined(current_doc, current_text, current_end), current_score))
+                current_doc, current_score, current_text, current_end = doc, score, text, end_of(doc)
+                continue
+            current_end = max(current_end, end_of(doc))
+            current_score = max(current_score, score)
+        merged.append((combined(current_doc, current_text, current_end), current_score))
+    return merged + loose
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def drop_near_duplicates(results: List[Tuple[Document, float]], threshold: float = 0.8) -> List[Tuple[Document, float]]:
+    """Keep the best-scored of any chunks whose word 3-gram Jaccard similarity exceeds `threshold`"""
+    kept, kept_shingles = [], []
+    for doc, score in sorted(results, key=lambda item: item[1], reverse=True):
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) / max(len(shingles | other), 1) > threshold for other in kept_shingles):
+            continue
+        kept.append((doc, score))
+        kept_shingles.append(shingles)
+    return kept
+
+
+def assemble_context(results: List[Tuple[Document, float]], max_tokens: Optional[int] = DEFAULT_CONTEXT_TOKENS,
+                     separator: str = CONTEXT_SEPARATOR) -> Tuple[str, List[Tuple[Document, float]], int]:
+    """Build the prompt context: merge adjacent chunks, drop near-duplicates and
+    pack the best-scored chunks into `max_tokens`.
+
+    Returns (context_text, chunks_used, context_tokens).
+    """
+    candidates = drop_near_duplicates(merge_adjacent(results))
+    if max_tokens is None:
+        texts = [doc.page_content for doc, _ in candidates]
+        context_text = separator.join(texts)
+        return context_text, candidates, count_tokens(context_text)
+
+    separator_tokens = count_tokens(separator)
+    used, texts, total = [], [], 0
+    for doc, score in candidates:
+        tokens = count_tokens(doc.page_content)
+        cost = tokens + (separator_tokens if texts else 0)
+        if total + cost <= max_tokens:
+            used.append((doc, score))
+            texts.append(doc.page_content)
+            total += cost
+        elif not texts:
+            # Even the best chunk is too long: keep its head rather than nothing
+            text = truncate_to_tokens(doc.page_content, max_tokens)
+            used.append((doc, score))
+            texts.append(text)
+            total = count_tokens(text)
+    return separator.join(texts), used, total
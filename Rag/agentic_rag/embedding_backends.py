@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from langchain_core.embeddings import Embeddings
+
+BACKENDS = ("torch", "int8", "onnx")
+
+
+class EmbeddingSettings:
+    """Which runtime computes embeddings and how many CPU threads and texts per batch it uses.
+
+    Read from EMBEDDING_BACKEND (torch | int8 | onnx), EMBEDDING_THREADS,
+    EMBEDDING_BATCH_SIZE and EMBEDDING_ONNX_FILE when not given explicitly.
+    """
+
+    def __init__(self, backend: Optional[str] = None, threads: Optional[int] = None,
+                 batch_size: Optional[int] = None, onnx_file: Optional[str] = None):
+        self.backend = (backend or os.getenv('EMBEDDING_BACKEND') or "torch").lower()
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {self.backend} (expected one of {', '.join(BACKENDS)})")
+        self.threads = threads or int(os.getenv('EMBEDDING_THREADS', '0')) or None
+        self.batch_size = batch_size or int(os.getenv('EMBEDDING_BATCH_SIZE', '32'))
+        # e.g. "onnx/model_qint8_avx2.onnx" for the int8-quantized ONNX export on the Hub
+        self.onnx_file = onnx_file or os.getenv('EMBEDDING_ONNX_FILE') or None
+
+    @property
+    def cache_key(self) -> str:
+        """Suffix that keeps cached vectors of different backends apart"""
+        if self.backend == "torch":
+            return ""  # the original float32 cache
+        if self.backend == "onnx" and self.onnx_file:
+            return f"onnx-{os.path.splitext(os.path.basename(self.onnx_file))[0]}"
+        return self.backend
+
+
+def create_embeddings(model_name: str, settings: Optional[EmbeddingSettings] = None) -> Embeddings:
+    """Build the embedding model for the configured backend.
+
+    - torch: the float32 sentence-transformers model (default)
+    - int8: the same model with its Linear layers dynamically quantized to int8
+    - onnx: the model run through ONNX Runtime (needs `sentence-transformers[onnx]`)
+    """
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    settings = settings or EmbeddingSettings()
+    encode_kwargs = {"batch_size": settings.batch_size}
+
+    if settings.backend == "onnx":
+        import onnxruntime
+
+        session_options = onnxruntime.SessionOptions()
+        if settings.threads:
+            session_options.intra_op_num_threads = settings.threads
+        inner_kwargs = {"session_options": session_options, "provider": "CPUExecutionProvider"}
+        if settings.onnx_file:
+            inner_kwargs["file_name"] = settings.onnx_file
+        return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs=encode_kwargs,
+                                     model_kwargs={"device": "cpu", "backend": "onnx", "model_kwargs": inner_kwargs})
+
+    import torch
+
+    if settings.threads:
+        torch.set_num_threads(settings.threads)
+    device = "cpu" if settings.backend == "int8" else None
+    embeddings = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs=encode_kwargs,
+                                       model_kwargs={"device": device} if device else {})
+    if settings.backend == "int8":
+        # Dynamic quantization only supports CPU; activations stay float32
+        model = getattr(embeddings, "_client", None) or embeddings.client
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return embeddings
@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DIGEST_SIZE = 32
+
+
+def text_digest(text: str) -> bytes:
+    """SHA-256 of a chunk text, used as the cache key"""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """Exclusive lock on `path` across processes (flock, or msvcrt on Windows)"""
+    with open(path, 'a+b') as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """Persistent chunk-embedding cache for one model.
+
+    Vectors live in a memory-mapped float32 matrix that doubles in size when
+    full; an append-only file of 32-byte SHA-256 digests maps rows to texts
+    and is loaded into a dict at open. A vector row is flushed before its
+    digest is appended, so a crash never leaves a key without its vector.
+    Processes sharing the directory (chat and server) append under a file
+    lock and first pick up the rows the others added.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, initial_capacity: int = 1024):
+        os.makedirs(cache_dir, exist_ok=True)
+        base = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name))
+        self.vectors_path = base + ".f32"
+        self.keys_path = base + ".keys"
+        self.meta_path = base + ".json"
+        self.lock_path = base + ".lock"
+        self.initial_capacity = initial_capacity
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        # Rows of the keys file read so far
+        self._rows = 0
+        self._vectors: Optional[np.memmap] = None
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        with self._lock, file_lock(self.lock_path):
+            self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def lookup(self, digests: List[bytes]) -> List[Optional[np.ndarray]]:
+        """Return cached vectors (or None) for a batch of digests"""
+        with self._lock:
+            rows = [self._index.get(digest) for digest in digests]
+            return [np.array(self._vectors[row]) if row is not None else None for row in rows]
+
+    def add(self, digests: List[bytes], vectors: List[List[float]]):
+        """Store vectors for digests that are not cached yet"""
+        with self._lock, file_lock(self.lock_path):
+            self._refresh()
+            fresh = {digest: vector for digest, vector in zip(digests, vectors) if digest not in self._index}
+            if not fresh:
+                return
+            if self.dim is None:
+                self.dim = len(next(iter(fresh.values())))
+            start = self._rows
+            self._reserve(start + len(fresh))
+            self._vectors[start:start + len(fresh)] = np.asarray(list(fresh.values()), dtype=np.float32)
+            self._vectors.flush()
+            with open(self.keys_path, 'ab') as f:
+                f.write(b"".join(fresh))
+            for offset, digest in enumerate(fresh):
+                self._index[digest] = start + offset
+            self._rows = start + len(fresh)
+
+    def _refresh(self):
+        """Read rows appended since the last call (by any process); needs the file lock"""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, 'r') as f:
+            meta = json.load(f)
+        if self._vectors is None or meta["capacity"] != self.capacity:
+            # First open, or another process grew the matrix
+            self.dim, self.capacity = meta["dim"], meta["capacity"]
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+',
+                                      shape=(self.capacity, self.dim))
+        if not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, 'r+b') as f:
+            f.seek(self._rows * DIGEST_SIZE)
+            data = f.read()
+            count = min(len(data) // DIGEST_SIZE, self.capacity - self._rows)
+            if len(data) > count * DIGEST_SIZE:
+                # A torn trailing digest from an interrupted append: cut it off so the
+                # next append starts on a row boundary. Vector rows past the last
+                # digest are free capacity that the next add overwrites.
+                f.truncate((self._rows + count) * DIGEST_SIZE)
+        for row in range(count):
+            self._index.setdefault(data[row * DIGEST_SIZE:(row + 1) * DIGEST_SIZE], self._rows + row)
+        self._rows += count
+
+    def _reserve(self, rows: int):
+        if rows <= self.capacity:
+            return
+        capacity = max(self.capacity, self.initial_capacity)
+        while capacity < rows:
+            capacity *= 2
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        # Growing the file keeps existing rows in place; the new tail reads as zeros
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(capacity * self.dim * 4)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        self.capacity = capacity
+        with open(self.meta_path + ".tmp", 'w') as f:
+            json.dump({"dim": self.dim, "capacity": capacity}, f)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying model"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def counters(self) -> Tuple[int, int]:
+        """Return cumulative (hits, misses) for computing per-ingest deltas"""
+        with self._lock:
+            return self.hits, self.misses
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests = [text_digest(text) for text in texts]
+        cached = self.cache.lookup(digests)
+
+        # Embed each distinct missing text once, even if it repeats in the batch
+        missing: Dict[bytes, str] = {}
+        for digest, text, vector in zip(digests, texts, cached):
+            if vector is None:
+                missing.setdefault(digest, text)
+        if missing:
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.add(list(missing.keys()), computed)
+            fresh = dict(zip(missing.keys(), computed))
+        else:
+            fresh = {}
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [vector.tolist() if vector is not None else list(fresh[digest])
+                for digest, vector in zip(digests, cached)]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries in one forward pass, bypassing the chunk cache"""
+        return self.embeddings.embed_documents(texts)
@@ -1,13 +1,125 @@
 import os
 import uuid
 import json
-from typing import Dict, Any, Optional
+import socket
+import sqlite3
+import tempfile
+import threading
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from datetime import datetime
 
-class FileManager:
-    """Manages file metadata and unique identifiers"""
-    def __init__(self, metadata_path: str = "file_metadata.json"):
+CORE_FIELDS = ("file_path", "file_type", "filename", "created_at", "status")
+# Status of a deleted file whose chunks are still waiting for the compactor
+TOMBSTONE = "deleted"
+# Ingest job states; "registered" means no load has finished yet
+REGISTERED, QUEUED, PARSING, EMBEDDING, INDEXED, FAILED = (
+    "registered", "queued", "parsing", "embedding", "indexed", "failed"
+)
+# Loads that were still running when the process stopped
+UNFINISHED = (REGISTERED, QUEUED, PARSING, EMBEDDING)
+
+
+def is_indexed(info: Optional[Dict[str, Any]]) -> bool:
+    """Whether a file's chunks are fully loaded ("processed" is the pre-job-queue spelling)"""
+    return bool(info) and info.get("status") in (INDEXED, "processed")
+
+
+def process_owner() -> str:
+    """Owner tag (host:pid) that this process writes on the loads it claims"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows
+        import ctypes
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() == 5  # access denied: running as another user
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _owner_alive(owner: str) -> bool:
+    """Whether the process that claimed a load still runs; other hosts are assumed alive"""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    return _pid_alive(int(pid))
+
+
+def _claimable(info: Dict[str, Any], owner: str) -> bool:
+    """A live file that nobody, this owner, or a dead process holds"""
+    held_by = info.get("ingest_owner")
+    return info.get("status") != TOMBSTONE and (not held_by or held_by == owner or not _owner_alive(held_by))
+
+
+class MetadataStore:
+    """Interface for file metadata backends"""
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def insert(self, file_id: str, info: Dict[str, Any]):
+        raise NotImplementedError
+
+    def insert_many(self, items: List[tuple]):
+        """Insert (file_id, info) pairs in one write"""
+        for file_id, info in items:
+            self.insert(file_id, info)
+
+    def modify(self, file_id: str, change: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> bool:
+        """Atomically replace a file's info with change(info); None from change leaves it alone.
+        Returns whether the file was written."""
+        raise NotImplementedError
+
+    def update(self, file_id: str, fields: Dict[str, Any]):
+        self.modify(file_id, lambda info: dict(info, **fields))
+
+    def delete(self, file_id: str):
+        raise NotImplementedError
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        """All live (not tombstoned) files in registration order"""
+        raise NotImplementedError
+
+    def tombstoned(self) -> Dict[str, Dict[str, Any]]:
+        """Deleted files that still await compaction"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def id_by_number(self, number: int) -> Optional[str]:
+        """File ID at a 1-based position in registration order"""
+        raise NotImplementedError
+
+    def id_by_path(self, file_path: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def ids_by_filename(self, filename: str) -> List[str]:
+        raise NotImplementedError
+
+    def close(self):
+        """Release open handles; the store reopens them if used again"""
+
+
+class JSONMetadataStore(MetadataStore):
+    """Original single-file JSON backend, now with atomic writes"""
+
+    def __init__(self, metadata_path: str):
         self.metadata_path = metadata_path
+        self._lock = threading.Lock()
         self.metadata = self._load_metadata()
 
     def _load_metadata(self) -> Dict[str, Any]:
@@ -19,32 +131,378 @@ class FileManager:
 
     def _save_metadata(self):
         """Save metadata to file"""
-        with open(self.metadata_path, 'w') as f:
-            json.dump(self.metadata, f, indent=2)
+        # A unique temp file in the same directory, so os.replace stays atomic and
+        # two processes saving at once never write into the same temp file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.metadata_path)),
+                                        prefix=os.path.basename(self.metadata_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.metadata, f, indent=2)
+            os.replace(tmp_path, self.metadata_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
 
-    def register_file(self, file_path: str, file_type: str) -> str:
-        """Register a new file and return unique ID"""
-        file_id = str(uuid.uuid4())[:8]
-        self.metadata[file_id] = {
+    def _snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Copy of the metadata taken under the lock, safe to iterate while others write"""
+        with self._lock:
+            return dict(self.metadata)
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.metadata.get(file_id)
+
+    def insert(self, file_id: str, info: Dict[str, Any]):
+        with self._lock:
+            self.metadata[file_id] = info
+            self._save_metadata()
+
+    def insert_many(self, items: List[tuple]):
+        with self._lock:
+            self.metadata.update(items)
+            self._save_metadata()
+
+    def modify(self, file_id: str, change: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> bool:
+        with self._lock:
+            if file_id not in self.metadata:
+                return False
+            info = change(dict(self.metadata[file_id]))
+            if info is None:
+                return False
+            self.metadata[file_id] = info
+            self._save_metadata()
+            return True
+
+    def delete(self, file_id: str):
+        with self._lock:
+            if self.metadata.pop(file_id, None) is not None:
+                self._save_metadata()
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        return {file_id: info for file_id, info in self._snapshot().items() if info.get("status") != TOMBSTONE}
+
+    def tombstoned(self) -> Dict[str, Dict[str, Any]]:
+        return {file_id: info for file_id, info in self._snapshot().items() if info.get("status") == TOMBSTONE}
+
+    def count(self) -> int:
+        return len(self.all())
+
+    def id_by_number(self, number: int) -> Optional[str]:
+        live = list(self.all())
+        if 1 <= number <= len(live):
+            return live[number - 1]
+        return None
+
+    def id_by_path(self, file_path: str) -> Optional[str]:
+        target = os.path.abspath(file_path)
+        for file_id, info in self.all().items():
+            if os.path.abspath(info["file_path"]) == target:
+                return file_id
+        return None
+
+    def ids_by_filename(self, filename: str) -> List[str]:
+        return [file_id for file_id, info in self.all().items() if info["filename"] == filename]
+
+
+class SQLiteMetadataStore(MetadataStore):
+    """SQLite backend with indexed lookups and transactional writes.
+
+    WAL mode lets readers in other processes proceed during a write, and the
+    busy timeout makes concurrent writers wait instead of failing. Fields
+    beyond the core columns are kept in a JSON `extra` column.
+    """
+
+    def __init__(self, db_path: str, migrate_from: Optional[str] = None):
+        self.db_path = db_path
+        self._local = threading.local()
+        # Every thread's connection, so close() can reach them all
+        self._connections: List[Tuple[threading.Thread, sqlite3.Connection]] = []
+        self._connections_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "id TEXT NOT NULL UNIQUE, "
+                "file_path TEXT NOT NULL, "
+                "abs_path TEXT NOT NULL, "
+                "file_type TEXT, "
+                "filename TEXT NOT NULL, "
+                "created_at TEXT, "
+                "status TEXT, "
+                "extra TEXT NOT NULL DEFAULT '{}')"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_filename ON files (filename)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_abs_path ON files (abs_path)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_status ON files (status)")
+        if migrate_from and os.path.exists(migrate_from):
+            self._migrate_json(migrate_from)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads; each thread gets its own.
+        # check_same_thread is off only so close() can close them from any thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                # Connections of finished threads (e.g. past ingest workers) are closed here
+                for thread, other in self._connections:
+                    if not thread.is_alive():
+                        other.close()
+                self._connections = [(thread, other) for thread, other in self._connections if thread.is_alive()]
+                self._connections.append((threading.current_thread(), conn))
+        return conn
+
+    def close(self):
+        with self._connections_lock:
+            for _, conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._local = threading.local()
+
+    def _migrate_json(self, json_path: str):
+        """Import the legacy JSON file once, then rename it out of the way"""
+        with open(json_path, 'r') as f:
+            legacy = json.load(f)
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO files (id, file_path, abs_path, file_type, filename, created_at, status, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._to_row(file_id, info) for file_id, info in legacy.items()]
+            )
+        os.replace(json_path, json_path + ".migrated")
+
+    @staticmethod
+    def _to_row(file_id: str, info: Dict[str, Any]) -> tuple:
+        extra = {key: value for key, value in info.items() if key not in CORE_FIELDS}
+        return (file_id, info["file_path"], os.path.abspath(info["file_path"]), info.get("file_type"),
+                info["filename"], info.get("created_at"), info.get("status"), json.dumps(extra))
+
+    @staticmethod
+    def _from_row(row: tuple) -> Dict[str, Any]:
+        file_path, file_type, filename, created_at, status, extra = row
+        info = {
+            "file_path": file_path,
+            "file_type": file_type,
+            "filename": filename,
+            "created_at": created_at,
+            "status": status,
+        }
+        info.update(json.loads(extra))
+        return info
+
+    _COLUMNS = "file_path, file_type, filename, created_at, status, extra"
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(f"SELECT {self._COLUMNS} FROM files WHERE id = ?", (file_id,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def insert(self, file_id: str, info: Dict[str, Any]):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO files (id, file_path, abs_path, file_type, filename, created_at, status, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._to_row(file_id, info)
+            )
+
+    def insert_many(self, items: List[tuple]):
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO files (id, file_path, abs_path, file_type, filename, created_at, status, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [self._to_row(file_id, info) for file_id, info in items]
+            )
+
+    def modify(self, file_id: str, change: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> bool:
+        conn = self._conn()
+        # BEGIN IMMEDIATE takes the write lock up front, so no other process can write
+        # (e.g. tombstone the file) between the read and the update
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT {self._COLUMNS} FROM files WHERE id = ?", (file_id,)).fetchone()
+            info = change(self._from_row(row)) if row else None
+            if info is not None:
+                _, file_path, abs_path, file_type, filename, created_at, status, extra = self._to_row(file_id, info)
+                conn.execute(
+                    "UPDATE files SET file_path = ?, abs_path = ?, file_type = ?, filename = ?, "
+                    "created_at = ?, status = ?, extra = ? WHERE id = ?",
+                    (file_path, abs_path, file_type, filename, created_at, status, extra, file_id)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return info is not None
+
+    def delete(self, file_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    # `IS NOT` also keeps rows whose status is NULL
+    _LIVE = f"status IS NOT '{TOMBSTONE}'"
+
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        rows = self._conn().execute(
+            f"SELECT id, {self._COLUMNS} FROM files WHERE {self._LIVE} ORDER BY seq"
+        ).fetchall()
+        return {row[0]: self._from_row(row[1:]) for row in rows}
+
+    def tombstoned(self) -> Dict[str, Dict[str, Any]]:
+        rows = self._conn().execute(
+            f"SELECT id, {self._COLUMNS} FROM files WHERE status = ? ORDER BY seq", (TOMBSTONE,)
+        ).fetchall()
+        return {row[0]: self._from_row(row[1:]) for row in rows}
+
+    def count(self) -> int:
+        return self._conn().execute(f"SELECT COUNT(*) FROM files WHERE {self._LIVE}").fetchone()[0]
+
+    def id_by_number(self, number: int) -> Optional[str]:
+        if number < 1:
+            return None
+        row = self._conn().execute(
+            f"SELECT id FROM files WHERE {self._LIVE} ORDER BY seq LIMIT 1 OFFSET ?", (number - 1,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def id_by_path(self, file_path: str) -> Optional[str]:
+        row = self._conn().execute(
+            f"SELECT id FROM files WHERE abs_path = ? AND {self._LIVE} ORDER BY seq LIMIT 1",
+            (os.path.abspath(file_path),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def ids_by_filename(self, filename: str) -> List[str]:
+        rows = self._conn().execute(
+            f"SELECT id FROM files WHERE filename = ? AND {self._LIVE} ORDER BY seq", (filename,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+
+def create_metadata_store(metadata_path: str, backend: Optional[str] = None) -> MetadataStore:
+    """Build the configured backend; SQLite unless METADATA_BACKEND=json"""
+    backend = (backend or os.getenv('METADATA_BACKEND') or "sqlite").lower()
+    if backend == "json":
+        return JSONMetadataStore(metadata_path)
+    if backend == "sqlite":
+        db_path = os.path.splitext(metadata_path)[0] + ".sqlite3"
+        return SQLiteMetadataStore(db_path, migrate_from=metadata_path)
+    raise ValueError(f"Unknown metadata backend: {backend}")
+
+
+class FileManager:
+    """Manages file metadata and unique identifiers"""
+    def __init__(self, metadata_path: str = "file_metadata.json", store: Optional[MetadataStore] = None):
+        self.metadata_path = metadata_path
+        self.store = store or create_metadata_store(metadata_path)
+
+    @staticmethod
+    def _new_entry(file_path: str, file_type: str) -> Dict[str, Any]:
+        return {
             "file_path": file_path,
             "file_type": file_type,
             "filename": os.path.basename(file_path),
             "created_at": datetime.now().isoformat(),
-            "status": "registered"
+            "status": REGISTERED
         }
-        self._save_metadata()
+
+    def _new_file_id(self, taken: Optional[set] = None) -> str:
+        """Generate a short ID; 8 hex chars collide often enough at scale to check"""
+        while True:
+            file_id = str(uuid.uuid4())[:8]
+            if (taken is None or file_id not in taken) and self.store.get(file_id) is None:
+                return file_id
+
+    def register_file(self, file_path: str, file_type: str) -> str:
+        """Register a new file and return unique ID"""
+        file_id = self._new_file_id()
+        self.store.insert(file_id, self._new_entry(file_path, file_type))
         return file_id
 
+    def register_files(self, files: List[tuple]) -> List[str]:
+        """Register many (file_path, file_type) pairs in a single write"""
+        taken = set()
+        items = []
+        for file_path, file_type in files:
+            file_id = self._new_file_id(taken)
+            taken.add(file_id)
+            items.append((file_id, self._new_entry(file_path, file_type)))
+        self.store.insert_many(items)
+        return [file_id for file_id, _ in items]
+
     def get_file_info(self, file_id: str) -> Optional[Dict[str, Any]]:
-        """Get file information by ID"""
-        return self.metadata.get(file_id)
+        """Get file information by ID; tombstoned files are treated as gone"""
+        info = self.store.get(file_id)
+        if info is None or info.get("status") == TOMBSTONE:
+            return None
+        return info
+
+    def get_file_id_by_number(self, number: str) -> Optional[str]:
+        """Get file ID by number (1-based index)"""
+        try:
+            return self.store.id_by_number(int(number))
+        except ValueError:
+            return None
+
+    def find_file_by_path(self, file_path: str) -> Optional[str]:
+        """Return the ID of a file previously registered from the same path"""
+        return self.store.id_by_path(file_path)
+
+    def find_files_by_name(self, filename: str) -> List[str]:
+        """Return the IDs of all files registered under a filename"""
+        return self.store.ids_by_filename(filename)
+
+    def update_file_info(self, file_id: str, **fields):
+        """Update arbitrary metadata fields of a file"""
+        self.store.update(file_id, fields)
+
+    def update_live_file(self, file_id: str, **fields) -> bool:
+        """Update a file unless it was deleted meanwhile; returns whether it was written"""
+        return self.store.modify(file_id, lambda info: dict(info, **fields) if info.get("status") != TOMBSTONE else None)
+
+    def claim_file(self, file_id: str, **fields) -> bool:
+        """Take a live file's load for this process and update it, in one transaction.
+
+        Fails while another running process holds the load; a claim left by a
+        process that died is taken over. release_file gives it back.
+        """
+        owner = process_owner()
+        return self.store.modify(
+            file_id, lambda info: dict(info, ingest_owner=owner, **fields) if _claimable(info, owner) else None
+        )
+
+    def release_file(self, file_id: str, **fields) -> bool:
+        """Record the end of a claimed load unless the file was deleted meanwhile"""
+        return self.update_live_file(file_id, ingest_owner="", **fields)
 
     def update_file_status(self, file_id: str, status: str):
         """Update file processing status"""
-        if file_id in self.metadata:
-            self.metadata[file_id]["status"] = status
-            self._save_metadata()
+        self.store.update(file_id, {"status": status})
+
+    def tombstone_file(self, file_id: str, **fields):
+        """Mark a file deleted; it disappears from lookups until the compactor purges it"""
+        self.store.update(file_id, dict(fields, status=TOMBSTONE, deleted_at=datetime.now().isoformat()))
+
+    def delete_file(self, file_id: str):
+        """Remove a file's metadata"""
+        self.store.delete(file_id)
+
+    def count_files(self) -> int:
+        """Number of registered files"""
+        return self.store.count()
 
     def get_all_files(self) -> Dict[str, Any]:
         """Get all registered files"""
-        return self.metadata
\ No newline at end of file
+        return self.store.all()
+
+    def get_tombstoned_files(self) -> Dict[str, Any]:
+        """Deleted files whose chunks have not been compacted yet"""
+        return self.store.tombstoned()
+
+    def close(self):
+        """Close the metadata store's connections"""
+        self.store.close()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+    from vector_store import VectorStore
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_sha256(file_path: str) -> str:
+    """Hash file contents without reading the whole file into memory"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(text: str) -> str:
+    """Hash the text of a single chunk"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def assign_chunk_ids(chunks: List[Document], namespace: str, seen: Optional[Dict[str, int]] = None) -> List[str]:
+    """Give every chunk a deterministic ID derived from its namespace and content.
+
+    Identical chunks inside one namespace are told apart by their occurrence
+    index, so re-chunking unchanged text always yields the same IDs. Pass the
+    same `seen` dict to number chunks of one file that arrive in pieces.
+    """
+    seen = {} if seen is None else seen
+    ids = []
+    for chunk in chunks:
+        chunk_hash = chunk_sha256(chunk.page_content)
+        occurrence = seen.get(chunk_hash, 0)
+        seen[chunk_hash] = occurrence + 1
+        chunk_id = f"{namespace}:{chunk_hash[:16]}:{occurrence}"
+        chunk.metadata["chunk_hash"] = chunk_hash
+        chunk.metadata["chunk_id"] = chunk_id
+        ids.append(chunk_id)
+    return ids
+
+
+def diff_chunks(existing: Set[str], chunks: List[Document], ids: List[str]):
+    """Split chunks into new and kept ones and list stored IDs that went stale.
+
+    Returns (new_chunks, new_ids, kept_ids, kept_metadatas, stale_ids).
+    """
+    stale = list(existing - set(ids))
+    new_chunks, new_ids = [], []
+    kept_ids, kept_metadatas = [], []
+    for chunk, chunk_id in zip(chunks, ids):
+        if chunk_id in existing:
+            kept_ids.append(chunk_id)
+            kept_metadatas.append(chunk.metadata)
+        else:
+            new_chunks.append(chunk)
+            new_ids.append(chunk_id)
+    return new_chunks, new_ids, kept_ids, kept_metadatas, stale
+
+
+def sync_chunks(store: VectorStore, where: Dict[str, Any], chunks: List[Document],
+                ids: List[str]) -> Tuple[int, int, int]:
+    """Bring the chunks matching `where` in line with `chunks`.
+
+    Only chunks whose IDs are not stored yet get embedded. Stored chunks that
+    no longer exist are deleted by ID, and unchanged chunks only have their
+    metadata refreshed (offsets and page numbers may have moved). Stale
+    chunks go last, so if embedding fails the old version is still searchable.
+    Returns (added, removed, unchanged) counts.
+    """
+    existing = set(store.ids(where=where))
+    new_chunks, new_ids, kept_ids, kept_metadatas, stale = diff_chunks(existing, chunks, ids)
+
+    store.add(new_ids, new_chunks)
+    store.update_metadata(kept_ids, kept_metadatas)
+    store.delete(stale)
+
+    return len(new_chunks), len(stale), len(kept_ids)
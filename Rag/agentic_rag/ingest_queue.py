@@ -0,0 +1,265 @@
+import os
+import time
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from file_manager import FileManager, QUEUED, PARSING, EMBEDDING, INDEXED, FAILED, UNFINISHED
+from incremental import file_sha256
+from instrumentation import instrumentation
+from agents import FileLoaderAgent
+from compactor import Compactor
+
+# Progress is kept in memory on every page; the metadata row is rewritten at most this often
+PROGRESS_WRITE_SECONDS = 2.0
+
+
+class IngestCancelled(Exception):
+    """The file was deleted while its load was running"""
+
+
+def count_pages(file_path: str) -> Optional[int]:
+    """Page count used to extrapolate a PDF's chunk total; text files are one page"""
+    if not file_path.lower().endswith(".pdf"):
+        return 1
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(file_path).pages)
+    except Exception:
+        return None
+
+
+class IngestJob:
+    """State and chunk progress of one file load"""
+
+    def __init__(self, file_id: str, file_path: str):
+        self.file_id = file_id
+        self.file_path = file_path
+        self.filename = os.path.basename(file_path)
+        self.state = QUEUED
+        self.error = ""
+        self.total_pages: Optional[int] = None
+        self.pages = 0
+        self.chunks_seen = 0
+        self.chunks_done = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        # Set when the file is loaded again while this job runs
+        self.rerun = False
+
+    @property
+    def chunks_total(self) -> Optional[int]:
+        """Chunks of the whole file, extrapolated from the pages split so far"""
+        if not self.pages:
+            return None
+        if self.total_pages and self.pages < self.total_pages:
+            return max(self.chunks_seen, round(self.chunks_seen / self.pages * self.total_pages))
+        return self.chunks_seen
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left at the chunk rate so far"""
+        total = self.chunks_total
+        if self.started is None or not total or not self.chunks_done:
+            return None
+        done = min(self.chunks_done / total, 1.0)
+        return (time.perf_counter() - self.started) * (1 - done) / done
+
+    def to_dict(self) -> Dict:
+        return {"state": self.state, "chunks_done": self.chunks_done, "chunks_total": self.chunks_total,
+                "pages": self.pages, "total_pages": self.total_pages, "eta_seconds": self.eta,
+                "error": self.error}
+
+    def describe(self) -> str:
+        if self.state == FAILED:
+            return f"failed: {self.error}"
+        if self.state in (QUEUED, INDEXED) or self.chunks_total is None:
+            return self.state
+        text = f"{self.state}, {self.chunks_done}/{self.chunks_total} chunks"
+        eta = self.eta
+        if eta is not None:
+            text += f", ETA {eta:.0f}s"
+        return text
+
+
+class IngestQueue:
+    """Background worker pool that loads files while the chat keeps answering.
+
+    Job states live in the file metadata (queued, parsing, embedding,
+    indexed, failed), so start() resumes loads a previous process left
+    unfinished; StreamingIngest's page checkpoints skip what was already
+    written. A file is loaded by at most one worker at a time; loading it
+    again while its job runs queues a single re-run. Jobs are claimed in the
+    metadata store, so when the chat and the server share it only one of
+    them runs each load. Deleting a file while it loads cancels the job at
+    the next page and hands the partial chunks to the compactor; status
+    writes never bring a deleted file back.
+    """
+
+    def __init__(self, loader: FileLoaderAgent, file_manager: FileManager, compactor: Optional[Compactor] = None,
+                 workers: Optional[int] = None):
+        self.loader = loader
+        self.file_manager = file_manager
+        self.compactor = compactor
+        self.workers = workers or int(os.getenv('INGEST_WORKERS', '2'))
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._written: Dict[str, float] = {}
+        self.jobs: Dict[str, IngestJob] = {}
+        self.files_indexed = 0
+        self.files_failed = 0
+
+    def start(self):
+        """Start the workers and queue every load left unfinished by an earlier run"""
+        with self._lock:
+            if not self._threads:
+                for index in range(self.workers):
+                    thread = threading.Thread(target=self._run, name=f"rag-ingest-{index}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        for file_id, info in self.file_manager.get_all_files().items():
+            if info.get("status") in UNFINISHED:
+                self.submit(file_id, info["file_path"])
+
+    def submit(self, file_id: str, file_path: str) -> Optional[IngestJob]:
+        """Queue a file load and return its job at once; None if the file was deleted
+        or another process is loading it"""
+        with self._lock:
+            job = self.jobs.get(file_id)
+            if job is not None and job.state == QUEUED:
+                return job
+            if job is not None and job.state in (PARSING, EMBEDDING):
+                job.rerun = True
+                return job
+            job = self.jobs[file_id] = IngestJob(file_id, file_path)
+        if not self.file_manager.claim_file(file_id, status=QUEUED, error=""):
+            self._forget(job)
+            return None
+        instrumentation.incr("ingest_queue.submitted")
+        self._queue.put(file_id)
+        return job
+
+    def job(self, file_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self.jobs.get(file_id)
+
+    def wait(self):
+        """Block until every queued load has finished"""
+        self._queue.join()
+
+    def report(self) -> str:
+        with self._lock:
+            active = [job for job in self.jobs.values() if job.state in (QUEUED, PARSING, EMBEDDING)]
+            lines = [f"  {job.filename}: {job.describe()}" for job in active]
+            summary = (f"Ingest queue ({self.workers} workers): {self.files_indexed} indexed, "
+                       f"{self.files_failed} failed")
+        if lines:
+            summary += f"; {len(lines)} in progress:\n" + "\n".join(lines)
+        return summary
+
+    def _run(self):
+        while True:
+            file_id = self._queue.get()
+            with self._lock:
+                job = self.jobs[file_id]
+            try:
+                with instrumentation.span("ingest_queue.job"):
+                    self._process(job)
+            except Exception as e:
+                instrumentation.record_error("ingest_queue", e)
+                if not self._finish(job, FAILED, error=str(e)):
+                    self._cancel(job)
+            finally:
+                with self._lock:
+                    rerun = job.rerun
+                    self._written.pop(file_id, None)
+                if rerun:
+                    # Queued before task_done() so wait() covers the re-run
+                    self.submit(file_id, job.file_path)
+                self._queue.task_done()
+
+    def _process(self, job: IngestJob):
+        if self.file_manager.get_file_info(job.file_id) is None:
+            self._forget(job)  # deleted while queued
+            return
+        if not os.path.exists(job.file_path):
+            self._finish(job, FAILED, error=f"File not found: {job.file_path}")
+            return
+        job.started = time.perf_counter()
+        if not self._set_state(job, PARSING):
+            self._forget(job)
+            return
+        content_hash = file_sha256(job.file_path)
+        job.total_pages = count_pages(job.file_path)
+
+        success, message, counts = self.loader.process_file(
+            job.file_path, job.file_id, content_hash,
+            on_progress=lambda stage, counts: self._progress(job, stage, counts)
+        )
+        if success:
+            finished = self._finish(job, INDEXED, content_hash=content_hash, chunk_count=counts.get("chunks", 0),
+                                    indexed_at=datetime.now().isoformat())
+        else:
+            finished = self._finish(job, FAILED, error=message)
+        if not finished:
+            self._cancel(job)
+
+    def _progress(self, job: IngestJob, stage: str, counts: Dict[str, int]):
+        """Track a running load; raising here aborts it"""
+        if self.file_manager.get_file_info(job.file_id) is None:
+            raise IngestCancelled(f"{job.filename} was deleted while loading")
+        with self._lock:
+            job.pages = counts["pages"]
+            job.chunks_seen = counts["chunks"]
+            job.chunks_done = counts["added"] + counts["unchanged"]
+        if stage == "embedding" and job.state != EMBEDDING:
+            written = self._set_state(job, EMBEDDING)
+        elif time.monotonic() - self._written.get(job.file_id, 0.0) >= PROGRESS_WRITE_SECONDS:
+            written = self._persist(job)
+        else:
+            written = True
+        if not written:
+            raise IngestCancelled(f"{job.filename} was deleted while loading")
+
+    def _set_state(self, job: IngestJob, state: str, **fields) -> bool:
+        with self._lock:
+            job.state = state
+        return self._persist(job, **fields)
+
+    def _persist(self, job: IngestJob, **fields) -> bool:
+        """Write the job's state; False if the file was deleted, which the write never undoes"""
+        with self._lock:
+            self._written[job.file_id] = time.monotonic()
+            progress = {"chunks_done": job.chunks_done, "chunks_total": job.chunks_total, "error": job.error}
+        return self.file_manager.update_live_file(job.file_id, status=job.state, **progress, **fields)
+
+    def _finish(self, job: IngestJob, state: str, error: str = "", **fields) -> bool:
+        """Record the outcome and release the claim; False if the file was deleted"""
+        with self._lock:
+            job.error = error
+            job.finished = time.perf_counter()
+        if not self._set_state(job, state, ingest_owner="", **fields):
+            return False
+        with self._lock:
+            if state == INDEXED:
+                self.files_indexed += 1
+            else:
+                self.files_failed += 1
+        instrumentation.incr(f"ingest_queue.{state}")
+        return True
+
+    def _forget(self, job: IngestJob):
+        with self._lock:
+            job.rerun = False
+            if self.jobs.get(job.file_id) is job:
+                del self.jobs[job.file_id]
+
+    def _cancel(self, job: IngestJob):
+        """Drop what a cancelled load wrote; the file's metadata is already tombstoned"""
+        self._forget(job)
+        self.loader.ingest.discard_checkpoint(job.file_id)
+        self.loader.runtime.bm25.remove_file(job.file_id)
+        if self.compactor is not None:
+            self.compactor.submit(job.file_id, {"filename": job.filename})
+        instrumentation.incr("ingest_queue.cancelled")
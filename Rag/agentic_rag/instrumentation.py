@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import threading
+import traceback
+from typing import Any, Dict
+
+# Upper bounds (seconds) of the Prometheus latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _NullSpan:
+    """Shared no-op span handed out while instrumentation is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, instrumentation: "Instrumentation", name: str):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.instrumentation.observe(self.name, time.perf_counter() - self.start, failed=exc_type is not None)
+        return False
+
+
+class Instrumentation:
+    """Timed spans, counters and error records for the agents' hot paths.
+
+    When disabled, span() returns a shared no-op object and the counter
+    methods return after a single attribute check, so the calls can stay in
+    the hot path permanently.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.spans: Dict[str, Dict[str, Any]] = {}
+            self.counters: Dict[str, float] = {}
+            self.errors: Dict[str, int] = {}
+            self.last_error = ""
+
+    def span(self, name: str):
+        """Time a block under `name` (e.g. "query.search")"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def observe(self, name: str, seconds: float, failed: bool = False):
+        """Record one span duration"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = {"count": 0, "total": 0.0, "max": 0.0, "failed": 0,
+                                            "buckets": [0] * len(BUCKETS)}
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            if failed:
+                stats["failed"] += 1
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats["buckets"][index] += 1
+                    break
+
+    def incr(self, name: str, value: float = 1):
+        """Add to a counter (chunks, tokens, cache hits, ...)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_error(self, stage: str, error: BaseException):
+        """Count an exception by stage and type and keep its traceback"""
+        if not self.enabled:
+            return
+        key = f"{stage}.{type(error).__name__}"
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+            self.last_error = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "spans": {name: {"count": stats["count"], "total_s": stats["total"], "max_s": stats["max"],
+                                 "avg_ms": stats["total"] / stats["count"] * 1000, "failed": stats["failed"]}
+                          for name, stats in self.spans.items()},
+                "counters": dict(self.counters),
+                "errors": dict(self.errors),
+            }
+
+    def report(self) -> str:
+        """Human-readable summary for the chat 'stats' command"""
+        if not self.enabled:
+            return "Instrumentation is off. Type 'stats on' or set RAG_INSTRUMENT=1 to enable it."
+        snapshot = self.snapshot()
+        lines = ["Stage timings:"]
+        for name, stats in sorted(snapshot["spans"].items()):
+            lines.append(f"  {name}: {stats['count']} calls, avg {stats['avg_ms']:.1f} ms, "
+                         f"max {stats['max_s'] * 1000:.1f} ms" + (f", {stats['failed']} failed" if stats["failed"] else ""))
+        if snapshot["counters"]:
+            lines.append("Counters:")
+            lines.extend(f"  {name}: {value:g}" for name, value in sorted(snapshot["counters"].items()))
+        if snapshot["errors"]:
+            lines.append("Errors:")
+            lines.extend(f"  {name}: {count}" for name, count in sorted(snapshot["errors"].items()))
+        return "\n".join(lines)
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Render spans as histograms and counters in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            if self.spans:
+                lines.append("# TYPE rag_span_seconds histogram")
+            for name, stats in sorted(self.spans.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stats["buckets"]):
+                    cumulative += count
+                    lines.append(f'rag_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'rag_span_seconds_bucket{{span="{name}",le="+Inf"}} {stats["count"]}')
+                lines.append(f'rag_span_seconds_sum{{span="{name}"}} {stats["total"]}')
+                lines.append(f'rag_span_seconds_count{{span="{name}"}} {stats["count"]}')
+            if self.counters:
+                lines.append("# TYPE rag_events_total counter")
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'rag_events_total{{name="{name}"}} {value}')
+            if self.errors:
+                lines.append("# TYPE rag_errors_total counter")
+            for name, count in sorted(self.errors.items()):
+                stage, error_type = name.rsplit(".", 1)
+                lines.append(f'rag_errors_total{{stage="{stage}",type="{error_type}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path: str):
+        """Write a JSON or Prometheus-text snapshot, chosen by file extension"""
+        content = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        with open(path + ".tmp", 'w') as f:
+            f.write(content)
+        os.replace(path + ".tmp", path)
+
+
+instrumentation = Instrumentation(enabled=os.getenv('RAG_INSTRUMENT', '0').lower() in ('1', 'true', 'yes'))
@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+from instrumentation import instrumentation
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1/"
+# Worth retrying on the same model: rate limits, overload and transient server errors
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+# Specific to the model (unknown, unavailable or prompt too long for it): try the next one.
+# Other 4xx (e.g. 400) mean the request itself is wrong and fail at once.
+FALLBACK_STATUS = {404, 413}
+
+T = TypeVar("T")
+
+
+class LLMUnavailableError(RuntimeError):
+    """Every model failed after its retries"""
+
+
+class LLMSettings:
+    """Timeouts, retries, hedging and fallback models for LLM calls.
+
+    Read from LLM_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_HEDGE, LLM_HEDGE_MIN_MS,
+    LLM_FALLBACK_MODELS (comma-separated) and LLM_MAX_CONNECTIONS when not
+    given explicitly.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, connect_timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None, backoff_base: Optional[float] = None,
+                 backoff_max: Optional[float] = None, hedge: Optional[bool] = None,
+                 hedge_min_ms: Optional[float] = None, fallback_models: Optional[List[str]] = None,
+                 max_connections: Optional[int] = None):
+        self.timeout = timeout or float(os.getenv('LLM_TIMEOUT', '60'))
+        self.connect_timeout = connect_timeout or float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('LLM_MAX_RETRIES', '3'))
+        self.backoff_base = backoff_base or float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+        self.backoff_max = backoff_max or float(os.getenv('LLM_BACKOFF_MAX', '8'))
+        if hedge is None:
+            hedge = os.getenv('LLM_HEDGE', '0').lower() in ('1', 'true', 'yes')
+        self.hedge = hedge
+        # Never hedge sooner than this, however fast recent calls were
+        self.hedge_min_ms = hedge_min_ms or float(os.getenv('LLM_HEDGE_MIN_MS', '500'))
+        if fallback_models is None:
+            fallback_models = [model.strip() for model in os.getenv('LLM_FALLBACK_MODELS', '').split(',')
+                               if model.strip()]
+        self.fallback_models = fallback_models
+        self.max_connections = max_connections or int(os.getenv('LLM_MAX_CONNECTIONS', '20'))
+
+
+class LLMGateway:
+    """Resilient calls to an OpenAI-compatible chat completions API.
+
+    The sync client keeps one pooled keep-alive HTTP connection pool for the
+    process and the async client one per event loop, with connect and read
+    timeouts. Each model is tried up to max_retries + 1 times on timeouts,
+    connection errors, 429 and 5xx, sleeping full-jitter exponential backoff
+    (at least the server's Retry-After) in between; then the next fallback
+    model is tried. Any other 4xx fails at once. With hedging on, a completion that has not answered by the p95 of
+    recent latencies gets one duplicate request and the first answer wins.
+    Streams are retried and fall back only until the stream is open.
+    """
+
+    HEDGE_SAMPLES = 20  # latencies needed before the p95 is trusted
+
+    def __init__(self, model: str, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 settings: Optional[LLMSettings] = None):
+        self.settings = settings or LLMSettings()
+        self.models = [model] + [fallback for fallback in self.settings.fallback_models if fallback != model]
+        self.base_url = base_url or os.getenv('LLM_BASE_URL', DEFAULT_BASE_URL)
+        self.api_key = api_key or os.getenv('API_KEY')
+        self._client = None
+        # id(loop) -> (loop, client): httpx async connections belong to the loop that opened them
+        self._async_clients: Dict[int, Tuple[asyncio.AbstractEventLoop, AsyncOpenAI]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=200)
+        self.stats = {"requests": 0, "retries": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+
+    def _http_options(self) -> Dict[str, Any]:
+        import httpx
+
+        settings = self.settings
+        return {
+            "timeout": httpx.Timeout(settings.timeout, connect=settings.connect_timeout),
+            "limits": httpx.Limits(max_connections=settings.max_connections,
+                                   max_keepalive_connections=settings.max_connections, keepalive_expiry=60),
+        }
+
+    @property
+    def client(self) -> OpenAI:
+        """Sync client on a pooled keep-alive connection, created on first use"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from openai import OpenAI
+
+                    # Retries are done here, with jitter and fallback, not by the SDK
+                    self._client = OpenAI(base_url=self.base_url, api_key=self.api_key, max_retries=0,
+                                          http_client=httpx.Client(**self._http_options()))
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Async client of the running event loop, created on first use in each loop,
+        so successive asyncio.run() calls never reuse a pool bound to a closed loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._async_clients.get(id(loop))
+            if entry is None or entry[0] is not loop:
+                import httpx
+                from openai import AsyncOpenAI
+
+                # Clients of closed loops cannot be closed any more; just let them go
+                for key, (other, _) in list(self._async_clients.items()):
+                    if other.is_closed():
+                        del self._async_clients[key]
+                client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key, max_retries=0,
+                                     http_client=httpx.AsyncClient(**self._http_options()))
+                entry = self._async_clients[id(loop)] = (loop, client)
+        return entry[1]
+
+    def complete(self, messages: List[Dict[str, str]], **kwargs):
+        """Chat completion with retries, hedging and model fallback"""
+        def call(model: str):
+            return self._timed(lambda: self.client.chat.completions.create(model=model, messages=messages, **kwargs))
+        return self._with_retries(lambda model: self._hedged(call, model))
+
+    def stream(self, messages: List[Dict[str, str]], **kwargs):
+        """Open a streamed chat completion with retries and model fallback"""
+        return self._with_retries(
+            lambda model: self.client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs)
+        )
+
+    async def acomplete(self, messages: List[Dict[str, str]], **kwargs):
+        """Async variant of complete"""
+        async def call(model: str):
+            start = time.perf_counter()
+            completion = await self.async_client.chat.completions.create(model=model, messages=messages, **kwargs)
+            self._record_latency(time.perf_counter() - start)
+            return completion
+        return await self._awith_retries(lambda model: self._ahedged(call, model))
+
+    async def astream(self, messages: List[Dict[str, str]], **kwargs):
+        """Async variant of stream"""
+        return await self._awith_retries(
+            lambda model: self.async_client.chat.completions.create(model=model, messages=messages,
+                                                                     stream=True, **kwargs)
+        )
+
+    def _with_retries(self, call: Callable[[str], T]) -> T:
+        self._count("requests")
+        last_error: Optional[Exception] = None
+        for index, model in enumerate(self.models):
+            if index:
+                self._count("fallbacks")
+            for attempt in range(self.settings.max_retries + 1):
+                try:
+                    return call(model)
+                except Exception as e:
+                    if not self._should_retry(e):
+                        raise
+                    last_error = e
+                    instrumentation.record_error("llm", e)
+                    if attempt == self.settings.max_retries or self._status(e) in FALLBACK_STATUS:
+                        break
+                    self._count("retries")
+                    time.sleep(self._backoff(attempt, e))
+        raise self._unavailable(last_error)
+
+    async def _awith_retries(self, call: Callable[[str], Awaitable[T]]) -> T:
+        self._count("requests")
+        last_error: Optional[Exception] = None
+        for index, model in enumerate(self.models):
+            if index:
+                self._count("fallbacks")
+            for attempt in range(self.settings.max_retries + 1):
+                try:
+                    return await call(model)
+                except Exception as e:
+                    if not self._should_retry(e):
+                        raise
+                    last_error = e
+                    instrumentation.record_error("llm", e)
+                    if attempt == self.settings.max_retries or self._status(e) in FALLBACK_STATUS:
+                        break
+                    self._count("retries")
+                    await asyncio.sleep(self._backoff(attempt, e))
+        raise self._unavailable(last_error)
+
+    def _hedged(self, call: Callable[[str], T], model: str) -> T:
+        """Run `call`, sending a duplicate if it is still running at the hedge deadline"""
+        deadline = self.hedge_deadline()
+        if deadline is None:
+            return call(model)
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.settings.max_connections,
+                                                        thread_name_prefix="rag-llm")
+        primary = self._executor.submit(call, model)
+        done, _ = wait([primary], timeout=deadline)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        backup = self._executor.submit(call, model)
+        # The slower request cannot be cancelled; it finishes in the background and feeds the p95
+        pending = {primary, backup}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner: Optional[Future] = next((future for future in done if future.exception() is None), None)
+            if winner is not None:
+                if winner is backup:
+                    self._count("hedge_wins")
+                return winner.result()
+            if not pending:
+                raise next(iter(done)).exception()
+
+    async def _ahedged(self, call: Callable[[str], Awaitable[T]], model: str) -> T:
+        deadline = self.hedge_deadline()
+        if deadline is None:
+            return await call(model)
+        primary = asyncio.ensure_future(call(model))
+        done, _ = await asyncio.wait({primary}, timeout=deadline)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        backup = asyncio.ensure_future(call(model))
+        pending = {primary, backup}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+                if winner is not None:
+                    if winner is backup:
+                        self._count("hedge_wins")
+                    return winner.result()
+                if not pending:
+                    raise next(iter(done)).exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def hedge_deadline(self) -> Optional[float]:
+        """Seconds to wait before hedging (the recent p95, floored at hedge_min_ms), or None"""
+        if not self.settings.hedge:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.HEDGE_SAMPLES:
+            return None
+        p95 = samples[int(0.95 * (len(samples) - 1))]
+        return max(p95, self.settings.hedge_min_ms / 1000)
+
+    def _timed(self, call: Callable[[], T]) -> T:
+        start = time.perf_counter()
+        result = call()
+        self._record_latency(time.perf_counter() - start)
+        return result
+
+    def _record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+        instrumentation.incr(f"llm.{name}")
+
+    @staticmethod
+    def _status(error: Exception) -> Optional[int]:
+        return getattr(error, "status_code", None)
+
+    def _should_retry(self, error: Exception) -> bool:
+        """Timeouts, dropped connections and retryable or model-specific HTTP statuses"""
+        import openai
+
+        if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+            return True
+        status = self._status(error)
+        return status in RETRYABLE_STATUS or status in FALLBACK_STATUS
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, but no shorter than the server's Retry-After"""
+        settings = self.settings
+        delay = random.uniform(0, min(settings.backoff_max, settings.backoff_base * 2 ** attempt))
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), settings.backoff_max))
+            except ValueError:
+                pass  # an HTTP date; the jittered delay will do
+        return delay
+
+    def _unavailable(self, last_error: Optional[Exception]) -> LLMUnavailableError:
+        self._count("failures")
+        error = LLMUnavailableError(f"LLM unavailable ({', '.join(self.models)} failed after retries): {last_error}")
+        error.__cause__ = last_error
+        return error
+
+    def report(self) -> Optional[str]:
+        with self._lock:
+            stats = dict(self.stats)
+        if not stats["requests"]:
+            return None
+        deadline = self.hedge_deadline()
+        line = (f"LLM gateway ({', '.join(self.models)}): {stats['requests']} requests, {stats['retries']} retries, "
+                f"{stats['fallbacks']} fallbacks, {stats['failures']} failed")
+        if self.settings.hedge:
+            line += f", {stats['hedges']} hedged ({stats['hedge_wins']} won by the hedge)"
+            if deadline is not None:
+                line += f", hedge after {deadline * 1000:.0f} ms"
+        return line
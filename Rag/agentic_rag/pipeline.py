@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import os
+import glob
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+from incremental import assign_chunk_ids, diff_chunks, file_sha256
+from runtime import RAGRuntime
+from instrumentation import instrumentation
+from chunking import ChunkProfile, ChunkStats, split_pages
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+    from vector_store import VectorStore
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
+_DONE = object()
+
+
+def resolve_paths(target: str) -> List[str]:
+    """Expand a directory or glob pattern into supported file paths"""
+    if os.path.isdir(target):
+        patterns = [os.path.join(target, "**", f"*{ext}") for ext in SUPPORTED_EXTENSIONS]
+    else:
+        patterns = [target]
+    paths = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS:
+                paths.add(path)
+    return sorted(paths)
+
+
+def is_bulk_target(target: str) -> bool:
+    """Check whether a load target names a directory or a glob pattern"""
+    return os.path.isdir(target) or any(ch in target for ch in '*?[')
+
+
+def parse_file(file_path: str, file_id: str, known_hash: Optional[str]) -> Tuple[str, str, Optional[List[Document]]]:
+    """Hash and parse one file in a worker process.
+
+    Returns (file_id, content_hash, documents); documents is None when the
+    content hash matches `known_hash` and the file can be skipped.
+    """
+    content_hash = file_sha256(file_path)
+    if content_hash == known_hash:
+        return file_id, content_hash, None
+
+    from langchain_community.document_loaders import TextLoader, PyPDFLoader
+
+    file_ext = os.path.splitext(file_path)[1].lower()
+    if file_ext == '.pdf':
+        loader = PyPDFLoader(file_path)
+    else:
+        loader = TextLoader(file_path, encoding="utf-8")
+    documents = loader.load()
+    for doc in documents:
+        doc.metadata["file_id"] = file_id
+        doc.metadata["file_type"] = file_ext[1:]
+    return file_id, content_hash, documents
+
+
+def parse_and_chunk(file_path: str, file_id: str, known_hash: Optional[str], profiles: Dict[str, ChunkProfile]):
+    """Parse and chunk one file in a worker process, so chunking runs in parallel with parsing.
+
+    Returns (file_id, content_hash, parsed) where parsed is None for an
+    unchanged file, else (pages, characters, chunks, chunk_ids, chunk_seconds).
+    """
+    file_id, content_hash, documents = parse_file(file_path, file_id, known_hash)
+    if documents is None:
+        return file_id, content_hash, None
+    start = time.perf_counter()
+    chunks = split_pages(documents, profiles)
+    ids = assign_chunk_ids(chunks, file_id)
+    characters = sum(len(document.page_content) for document in documents)
+    return file_id, content_hash, (len(documents), characters, chunks, ids, time.perf_counter() - start)
+
+
+class PipelineStats:
+    """Counters collected during a bulk ingest run"""
+
+    def __init__(self):
+        self.files = 0
+        self.skipped = 0
+        self.failed: Dict[str, str] = {}
+        self.documents = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.removed = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.elapsed = 0.0
+        self.chunking = ChunkStats()
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        lines = [
+            f"Ingested {self.files - self.skipped - len(self.failed)} of {self.files} files "
+            f"({self.skipped} unchanged, {len(self.failed)} failed) in {self.elapsed:.1f}s",
+            f"{self.documents} docs ({self.documents / elapsed:.1f} docs/sec), "
+            f"{self.chunks} chunks ({self.chunks / elapsed:.1f} chunks/sec), "
+            f"{self.embedded} embedded, {self.removed} stale removed, "
+            f"embedding cache {self.cache_hits} hits, {self.cache_misses} misses",
+        ]
+        if self.chunking.chunks:
+            lines.append(self.chunking.summary())
+        for file_path, error in self.failed.items():
+            lines.append(f"  failed: {file_path}: {error}")
+        return "\n".join(lines)
+
+
+class BulkIngestPipeline:
+    """Staged ingest: parse and chunk in a process pool, diff chunks as results
+    stream in, embed in fixed-size batches and write to the store in batches.
+
+    Stages are connected by bounded queues so a slow stage applies
+    backpressure instead of letting parsed pages pile up in memory.
+    """
+
+    def __init__(self, runtime: RAGRuntime, parse_workers: Optional[int] = None,
+                 embed_batch_size: int = 256, write_batch_size: int = 1024, queue_size: int = 8):
+        self.runtime = runtime
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+        self.chunker = runtime.chunker
+
+    def run(self, items: List[Tuple[str, str, Optional[str]]],
+            on_file_done: Optional[Callable[[str, str, int], None]] = None) -> PipelineStats:
+        """Ingest (file_path, file_id, known_hash) items.
+
+        `on_file_done(file_id, content_hash, chunk_count)` is called once every
+        chunk of a file has been written (or the file was skipped as unchanged).
+        A file's stale chunks and keyword postings are only replaced after that,
+        so a failed run leaves its previous version searchable.
+        """
+        stats = PipelineStats()
+        stats.files = len(items)
+        start = time.perf_counter()
+        store = self.runtime.store
+        embedding_function = self.runtime.embedding_function
+        hits_before, misses_before = embedding_function.counters()
+
+        embed_queue: queue.Queue = queue.Queue(maxsize=self.queue_size * self.embed_batch_size)
+        write_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        pending: Dict[str, List] = {}
+        pending_lock = threading.Lock()
+        errors: List[BaseException] = []
+        callback_lock = threading.Lock()
+
+        def notify(file_id: str, content_hash: str, chunk_count: int):
+            # Callbacks come from both the chunk and write stages
+            if on_file_done:
+                with callback_lock:
+                    on_file_done(file_id, content_hash, chunk_count)
+
+        def finish_chunk(file_id: str):
+            with pending_lock:
+                entry = pending[file_id]
+                entry[0] -= 1
+                done = entry[0] == 0
+            if done:
+                entry[3]()
+                notify(file_id, entry[1], entry[2])
+
+        def embed_stage():
+            batch: List[Tuple[str, Document]] = []
+
+            def flush():
+                texts = [chunk.page_content for _, chunk in batch]
+                with instrumentation.span("bulk_ingest.embed_batch"):
+                    embeddings = embedding_function.embed_documents(texts) if not errors else None
+                write_queue.put((list(batch), embeddings))
+                batch.clear()
+
+            finished = False
+            try:
+                while True:
+                    item = embed_queue.get()
+                    if item is _DONE:
+                        finished = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.embed_batch_size:
+                        flush()
+                if batch:
+                    flush()
+            except BaseException as e:
+                errors.append(e)
+                # Keep draining so the chunk stage never blocks on a full queue; a failed
+                # final flush has already seen the end marker
+                while not finished and embed_queue.get() is not _DONE:
+                    pass
+            finally:
+                write_queue.put(_DONE)
+
+        def write_stage():
+            buffer: List[Tuple[Tuple[str, Document], List[float]]] = []
+
+            def flush():
+                with instrumentation.span("bulk_ingest.write_batch"):
+                    store.upsert(
+                        [chunk_id for (chunk_id, _), _ in buffer],
+                        [chunk for (_, chunk), _ in buffer],
+                        [embedding for _, embedding in buffer],
+                    )
+                for (_, chunk), _ in buffer:
+                    finish_chunk(chunk.metadata["file_id"])
+                stats.embedded += len(buffer)
+                buffer.clear()
+
+            while True:
+                item = write_queue.get()
+                if item is _DONE:
+                    break
+                batch, embeddings = item
+                if errors or embeddings is None:
+                    continue
+                try:
+                    buffer.extend(zip(batch, embeddings))
+                    if len(buffer) >= self.write_batch_size:
+                        flush()
+                except BaseException as e:
+                    errors.append(e)
+            if buffer and not errors:
+                try:
+                    flush()
+                except BaseException as e:
+                    errors.append(e)
+
+        embed_thread = threading.Thread(target=embed_stage, name="ingest-embed", daemon=True)
+        write_thread = threading.Thread(target=write_stage, name="ingest-write", daemon=True)
+        embed_thread.start()
+        write_thread.start()
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+                remaining = list(items)
+                in_flight = {}
+                # Bound in-flight parses so parsed pages cannot outrun the embedder
+                max_in_flight = self.parse_workers * 2
+                while (remaining or in_flight) and not errors:
+                    while remaining and len(in_flight) < max_in_flight:
+                        file_path, file_id, known_hash = remaining.pop(0)
+                        in_flight[executor.submit(parse_and_chunk, file_path, file_id, known_hash,
+                                                  self.chunker.profiles)] = file_path
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file_path = in_flight.pop(future)
+                        try:
+                            file_id, content_hash, parsed = future.result()
+                        except Exception as e:
+                            stats.failed[file_path] = str(e)
+                            continue
+                        if parsed is None:
+                            stats.skipped += 1
+                            notify(file_id, content_hash, 0)
+                            continue
+                        pages, characters, chunks, ids, chunk_seconds = parsed
+                        self.chunker.record(pages, characters, chunks, chunk_seconds)
+                        stats.chunking.add(pages, characters, chunks, chunk_seconds)
+                        stats.documents += pages
+                        self._sync_file(store, file_id, content_hash, chunks, ids, embed_queue,
+                                        pending, pending_lock, stats, notify)
+                for future in in_flight:
+                    future.cancel()
+        finally:
+            embed_queue.put(_DONE)
+            embed_thread.join()
+            write_thread.join()
+
+        stats.elapsed = time.perf_counter() - start
+        hits, misses = embedding_function.counters()
+        stats.cache_hits, stats.cache_misses = hits - hits_before, misses - misses_before
+        instrumentation.observe("bulk_ingest.run", stats.elapsed)
+        instrumentation.incr("ingest.documents", stats.documents)
+        instrumentation.incr("ingest.chunks", stats.chunks)
+        instrumentation.incr("ingest.embedded", stats.embedded)
+        instrumentation.incr("embedding_cache.hits", stats.cache_hits)
+        instrumentation.incr("embedding_cache.misses", stats.cache_misses)
+        if errors:
+            raise errors[0]
+        return stats
+
+    def _sync_file(self, store: VectorStore, file_id: str, content_hash: str, chunks: List[Document],
+                   ids: List[str], embed_queue: queue.Queue, pending: Dict[str, List], pending_lock: threading.Lock,
+                   stats: PipelineStats, notify: Callable[[str, str, int], None]):
+        """Diff one chunked file against the store and stream its new chunks to the embed stage.
+
+        The old version stays in place until the write stage has stored every new
+        chunk; only then are stale chunks deleted and the keyword index switched over.
+        """
+        existing = set(store.ids(where={"file_id": file_id}))
+        new_chunks, new_ids, kept_ids, kept_metadatas, stale = diff_chunks(existing, chunks, ids)
+        texts = [chunk.page_content for chunk in chunks]
+
+        def replace_old_version():
+            store.update_metadata(kept_ids, kept_metadatas)
+            store.delete(stale)
+            self.runtime.bm25.index_file(file_id, ids, texts)
+            self.runtime.query_cache.invalidate_file(file_id)
+            stats.removed += len(stale)
+
+        stats.chunks += len(chunks)
+        if not new_chunks:
+            replace_old_version()
+            notify(file_id, content_hash, len(chunks))
+            return
+        with pending_lock:
+            pending[file_id] = [len(new_chunks), content_hash, len(chunks), replace_old_version]
+        for chunk_id, chunk in zip(new_ids, new_chunks):
+            embed_queue.put((chunk_id, chunk))
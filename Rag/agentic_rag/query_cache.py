@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import re
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    # Imported on first semantic lookup; the exact tier and 'help'/'list' never need it
+    import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r'\s+', ' ', query.lower()).strip().rstrip('?.!').strip()
+
+
+class CacheEntry:
+    """One cached answer"""
+
+    def __init__(self, key: Tuple, embedding: Optional[np.ndarray], answer: str, created: float, cost: float):
+        self.key = key
+        self.embedding = embedding
+        self.answer = answer
+        self.created = created
+        self.cost = cost
+
+
+class QueryCache:
+    """Two-tier answer cache for QueryAgent.
+
+    Tier one matches (normalized query, file_id, k, model) exactly. Tier two
+    compares the query embedding with cached ones for the same file, k and
+    model and reuses the answer above a cosine threshold. Entries are evicted
+    LRU-first and expire after `ttl_seconds`. When `persist_path` is set the
+    entries are mirrored to SQLite so they survive restarts.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.95, persist_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self._by_file: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "saved_seconds": 0.0}
+        self._conn = None
+        if persist_path:
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "query TEXT, file_id TEXT, k INTEGER, model TEXT, embedding BLOB, "
+                "answer TEXT, created REAL, cost REAL, PRIMARY KEY (query, file_id, k, model))"
+            )
+            self._conn.commit()
+            self._load()
+
+    @staticmethod
+    def make_key(query: str, file_id: str, k: int, model: str) -> Tuple:
+        return normalize_query(query), file_id, k, model
+
+    def get_exact(self, query: str, file_id: str, k: int, model: str) -> Optional[str]:
+        """Return a cached answer for the exact same normalized question"""
+        start = time.perf_counter()
+        key = self.make_key(query, file_id, k, model)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            self.stats["saved_seconds"] += max(entry.cost - (time.perf_counter() - start), 0.0)
+            return entry.answer
+
+    def get_semantic(self, embedding: List[float], file_id: str, k: int, model: str) -> Optional[str]:
+        """Return the answer of the most similar cached question above the threshold"""
+        import numpy as np
+
+        start = time.perf_counter()
+        query_vector = self._normalize(embedding)
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for key in list(self._by_file.get(file_id, ())):
+                entry = self._entries[key]
+                if self._expired(entry):
+                    self._remove(key)
+                    continue
+                if key[2] != k or key[3] != model or entry.embedding is None:
+                    continue
+                score = float(np.dot(entry.embedding, query_vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.stats["misses"] += 1
+                return None
+            entry = self._entries[best_key]
+            self._entries.move_to_end(best_key)
+            self.stats["semantic_hits"] += 1
+            self.stats["saved_seconds"] += max(entry.cost - (time.perf_counter() - start), 0.0)
+            return entry.answer
+
+    def put(self, query: str, file_id: str, k: int, model: str,
+            embedding: Optional[List[float]], answer: str, cost: float):
+        """Cache an answer together with the time it took to produce"""
+        key = self.make_key(query, file_id, k, model)
+        vector = self._normalize(embedding) if embedding is not None else None
+        entry = CacheEntry(key, vector, answer, time.time(), cost)
+        with self._lock:
+            self._insert(entry)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*key, vector.tobytes() if vector is not None else None, answer, entry.created, cost)
+                )
+                self._conn.commit()
+
+    def invalidate_file(self, file_id: str):
+        """Drop every cached answer about a file (reloaded or deleted)"""
+        with self._lock:
+            for key in list(self._by_file.get(file_id, ())):
+                self._remove(key)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM entries WHERE file_id = ?", (file_id,))
+                self._conn.commit()
+
+    def report(self) -> str:
+        """Format hit rates and the latency they saved"""
+        with self._lock:
+            stats = dict(self.stats)
+            size = len(self._entries)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        hit_rate = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return (f"Query cache: {size} entries, {lookups} lookups, hit rate {hit_rate:.0%} "
+                f"({stats['exact_hits']} exact, {stats['semantic_hits']} semantic), "
+                f"saved {stats['saved_seconds']:.1f}s")
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.created > self.ttl_seconds
+
+    def _insert(self, entry: CacheEntry):
+        if entry.key in self._entries:
+            self._remove(entry.key, persist=False)
+        self._entries[entry.key] = entry
+        self._by_file.setdefault(entry.key[1], set()).add(entry.key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple, persist: bool = True):
+        self._entries.pop(key, None)
+        keys = self._by_file.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_file[key[1]]
+        if persist and self._conn is not None:
+            self._conn.execute(
+                "DELETE FROM entries WHERE query = ? AND file_id = ? AND k = ? AND model = ?", key
+            )
+            self._conn.commit()
+
+    def _load(self):
+        import numpy as np
+
+        rows = self._conn.execute(
+            "SELECT query, file_id, k, model, embedding, answer, created, cost FROM entries "
+            "WHERE created >= ? ORDER BY created", (time.time() - self.ttl_seconds,)
+        ).fetchall()
+        for query, file_id, k, model, blob, answer, created, cost in rows:
+            vector = np.frombuffer(blob, dtype=np.float32) if blob is not None else None
+            self._insert(CacheEntry((query, file_id, k, model), vector, answer, created, cost))
+        self._conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl_seconds,))
+        self._conn.commit()
+
+    @staticmethod
+    def _normalize(embedding: Any) -> np.ndarray:
+        import numpy as np
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
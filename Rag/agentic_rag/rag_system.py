@@ -1,22 +1,60 @@
+import time
+_import_start = time.perf_counter()
+
 import re
-from typing import Optional
-from file_manager import FileManager
-from agents import FileLoaderAgent, QueryAgent, DeleteAgent
+import asyncio
+import argparse
+from typing import Iterator, List, Optional, Tuple, Union
+from file_manager import FileManager, INDEXED, FAILED, is_indexed
+from agents import FileLoaderAgent, QueryAgent, DeleteAgent, QueryEmbedder
+from ingest_queue import IngestQueue
+from runtime import get_runtime
+from incremental import file_sha256
+from pipeline import BulkIngestPipeline, is_bulk_target, resolve_paths
+from instrumentation import instrumentation
 import os
 
+# Heavy libraries (langchain, chromadb, sentence-transformers, openai) load on first use
+IMPORT_SECONDS = time.perf_counter() - _import_start
+
 class ConversationalRAGSystem:
     """Main conversational RAG system"""
     def __init__(self):
         self.file_manager = FileManager()
-        self.loader_agent = FileLoaderAgent()
-        self.query_agent = QueryAgent()
-        self.delete_agent = DeleteAgent()
+        # One embedding model and Chroma client shared by all agents
+        self.runtime = get_runtime()
+        self.loader_agent = FileLoaderAgent(runtime=self.runtime)
+        self.query_agent = QueryAgent(runtime=self.runtime)
+        self.delete_agent = DeleteAgent(runtime=self.runtime, file_manager=self.file_manager)
+        # Loads run in the background; start() also resumes loads an earlier run left unfinished
+        self.ingest_queue = IngestQueue(self.loader_agent, self.file_manager, compactor=self.delete_agent.compactor)
+        self.ingest_queue.start()
         print("RAG Assistant initialized! Type 'hi' or 'help' to see what I can do.")
 
     def _detect_intent(self, user_input: str) -> tuple[str, str]:
         """Detect user intent from input"""
         user_input = user_input.lower().strip()
 
+        if user_input in ('timings', 'runtime'):
+            return "timings", user_input
+
+        if user_input in ('compaction', 'compact'):
+            return "compaction", user_input
+
+        if user_input in ('jobs', 'queue'):
+            return "jobs", user_input
+
+        if user_input == 'stats' or user_input.startswith('stats '):
+            return "stats", user_input
+
+        # Checked before the keywords below, which also match inside questions ("this" contains "hi")
+        if re.match(r'^(?:\d+(?:\s*,\s*\d+)*|all)\s+', user_input):
+            return "query_specific", user_input
+
+        # Likewise for paths: "load docs/history.txt" contains "hi"
+        if re.match(r'^(?:load|process|add|upload)\s+\S', user_input):
+            return "load_file", user_input
+
         if any(word in user_input for word in ['hi', 'hello', 'hey', 'help']):
             return "help", user_input
 
@@ -29,9 +67,6 @@ class ConversationalRAGSystem:
         if any(phrase in user_input for phrase in ['delete', 'remove', 'erase']):
             return "delete_file", user_input
 
-        if re.match(r'^\d+\s+', user_input):
-            return "query_specific", user_input
-
         return "unknown", user_input
 
     def _extract_file_path(self, user_input: str) -> Optional[str]:
@@ -47,6 +82,13 @@ class ConversationalRAGSystem:
                 return match.group(1).strip()
         return None
 
+    def _extract_load_target(self, user_input: str) -> Optional[str]:
+        """Extract the raw argument of a load command (file, directory or glob)"""
+        match = re.match(r'^(?:load|process|add|upload)\s+["\']?(.+?)["\']?$', user_input.strip(), re.IGNORECASE)
+        if match:
+            return match.group(1).strip()
+        return None
+
     def _extract_file_number(self, user_input: str) -> tuple[Optional[str], str]:
         """Extract file number and query from user input"""
         match = re.match(r'^(\d+)\s+(.+)$', user_input, re.IGNORECASE)
@@ -60,14 +102,7 @@ class ConversationalRAGSystem:
 
     def _get_file_id_by_number(self, number: str) -> Optional[str]:
         """Get file ID by number (1-based index)"""
-        files = list(self.file_manager.get_all_files().items())
-        try:
-            index = int(number) - 1
-            if 0 <= index < len(files):
-                return files[index][0]
-        except ValueError:
-            pass
-        return None
+        return self.file_manager.get_file_id_by_number(number)
 
     def process_input(self, user_input: str) -> str:
         """Process user input and return response"""
@@ -77,6 +112,9 @@ class ConversationalRAGSystem:
             return self._help_response()
 
         elif intent == "load_file":
+            target = self._extract_load_target(user_input)
+            if target and is_bulk_target(target):
+                return self._load_many(target)
             file_path = self._extract_file_path(user_input)
             if file_path:
                 return self._load_file(file_path)
@@ -85,6 +123,18 @@ class ConversationalRAGSystem:
         elif intent == "list_files":
             return self._list_files()
 
+        elif intent == "timings":
+            return self.runtime.report()
+
+        elif intent == "stats":
+            return self._stats(user_input.strip())
+
+        elif intent == "compaction":
+            return self.delete_agent.compactor.report()
+
+        elif intent == "jobs":
+            return self.ingest_queue.report()
+
         elif intent == "delete_file":
             number = self._extract_file_number(original_input)[0]
             if number:
@@ -92,30 +142,117 @@ class ConversationalRAGSystem:
             return "Please provide a file number to delete. Example: delete 1"
 
         elif intent == "query_specific":
-            number, query = self._extract_file_number(user_input)
-            if number and query:
-                file_id = self._get_file_id_by_number(number)
-                if file_id:
-                    return self._query_specific_file(file_id, query)
-                return f"Invalid file number: {number}. Use 'list' to see available files."
-            return "Please use format: [number] your question (e.g., '1 what is AI')"
+            file_id, query, error = self._resolve_query(user_input)
+            if error:
+                return error
+            return self._query_specific_file(file_id, query)
 
         return "Type 'help' to see what I can do."
 
+    def stream_input(self, user_input: str) -> Iterator[str]:
+        """Process user input, yielding query answers token by token"""
+        intent, _ = self._detect_intent(user_input)
+        if intent != "query_specific":
+            yield self.process_input(user_input)
+            return
+
+        file_id, query, error = self._resolve_query(user_input)
+        if error:
+            yield error
+            return
+        yield from self.query_agent.stream_query(query, file_id)
+
+    async def aprocess_input(self, user_input: str, embed: Optional[QueryEmbedder] = None) -> str:
+        """Async variant of process_input so one event loop can serve many sessions"""
+        intent, _ = self._detect_intent(user_input)
+        if intent != "query_specific":
+            return await asyncio.to_thread(self.process_input, user_input)
+
+        file_id, query, error = self._resolve_query(user_input)
+        if error:
+            return error
+        return await self.query_agent.aquery_database(query, file_id, embed=embed)
+
+    def _resolve_query(self, user_input: str) -> Tuple[Union[str, List[str], None], str, Optional[str]]:
+        """Resolve "[number] question", "[n,m,...] question" or "all question" into (file scope, query, error)"""
+        match = re.match(r'^(all|\d+(?:\s*,\s*\d+)+)\s+(.+)$', user_input.strip(), re.IGNORECASE)
+        if match:
+            return self._resolve_multi_query(match.group(1).lower(), match.group(2).strip())
+        number, query = self._extract_file_number(user_input)
+        if not (number and query):
+            return None, query, "Please use format: [number] your question (e.g., '1 what is AI')"
+        file_id = self._get_file_id_by_number(number)
+        if not file_id:
+            return None, query, f"Invalid file number: {number}. Use 'list' to see available files."
+        return file_id, query, self.check_query(file_id, query)
+
+    def _resolve_multi_query(self, scope: str, query: str) -> Tuple[Optional[List[str]], str, Optional[str]]:
+        """File IDs for "all" or a comma-separated list of file numbers"""
+        if not query:
+            return None, query, "Please ask a specific question about the selected files."
+        if scope == "all":
+            # Files still loading are left out rather than answered from half their chunks
+            file_ids = self.indexed_file_ids()
+            if not file_ids:
+                return None, query, "No indexed files yet. Use 'load [file_path]' to add a file, 'list' for progress."
+            return file_ids, query, None
+        file_ids = []
+        for number in re.split(r'\s*,\s*', scope):
+            file_id = self._get_file_id_by_number(number)
+            if not file_id:
+                return None, query, f"Invalid file number: {number}. Use 'list' to see available files."
+            error = self.check_query(file_id, query)
+            if error:
+                return None, query, error
+            file_ids.append(file_id)
+        return file_ids, query, None
+
+    def indexed_file_ids(self) -> List[str]:
+        """IDs of the files whose loads have finished"""
+        return [file_id for file_id, info in self.file_manager.get_all_files().items() if is_indexed(info)]
+
+    def _stats(self, command: str) -> str:
+        """Handle 'stats [on|off|reset|json|prometheus|export <path>]'"""
+        args = command.split(maxsplit=2)[1:]
+        action = args[0].lower() if args else ""
+        if action == "on":
+            instrumentation.enabled = True
+            return "Instrumentation enabled."
+        if action == "off":
+            instrumentation.enabled = False
+            return "Instrumentation disabled."
+        if action == "reset":
+            instrumentation.reset()
+            return "Instrumentation counters reset."
+        if action == "json":
+            return instrumentation.to_json()
+        if action == "prometheus":
+            return instrumentation.to_prometheus()
+        if action == "export":
+            if len(args) < 2:
+                return "Please provide a path. Example: stats export metrics.prom (or metrics.json)"
+            instrumentation.export(args[1])
+            return f"Metrics written to {args[1]}"
+        return instrumentation.report()
+
     def _help_response(self) -> str:
         """Generate help response"""
-        loaded_files = len(self.file_manager.get_all_files())
+        loaded_files = self.file_manager.count_files()
         return f"""
 RAG Assistant - Here's what I can do:
-1. Load PDF or text files: "load C:\\path\\to\\file.pdf"
-2. List loaded files: "list"
+1. Load PDF or text files in the background: "load C:\\path\\to\\file.pdf"
+   Load a whole folder or glob in parallel: "load C:\\docs" or "load C:\\docs\\*.pdf"
+2. List loaded files with load progress: "list"; "jobs" shows the background loads
 3. Ask about a specific file: "[number] your question" (e.g., "1 what is AI")
-4. Delete a file: "delete [number]" (e.g., "delete 1")
+   Ask across several files or all of them: "1,3,7 your question" or "all your question"
+4. Delete a file: "delete [number]" (e.g., "delete 1"); "compaction" shows background cleanup progress
+5. Show model load and query timings: "timings"
+6. Show per-stage timings, counters and errors: "stats" ("stats on", "stats off", "stats json", "stats prometheus", "stats export metrics.prom")
 Current status: {loaded_files} files loaded
 """
 
     def _load_file(self, file_path: str) -> str:
-        """Load and process a file"""
+        """Queue a file load and return at once with its ID"""
         if not os.path.exists(file_path):
             return f"File not found: {file_path}"
 
@@ -125,13 +262,83 @@ Current status: {loaded_files} files loaded
         if file_ext not in ['.pdf', '.txt']:
             return f"Only PDF and TXT files are supported. You provided: {file_ext}"
 
-        file_id = self.file_manager.register_file(file_path, file_ext[1:])
-        success, message = self.loader_agent.process_file(file_path, file_id)
+        # Reloading a known file keeps its ID so only changed chunks are re-embedded
+        content_hash = file_sha256(file_path)
+        file_id = self.file_manager.find_file_by_path(file_path)
+        if file_id:
+            file_info = self.file_manager.get_file_info(file_id)
+            # Files indexed before the keyword index existed are reprocessed once (no re-embedding)
+            if (file_info.get("content_hash") == content_hash and is_indexed(file_info)
+                    and file_id in self.runtime.bm25.file_docs):
+                return f"File unchanged, nothing to do. File: {filename}, Unique ID: {file_id}"
+        else:
+            file_id = self.file_manager.register_file(file_path, file_ext[1:])
+        if self.ingest_queue.submit(file_id, file_path) is None:
+            return f"Another process is already loading this file. File: {filename}, Unique ID: {file_id}"
+        return (f"Loading in the background. File: {filename}, Unique ID: {file_id}\n"
+                f"Type 'list' to follow its progress; indexed files can be queried meanwhile.")
+
+    def _load_many(self, target: str) -> str:
+        """Load every PDF/TXT file under a directory or matching a glob"""
+        paths = resolve_paths(target)
+        if not paths:
+            return f"No PDF or TXT files found for: {target}"
+
+        items, new_paths, busy = [], [], 0
+        for file_path in paths:
+            file_id = self.file_manager.find_file_by_path(file_path)
+            if not file_id:
+                new_paths.append(file_path)
+                continue
+            job = self.ingest_queue.job(file_id)
+            file_info = self.file_manager.get_file_info(file_id)
+            # One load per file at a time, in this process and across processes
+            if (job is not None and job.state not in (INDEXED, FAILED)) or not self.file_manager.claim_file(file_id):
+                busy += 1
+                continue
+            known_hash = file_info.get("content_hash") if is_indexed(file_info) else None
+            items.append((file_path, file_id, known_hash))
+        new_ids = self.file_manager.register_files(
+            [(file_path, os.path.splitext(file_path)[1][1:].lower()) for file_path in new_paths]
+        )
+        for file_path, file_id in zip(new_paths, new_ids):
+            self.file_manager.claim_file(file_id)
+            items.append((file_path, file_id, None))
+
+        done = set()
+
+        def on_file_done(file_id: str, content_hash: str, chunk_count: int):
+            done.add(file_id)
+            self.file_manager.release_file(file_id, status=INDEXED, content_hash=content_hash,
+                                           chunk_count=chunk_count, error="")
 
-        if success:
-            self.file_manager.update_file_status(file_id, "processed")
-            return f"Data loaded successfully. File: {filename}, Unique ID: {file_id}"
-        return f"Failed to load file: {message}"
+        try:
+            stats = BulkIngestPipeline(self.runtime).run(items, on_file_done=on_file_done)
+        except Exception as e:
+            instrumentation.record_error("bulk_ingest", e)
+            self._mark_failed([file_id for _, file_id, _ in items if file_id not in done], str(e))
+            return f"Bulk load failed: {str(e)}"
+        file_ids = {file_path: file_id for file_path, file_id, _ in items}
+        for file_path, error in stats.failed.items():
+            self._mark_failed([file_ids[file_path]], error)
+        summary = stats.summary()
+        if busy:
+            summary += f"\n{busy} files skipped because they are already loading in the background"
+        return summary
+
+    def _mark_failed(self, file_ids: List[str], error: str):
+        """Record failed loads so they show up in 'list' instead of as orphaned registrations"""
+        for file_id in file_ids:
+            self.file_manager.release_file(file_id, status=FAILED, error=error)
+
+    def _load_state(self, file_id: str, info: dict) -> str:
+        """Live job progress, or the state recorded by an earlier run"""
+        job = self.ingest_queue.job(file_id)
+        if job is not None:
+            return job.describe()
+        if info.get("status") == FAILED:
+            return f"failed: {info.get('error', '')}"
+        return info.get("status") or "registered"
 
     def _list_files(self) -> str:
         """List all loaded files"""
@@ -141,17 +348,36 @@ Current status: {loaded_files} files loaded
 
         file_list = ["Loaded files:"]
         for index, (file_id, info) in enumerate(files.items(), 1):
-            file_list.append(f"{index}. {info['filename']} (ID: {file_id})")
+            line = f"{index}. {info['filename']} (ID: {file_id})"
+            if not is_indexed(info):
+                line += f" - {self._load_state(file_id, info)}"
+            file_list.append(line)
+        pending = len(self.file_manager.get_tombstoned_files())
+        if pending:
+            file_list.append(f"({pending} deleted files still being compacted; type 'compaction' for progress)")
         return "\n".join(file_list)
 
-    def _query_specific_file(self, file_id: str, query: str) -> str:
-        """Query a specific file"""
-        file_info = self.file_manager.get_file_info(file_id)
-        if not file_info:
-            return f"File ID not found: {file_id}"
+    def check_query(self, file_scope: Union[str, List[str]], query: str) -> Optional[str]:
+        """Return an error message if a file of the scope (one ID or several) or the question is not usable"""
+        for file_id in [file_scope] if isinstance(file_scope, str) else file_scope:
+            file_info = self.file_manager.get_file_info(file_id)
+            if not file_info:
+                return f"File ID not found: {file_id}"
+
+            if not is_indexed(file_info):
+                state = self._load_state(file_id, file_info)
+                hint = "Load it again to retry." if state.startswith(FAILED) else "Type 'list' to follow its progress."
+                return f"{file_info['filename']} is not ready yet ({state}). {hint}"
+            if not query.strip():
+                return f"Please ask a specific question about {file_info['filename']}."
+        return None
 
-        if not query.strip():
-            return f"Please ask a specific question about {file_info['filename']}."
+    def _query_specific_file(self, file_id: Union[str, List[str]], query: str) -> str:
+        """Query a specific file, or several files at once"""
+        if isinstance(file_id, str):
+            error = self.check_query(file_id, query)
+            if error:
+                return error
 
         result = self.query_agent.query_database(query, file_id)
         return result
@@ -171,8 +397,10 @@ Current status: {loaded_files} files loaded
                     break
                 if not user_input:
                     continue
-                response = self.process_input(user_input)
-                print(f"Assistant: {response}\n")
+                print("Assistant: ", end="", flush=True)
+                for part in self.stream_input(user_input):
+                    print(part, end="", flush=True)
+                print("\n")
             except KeyboardInterrupt:
                 print("\nGoodbye!")
                 break
@@ -181,7 +409,26 @@ Current status: {loaded_files} files loaded
 
 def main():
     """Main function to run the conversational RAG system"""
+    parser = argparse.ArgumentParser(description="Conversational RAG assistant.")
+    parser.add_argument("--warm-up", action="store_true",
+                        help="load libraries and models in a background thread while you type")
+    parser.add_argument("--import-profile", action="store_true",
+                        help="report module import, startup and warm-up times")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
     system = ConversationalRAGSystem()
+    init_seconds = time.perf_counter() - start
+    if args.warm_up:
+        system.runtime.warm_up(background=True)
+    if args.import_profile:
+        print(f"Import profile: rag_system modules {IMPORT_SECONDS * 1000:.1f} ms, "
+              f"initialization {init_seconds * 1000:.1f} ms")
+        if args.warm_up:
+            print("Warm-up is running in the background; type 'timings' for the import.* and startup.* steps.")
+        else:
+            system.runtime.warm_up()
+            print(system.runtime.report())
     system.chat()
 
 if __name__ == "__main__":
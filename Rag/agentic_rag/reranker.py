@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """Re-scores retrieval candidates with a small local cross-encoder.
+
+    The depth of the candidate set adapts to the first-stage scores: when
+    the top `keep` results are separated from the rest by `clear_margin`
+    the query is clear-cut and re-ranking is skipped; otherwise every
+    candidate within `window` of the `keep`-th score is re-scored, between
+    2 * keep and `max_candidates` of them.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, max_candidates: int = 20, batch_size: int = 16,
+                 clear_margin: float = 0.1, window: float = 0.15):
+        self.model_name = model_name
+        self.max_candidates = max_candidates
+        self.batch_size = batch_size
+        self.clear_margin = clear_margin
+        self.window = window
+        self._model = None
+        self._lock = threading.Lock()
+        self.reranked = 0
+        self.skipped = 0
+        self.candidates = 0
+
+    @property
+    def model(self):
+        """Load the cross-encoder on first use"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def candidate_depth(self, scores: List[float], keep: int) -> int:
+        """How many first-stage candidates to re-score; `keep` or less means skip"""
+        if len(scores) <= keep:
+            return len(scores)
+        if scores[keep - 1] - scores[keep] >= self.clear_margin:
+            return keep
+        floor = scores[keep - 1] - self.window
+        competitive = sum(1 for score in scores if score >= floor)
+        return max(min(2 * keep, len(scores)), min(competitive, self.max_candidates))
+
+    def rerank(self, query: str, candidates: List[Tuple[Document, float]],
+               keep: int) -> List[Tuple[Document, float]]:
+        """Score (query, chunk) pairs in batches and return the best `keep`"""
+        scores = self.model.predict([(query, doc.page_content) for doc, _ in candidates],
+                                    batch_size=self.batch_size, show_progress_bar=False)
+        ranked = sorted(zip((doc for doc, _ in candidates), (float(score) for score in scores)),
+                        key=lambda item: item[1], reverse=True)
+        with self._lock:
+            self.reranked += 1
+            self.candidates += len(candidates)
+        return ranked[:keep]
+
+    def record_skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def report(self) -> Optional[str]:
+        with self._lock:
+            if not self.reranked and not self.skipped:
+                return None
+            average = self.candidates / self.reranked if self.reranked else 0.0
+            return (f"Re-ranker: {self.reranked} queries re-ranked (avg {average:.1f} candidates), "
+                    f"{self.skipped} clear-cut queries skipped")
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from query_cache import QueryCache
+from embedding_backends import EmbeddingSettings, create_embeddings
+from instrumentation import instrumentation
+from bm25_index import BM25Index
+from reranker import CrossEncoderReranker
+from llm_gateway import LLMGateway
+
+if TYPE_CHECKING:
+    # Imported on first use so commands like 'help' and 'list' start instantly
+    from langchain.schema import Document
+    from langchain_core.embeddings import Embeddings
+    from embedding_cache import CachedEmbeddings
+    from vector_store import VectorStore
+    from chunking import ChunkingEngine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class RAGRuntime:
+    """Owns the vector store shared by every agent; the embedding model is shared by every runtime"""
+
+    def __init__(self, chroma_path: str = "chroma", model_name: str = EMBEDDING_MODEL,
+                 query_cache_path: Optional[str] = None, embedding_cache_dir: Optional[str] = None,
+                 embedding_settings: Optional[EmbeddingSettings] = None, vector_backend: Optional[str] = None):
+        self.chroma_path = chroma_path
+        self.model_name = model_name
+        self.embedding_settings = embedding_settings or EmbeddingSettings()
+        # chroma, or the built-in flat / ivf store (kept under <chroma_path>/flat)
+        self.vector_backend = (vector_backend or os.getenv('VECTOR_BACKEND') or "chroma").lower()
+        # Kept next to (not inside) the store so a full rebuild can still reuse it
+        self.embedding_cache_dir = embedding_cache_dir or os.getenv('EMBEDDING_CACHE_DIR') or os.path.join(
+            os.path.dirname(os.path.abspath(chroma_path)), "embedding_cache"
+        )
+        self._embedding_function = None
+        self._store = None
+        self._bm25 = None
+        self._reranker = None
+        self._chunker = None
+        self._gateways: Dict[Tuple[str, str], LLMGateway] = {}
+        self._lock = threading.RLock()
+        self.timings: Dict[str, Dict[str, float]] = {}
+        # Answers are shared by every QueryAgent using this store
+        self.query_cache = QueryCache(persist_path=query_cache_path or os.getenv('QUERY_CACHE_PATH'))
+
+    @property
+    def embedding_function(self) -> CachedEmbeddings:
+        """Load the embedding model on first use, behind the persistent embedding cache"""
+        if self._embedding_function is None:
+            with self._lock:
+                if self._embedding_function is None:
+                    from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+                    settings = self.embedding_settings
+                    cache_name = self.model_name + (f"__{settings.cache_key}" if settings.cache_key else "")
+                    with self.timed("startup.embedding_model"):
+                        self._embedding_function = CachedEmbeddings(
+                            shared_embeddings(self.model_name, settings),
+                            EmbeddingCache(self.embedding_cache_dir, cache_name)
+                        )
+        return self._embedding_function
+
+    @property
+    def store(self) -> VectorStore:
+        """Open the vector store once and keep it for the process lifetime"""
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    embedding_function = self.embedding_function
+                    with self.timed(f"startup.{self.vector_backend}"):
+                        from vector_store import create_vector_store
+                        self._store = create_vector_store(self.chroma_path, embedding_function, self.vector_backend)
+        return self._store
+
+    @property
+    def bm25(self) -> BM25Index:
+        """Keyword index kept alongside the Chroma directory"""
+        if self._bm25 is None:
+            with self._lock:
+                if self._bm25 is None:
+                    with self.timed("startup.bm25"):
+                        self._bm25 = BM25Index(os.path.abspath(self.chroma_path) + "_bm25")
+        return self._bm25
+
+    @property
+    def reranker(self) -> CrossEncoderReranker:
+        """Cross-encoder shared by every QueryAgent; its model loads on the first re-rank"""
+        if self._reranker is None:
+            with self._lock:
+                if self._reranker is None:
+                    self._reranker = CrossEncoderReranker()
+        return self._reranker
+
+    @property
+    def chunker(self) -> ChunkingEngine:
+        """Chunking engine shared by every ingest path, so its stats cover all of them"""
+        if self._chunker is None:
+            with self._lock:
+                if self._chunker is None:
+                    from chunking import ChunkingEngine
+                    self._chunker = ChunkingEngine()
+        return self._chunker
+
+    def llm_gateway(self, model: str, base_url: Optional[str] = None) -> LLMGateway:
+        """Shared gateway (connection pool, latency history) for a model and endpoint"""
+        key = (model, base_url or "")
+        with self._lock:
+            gateway = self._gateways.get(key)
+            if gateway is None:
+                gateway = self._gateways[key] = LLMGateway(model, base_url)
+            return gateway
+
+    def warm_up(self, background: bool = False) -> Optional[threading.Thread]:
+        """Import the heavy libraries and load the models before a command needs them.
+
+        Each step is recorded in the timings (import.*, startup.*); with
+        `background` the work runs in a daemon thread while the user types.
+        """
+        if background:
+            thread = threading.Thread(target=self.warm_up, name="rag-warmup", daemon=True)
+            thread.start()
+            return thread
+        with self.timed("import.langchain"):
+            import langchain_community.document_loaders  # noqa: F401
+        with self.timed("startup.tokenizer"):
+            from context import count_tokens
+            count_tokens("warm up")
+        with self.timed("import.openai"):
+            import openai  # noqa: F401
+        with self.timed("import.sentence_transformers"):
+            import sentence_transformers  # noqa: F401
+        if self.vector_backend == "chroma":
+            with self.timed("import.chromadb"):
+                import chromadb  # noqa: F401
+        self.embedding_function
+        if self.has_store():
+            self.store
+        self.bm25
+        return None
+
+    def has_store(self) -> bool:
+        """Check whether a store exists on disk or is already open"""
+        return self._store is not None or os.path.exists(self.chroma_path)
+
+    def open_store(self) -> Optional[VectorStore]:
+        """The store if it is already open, without opening it"""
+        return self._store
+
+    def close_store(self):
+        """Drop the store handle so the next access reopens it"""
+        with self._lock:
+            self._store = None
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int,
+                                    filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """Search with a precomputed query embedding, returning relevance scores in [0, 1]"""
+        return self.store.search(embedding, k, where=filter)
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Document]:
+        """Fetch stored chunks by ID"""
+        return self.store.get(ids)
+
+    @contextmanager
+    def timed(self, name: str):
+        """Accumulate wall-clock timings for a named operation"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, elapsed: float):
+        """Add one measurement for a named operation"""
+        instrumentation.observe(name, elapsed)
+        with self._lock:
+            stats = self.timings.setdefault(name, {"count": 0, "total": 0.0, "first": elapsed, "last": 0.0})
+            stats["count"] += 1
+            stats["total"] += elapsed
+            stats["last"] = elapsed
+
+    def report(self) -> str:
+        """Format cold-start and warm-call timings plus peak memory"""
+        settings = self.embedding_settings
+        lines = [f"Runtime timings (embedding backend: {settings.backend}, batch {settings.batch_size}, "
+                 f"threads {settings.threads or 'default'}, vector store: {self.vector_backend}):"]
+        with self._lock:
+            items = sorted(self.timings.items())
+        if not items:
+            lines.append("  (nothing measured yet)")
+        for name, stats in items:
+            line = f"  {name}: first {stats['first'] * 1000:.1f} ms"
+            if stats["count"] > 1:
+                warm_avg = (stats["total"] - stats["first"]) / (stats["count"] - 1)
+                line += f", warm avg {warm_avg * 1000:.1f} ms over {stats['count'] - 1} calls"
+            lines.append(line)
+        if resource is not None:
+            # ru_maxrss is reported in kilobytes on Linux
+            peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            lines.append(f"  peak RSS: {peak_rss_mb:.1f} MB")
+        lines.append(f"  {self.query_cache.report()}")
+        chunk_report = self._chunker.report() if self._chunker is not None else None
+        if chunk_report:
+            lines.append(f"  {chunk_report}")
+        rerank_report = self._reranker.report() if self._reranker is not None else None
+        if rerank_report:
+            lines.append(f"  {rerank_report}")
+        with self._lock:
+            gateways = list(self._gateways.values())
+        for gateway in gateways:
+            gateway_report = gateway.report()
+            if gateway_report:
+                lines.append(f"  {gateway_report}")
+        return "\n".join(lines)
+
+
+_runtimes: Dict[str, RAGRuntime] = {}
+_runtimes_lock = threading.Lock()
+_embedding_models: Dict[Tuple, Embeddings] = {}
+_embedding_models_lock = threading.Lock()
+
+
+def shared_embeddings(model_name: str, settings: EmbeddingSettings) -> Embeddings:
+    """Load an embedding model once per process, however many stores use it"""
+    key = (model_name, settings.backend, settings.threads, settings.batch_size, settings.onnx_file)
+    with _embedding_models_lock:
+        model = _embedding_models.get(key)
+        if model is None:
+            model = _embedding_models[key] = create_embeddings(model_name, settings)
+        return model
+
+
+def get_runtime(chroma_path: str = "chroma", model_name: Optional[str] = None) -> RAGRuntime:
+    """Return the process-wide runtime for a Chroma directory"""
+    key = os.path.abspath(chroma_path)
+    with _runtimes_lock:
+        runtime = _runtimes.get(key)
+        if runtime is None:
+            runtime = RAGRuntime(chroma_path, model_name or EMBEDDING_MODEL)
+            _runtimes[key] = runtime
+        elif model_name and model_name != runtime.model_name:
+            # Its store holds vectors of the other model, which a query with this one cannot search
+            raise ValueError(f"{chroma_path} is already open with embedding model {runtime.model_name}, "
+                             f"not {model_name}")
+        return runtime
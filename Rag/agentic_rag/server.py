@@ -0,0 +1,303 @@
+import re
+import json
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional, Tuple, Union
+from rag_system import ConversationalRAGSystem
+from pipeline import is_bulk_target
+from instrumentation import instrumentation
+
+MAX_BODY_BYTES = 1024 * 1024
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """A request that cannot be read; answered with `status` and the connection closed"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class EmbeddingBatcher:
+    """Collects concurrent query embeddings into one model forward pass.
+
+    The first waiting query opens a batch that closes after `max_wait_ms` or
+    once `max_batch` queries are queued, whichever comes first; the batch is
+    embedded in a worker thread so the event loop keeps accepting requests.
+    """
+
+    def __init__(self, embeddings, max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def embed(self, text: str) -> List[float]:
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                with instrumentation.span("server.embed_batch"):
+                    vectors = await asyncio.to_thread(self._embed, texts)
+            except Exception as e:
+                instrumentation.record_error("server.embed_batch", e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            instrumentation.incr("server.embed_batches")
+            instrumentation.incr("server.embedded_queries", len(batch))
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        embed_queries = getattr(self.embeddings, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(texts)
+        return [self.embeddings.embed_query(text) for text in texts]
+
+
+class RAGServer:
+    """JSON-over-HTTP front end for ConversationalRAGSystem.
+
+    Runs one asyncio event loop: queries share an EmbeddingBatcher and then
+    retrieve and call the LLM concurrently; loads, deletes and listings run
+    in worker threads so they never block other requests.
+    """
+
+    def __init__(self, system: Optional[ConversationalRAGSystem] = None,
+                 max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.system = system or ConversationalRAGSystem()
+        self._batcher_settings = (max_batch, max_wait_ms)
+        self.batcher: Optional[EmbeddingBatcher] = None
+        self.routes = [
+            ("GET", re.compile(r"^/health$"), self._health),
+            ("GET", re.compile(r"^/files$"), self._files),
+            ("POST", re.compile(r"^/load$"), self._load),
+            ("POST", re.compile(r"^/query$"), self._query),
+            ("DELETE", re.compile(r"^/files/(\d+)$"), self._delete),
+            ("GET", re.compile(r"^/stats$"), self._stats),
+            ("GET", re.compile(r"^/metrics$"), self._metrics),
+            ("POST", re.compile(r"^/input$"), self._input),
+        ]
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8000):
+        # Load the embedding model before accepting traffic, not on the first query
+        await asyncio.to_thread(lambda: self.system.runtime.embedding_function)
+        self.batcher = EmbeddingBatcher(self.system.runtime.embedding_function, *self._batcher_settings)
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"RAG API listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self._dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except RequestError as e:
+            # The rest of the stream cannot be trusted, so the connection ends after the error
+            instrumentation.incr(f"server.rejected_{e.status}")
+            try:
+                await self._write_response(writer, e.status, {"error": str(e)}, False)
+            except ConnectionError:
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """The next request, or None at the end of the stream; raises RequestError if it is unreadable"""
+        try:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                return None
+            parts = request_line.decode("latin-1").split()
+            if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+                raise RequestError(400, "Malformed request line")
+            method, target, _ = parts
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except ValueError:
+            # readline() raises ValueError for a line over the stream limit
+            raise RequestError(400, "Request line or header too long") from None
+        length = headers.get("content-length", "0")
+        if not length.isdigit():
+            raise RequestError(400, "Invalid Content-Length")
+        if int(length) > MAX_BODY_BYTES:
+            raise RequestError(413, f"Request body over {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(int(length)) if int(length) else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    async def _write_response(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Any]:
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                return 400, {"error": "Request body must be JSON"}
+            if not isinstance(data, dict):
+                return 400, {"error": "Request body must be a JSON object"}
+            try:
+                with instrumentation.span(f"server.{handler.__name__.lstrip('_')}"):
+                    return await handler(data, *match.groups())
+            except Exception as e:
+                instrumentation.record_error("server", e)
+                return 500, {"error": str(e)}
+        if allowed:
+            return 405, {"error": f"{method} not allowed on {path}"}
+        return 404, {"error": f"No route for {path}"}
+
+    def _resolve_file(self, value: Any) -> Optional[str]:
+        """Accept a list number (1-based, as shown by /files) or a file ID"""
+        value = str(value)
+        if value.isdigit():
+            return self.system.file_manager.get_file_id_by_number(value)
+        return value if self.system.file_manager.get_file_info(value) else None
+
+    @staticmethod
+    def _is_file_ref(value: Any) -> bool:
+        """A list number or file ID; bool is an int subclass but not a file"""
+        return isinstance(value, str) or (isinstance(value, int) and not isinstance(value, bool))
+
+    def _resolve_scope(self, value: Any) -> Union[str, List[str], None]:
+        """A single file, a list of files, or "all" indexed files"""
+        if isinstance(value, str) and value.lower() == "all":
+            return self.system.indexed_file_ids()
+        if not isinstance(value, list):
+            return self._resolve_file(value)
+        file_ids = [self._resolve_file(item) for item in value]
+        return None if None in file_ids else file_ids
+
+    async def _health(self, data: Dict) -> Tuple[int, Any]:
+        return 200, {"status": "ok", "store": self.system.runtime.has_store()}
+
+    async def _files(self, data: Dict) -> Tuple[int, Any]:
+        files = await asyncio.to_thread(self.system.file_manager.get_all_files)
+        listing = []
+        for index, (file_id, info) in enumerate(files.items(), 1):
+            job = self.system.ingest_queue.job(file_id)
+            # Live progress and ETA of a load running in this process
+            listing.append(dict(info, id=file_id, number=index, job=job.to_dict() if job else None))
+        return 200, {"files": listing}
+
+    async def _load(self, data: Dict) -> Tuple[int, Any]:
+        path = data.get("path")
+        if not isinstance(path, str) or not path.strip():
+            return 400, {"error": "Expected {\"path\": \"<file, directory or glob>\"}"}
+        # A structured field: never parsed as chat text, where e.g. "history.txt" would read as "hi"
+        path = path.strip()
+        load = self.system._load_many if is_bulk_target(path) else self.system._load_file
+        return 200, {"message": await asyncio.to_thread(load, path)}
+
+    async def _query(self, data: Dict) -> Tuple[int, Any]:
+        question, scope = data.get("question"), data.get("file")
+        valid_scope = self._is_file_ref(scope) or (
+            isinstance(scope, list) and bool(scope) and all(self._is_file_ref(item) for item in scope))
+        if not isinstance(question, str) or not question.strip() or not valid_scope:
+            return 400, {"error": "Expected {\"file\": <number, id, list of them or \"all\">, \"question\": \"...\"}"}
+        question = question.strip()
+        file_id = self._resolve_scope(scope)
+        if not file_id:
+            return 404, {"error": f"File {scope} not found"}
+        error = self.system.check_query(file_id, question)
+        if error:
+            return 400, {"error": error}
+        answer = await self.system.query_agent.aquery_database(question, file_id, embed=self.batcher.embed)
+        return 200, {"file_id": file_id, "answer": answer}
+
+    async def _delete(self, data: Dict, number: str) -> Tuple[int, Any]:
+        return 200, {"message": await asyncio.to_thread(self.system.delete_agent.delete_file_by_number, number)}
+
+    async def _stats(self, data: Dict) -> Tuple[int, Any]:
+        return 200, instrumentation.snapshot()
+
+    async def _metrics(self, data: Dict) -> Tuple[int, Any]:
+        return 200, instrumentation.to_prometheus()
+
+    async def _input(self, data: Dict) -> Tuple[int, Any]:
+        text = data.get("text")
+        if not isinstance(text, str) or not text.strip():
+            return 400, {"error": "Expected {\"text\": \"...\"}"}
+        text = text.strip()
+        return 200, {"message": await self.system.aprocess_input(text, embed=self.batcher.embed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the RAG assistant over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch", type=int, default=32, help="most queries embedded in one forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="how long the first query of a batch waits for others")
+    args = parser.parse_args()
+    try:
+        asyncio.run(RAGServer(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import os
+import json
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from incremental import file_sha256
+from bm25_index import SegmentBuilder
+from runtime import RAGRuntime
+from instrumentation import instrumentation
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
+    from vector_store import VectorStore
+    from chunking import ChunkingEngine
+
+
+class StreamingIngest:
+    """Page-at-a-time ingestion of a single file with bounded memory.
+
+    Pages come from the loader's lazy_load() and are split as they arrive;
+    chunks are embedded and written in batches of `batch_size`, so only one
+    batch of chunk text is held at a time however long the file is. After
+    each committed batch the next page number is checkpointed under
+    `<chroma>_ingest/`, and a re-run on the same file content and chunk
+    profile skips the writes for every page before it.
+    """
+
+    def __init__(self, runtime: RAGRuntime, batch_size: int = 256, chunker: Optional[ChunkingEngine] = None,
+                 checkpoint_dir: Optional[str] = None):
+        self.runtime = runtime
+        self.batch_size = batch_size
+        self.chunker = chunker or runtime.chunker
+        self.checkpoint_dir = checkpoint_dir or os.path.abspath(runtime.chroma_path) + "_ingest"
+
+    def run(self, file_path: str, file_id: str, loader, file_type: str, content_hash: Optional[str] = None,
+            on_progress: Optional[Callable[[str, Dict[str, int]], None]] = None) -> Dict[str, int]:
+        """Stream one file into the store and return its chunk counts.
+
+        `on_progress(stage, counts)` is called with stage "parsing" after each
+        page is split and "embedding" before each batch is written; raising
+        from it aborts the run, leaving the checkpoint in place.
+        """
+        report = on_progress or (lambda stage, counts: None)
+        content_hash = content_hash or file_sha256(file_path)
+        # Pages written under other chunk settings hold other chunks; the run starts over
+        chunking = self.chunker.fingerprint(file_type)
+        resume_page = self._load_checkpoint(file_id, content_hash, chunking)
+        store = self.runtime.store
+        existing: Set[str] = set(store.ids(where={"file_id": file_id}))
+        # Chunk IDs and keyword postings are kept for the whole file; page text is not
+        seen_hashes: Dict[str, int] = {}
+        current_ids: Set[str] = set()
+        keywords = SegmentBuilder()
+        counts = {"pages": 0, "chunks": 0, "added": 0, "removed": 0, "unchanged": 0, "resumed_pages": resume_page}
+        batch: List[Tuple[Document, str]] = []
+
+        for page_number, page in enumerate(self._pages(loader)):
+            page.metadata["file_id"] = file_id
+            page.metadata["file_type"] = file_type
+            chunks, ids = self.chunker.chunk_documents([page], file_id, seen_hashes)
+            for chunk, chunk_id in zip(chunks, ids):
+                keywords.add(chunk_id, chunk.page_content)
+                current_ids.add(chunk_id)
+            counts["pages"] += 1
+            counts["chunks"] += len(chunks)
+            report("parsing", counts)
+            if page_number < resume_page:
+                counts["unchanged"] += len(chunks)
+                continue
+
+            batch.extend(zip(chunks, ids))
+            if len(batch) >= self.batch_size:
+                report("embedding", counts)
+                self._commit(store, batch, existing, counts)
+                batch = []
+                self._save_checkpoint(file_id, content_hash, chunking, page_number + 1)
+
+        if batch:
+            report("embedding", counts)
+            self._commit(store, batch, existing, counts)
+        report("embedding", counts)
+        stale = list(existing - current_ids)
+        for start in range(0, len(stale), self.batch_size):
+            store.delete(stale[start:start + self.batch_size])
+        counts["removed"] = len(stale)
+        with instrumentation.span("ingest.bm25"):
+            self.runtime.bm25.commit_segment(file_id, keywords)
+        self.discard_checkpoint(file_id)
+        return counts
+
+    def _pages(self, loader) -> Iterator[Document]:
+        """Yield the loader's pages one at a time, timing each parse"""
+        pages = loader.lazy_load()
+        while True:
+            with instrumentation.span("ingest.load"):
+                page = next(pages, None)
+            if page is None:
+                return
+            yield page
+
+    def _commit(self, store: VectorStore, batch: List[Tuple[Document, str]], existing: Set[str], counts: Dict[str, int]):
+        """Embed and add new chunks, refresh the metadata of stored ones"""
+        new_chunks, new_ids, kept_ids, kept_metadatas = [], [], [], []
+        for chunk, chunk_id in batch:
+            if chunk_id in existing:
+                kept_ids.append(chunk_id)
+                kept_metadatas.append(chunk.metadata)
+            else:
+                new_chunks.append(chunk)
+                new_ids.append(chunk_id)
+        with self.runtime.timed("ingest.embed_write"):
+            store.add(new_ids, new_chunks)
+            store.update_metadata(kept_ids, kept_metadatas)
+        counts["added"] += len(new_chunks)
+        counts["unchanged"] += len(kept_ids)
+
+    def _checkpoint_path(self, file_id: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"{file_id}.json")
+
+    def _load_checkpoint(self, file_id: str, content_hash: str, chunking: str) -> int:
+        """First page still to be written, or 0 if there is no checkpoint for this content
+        and chunk profile"""
+        path = self._checkpoint_path(file_id)
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r') as f:
+                checkpoint: Dict[str, Any] = json.load(f)
+        except ValueError:
+            return 0
+        if checkpoint.get("content_hash") != content_hash or checkpoint.get("chunking") != chunking:
+            return 0
+        return int(checkpoint.get("next_page", 0))
+
+    def _save_checkpoint(self, file_id: str, content_hash: str, chunking: str, next_page: int):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = self._checkpoint_path(file_id)
+        with open(path + ".tmp", 'w') as f:
+            json.dump({"content_hash": content_hash, "chunking": chunking, "next_page": next_page}, f)
+        os.replace(path + ".tmp", path)
+
+    def discard_checkpoint(self, file_id: str):
+        path = self._checkpoint_path(file_id)
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,671 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+import numpy as np
+from langchain.schema import Document
+from instrumentation import instrumentation
+
+BACKENDS = ("chroma", "flat", "ivf")
+# Metadata field that names a chunk's segment; filtering on it alone is a segment lookup
+SEGMENT_FIELD = "file_id"
+MMAP_MIN_BYTES = 1 << 20
+
+
+class VectorStore:
+    """Interface for vector backends.
+
+    Chunks are LangChain Documents keyed by chunk ID. `where` filters are
+    equality matches on metadata fields, e.g. {"file_id": ...}. Search
+    scores are relevance in [0, 1] on the scale Chroma reports.
+    """
+
+    name = ""
+
+    def search(self, embedding: List[float], k: int,
+               where: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        raise NotImplementedError
+
+    def ids(self, where: Optional[Dict[str, Any]] = None, limit: Optional[int] = None) -> List[str]:
+        """IDs of stored chunks matching `where`"""
+        raise NotImplementedError
+
+    def get(self, ids: List[str]) -> Dict[str, Document]:
+        raise NotImplementedError
+
+    def add(self, ids: List[str], documents: List[Document]):
+        """Embed and store chunks"""
+        if ids:
+            self.upsert(ids, documents, self.embedding_function.embed_documents([doc.page_content for doc in documents]))
+
+    def upsert(self, ids: List[str], documents: List[Document], embeddings: List[List[float]]):
+        """Store chunks with precomputed embeddings, replacing any with the same IDs"""
+        raise NotImplementedError
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def reclaim(self, size_before: Optional[int] = None) -> bool:
+        """Give the space freed by deletes back to the filesystem, now or when the store
+        next opens; backends that rewrite their files on delete have nothing to do.
+        Returns True when the space comes back later, measured from `size_before`."""
+        return False
+
+    def reclaimed(self) -> Optional[int]:
+        """Bytes a deferred reclaim gave back when this store opened, once; None if none ran"""
+        return None
+
+
+class ChromaStore(VectorStore):
+    """Chroma persistent collection through LangChain.
+
+    Chroma's SQLite file keeps freed pages after deletes. It cannot be
+    vacuumed safely while the client has it open, so reclaim() only leaves a
+    marker holding the store size before compaction, and the VACUUM runs the
+    next time the store is opened, before the client connects.
+    """
+
+    name = "chroma"
+    VACUUM_MARKER = ".vacuum_pending"
+
+    def __init__(self, path: str, embedding_function):
+        from langchain_community.vectorstores import Chroma
+
+        self.path = path
+        self._vacuum_if_pending()
+        self.embedding_function = embedding_function
+        self.db = Chroma(persist_directory=path, embedding_function=embedding_function)
+
+    def search(self, embedding: List[float], k: int,
+               where: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        results = self.db.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=where)
+        relevance_fn = self.db._select_relevance_score_fn()
+        return [(doc, relevance_fn(distance)) for doc, distance in results]
+
+    def ids(self, where: Optional[Dict[str, Any]] = None, limit: Optional[int] = None) -> List[str]:
+        return self.db.get(where=where, include=[], limit=limit)["ids"]
+
+    def get(self, ids: List[str]) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        results = self.db.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        }
+
+    def add(self, ids: List[str], documents: List[Document]):
+        if ids:
+            self.db.add_documents(documents, ids=ids)
+
+    def upsert(self, ids: List[str], documents: List[Document], embeddings: List[List[float]]):
+        self.db._collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            metadatas=[doc.metadata for doc in documents],
+            documents=[doc.page_content for doc in documents],
+        )
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        if ids:
+            self.db._collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.db.delete(ids=ids)
+
+    def count(self) -> int:
+        return self.db._collection.count()
+
+    def reclaim(self, size_before: Optional[int] = None) -> bool:
+        marker = os.path.join(self.path, self.VACUUM_MARKER)
+        # A marker left by an earlier cycle keeps its older, larger baseline
+        size_before = self._marker_size(marker) or size_before
+        with open(marker, 'w') as f:
+            json.dump({"size_before": size_before}, f)
+        return True
+
+    def reclaimed(self) -> Optional[int]:
+        freed, self._vacuum_freed = self._vacuum_freed, None
+        return freed
+
+    @staticmethod
+    def _marker_size(marker: str) -> Optional[int]:
+        try:
+            with open(marker) as f:
+                return json.load(f).get("size_before")
+        except (OSError, ValueError, AttributeError):
+            return None  # no marker, or an empty one from an older version
+
+    def _vacuum_if_pending(self):
+        from compactor import dir_size
+
+        self._vacuum_freed = None
+        marker = os.path.join(self.path, self.VACUUM_MARKER)
+        sqlite_path = os.path.join(self.path, "chroma.sqlite3")
+        if not os.path.exists(marker):
+            return
+        if os.path.exists(sqlite_path):
+            size = self._marker_size(marker) or dir_size(self.path)
+            try:
+                with instrumentation.span("compact.vacuum"):
+                    conn = sqlite3.connect(sqlite_path, timeout=30)
+                    try:
+                        conn.execute("VACUUM")
+                    finally:
+                        conn.close()
+            except sqlite3.Error as e:
+                # Another process holds the file; the marker stays for the next open
+                instrumentation.record_error("compact.vacuum", e)
+                return
+            os.remove(marker)
+            self._vacuum_freed = max(0, size - dir_size(self.path))
+            instrumentation.incr("compact.bytes_freed", self._vacuum_freed)
+            return
+        os.remove(marker)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def cosine_to_relevance(cosine: float) -> float:
+    """Chroma's default score: 1 - squared L2 distance / sqrt(2), for unit vectors"""
+    return 1.0 - (2.0 - 2.0 * cosine) / math.sqrt(2)
+
+
+def load_array(path: str) -> np.ndarray:
+    """Memory-map large arrays; read small ones so thousands of parts do not each hold a file descriptor"""
+    return np.load(path, mmap_mode="r" if os.path.getsize(path) >= MMAP_MIN_BYTES else None)
+
+
+def save_array(path: str, array: np.ndarray):
+    with open(path + ".tmp", 'wb') as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def save_json(path: str, data: Any):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+class Part:
+    """One batch of a segment's chunks.
+
+    Vectors (unit-normalized float32) come from `.npy`, memory-mapped when
+    larger than MMAP_MIN_BYTES; chunk IDs and documents live in JSON files
+    read on first use. Only the documents are ever rewritten in place
+    (metadata updates). Deletes mask rows, listed in the manifest; a part
+    more than half masked is rewritten without them, as merges are.
+    """
+
+    def __init__(self, directory: str, name: str, segment: str):
+        self.name = name
+        self.segment = segment
+        self.base = os.path.join(directory, name)
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: Optional[List[str]] = None
+        self._rows: Optional[Dict[str, int]] = None
+        self._docs: Optional[Dict[str, List]] = None
+        self._lists: Optional[np.ndarray] = None
+        # Rows deleted since the part was written; replaced, never changed in place,
+        # because searches read it without the store lock
+        self.deleted: FrozenSet[int] = frozenset()
+
+    @classmethod
+    def write(cls, directory: str, name: str, segment: str, vectors: np.ndarray, ids: List[str],
+              texts: List[str], metadatas: List[Dict[str, Any]], lists: Optional[np.ndarray] = None) -> "Part":
+        part = cls(directory, name, segment)
+        save_array(part.base + ".npy", np.ascontiguousarray(vectors, dtype=np.float32))
+        save_json(part.base + ".ids.json", ids)
+        save_json(part.base + ".docs.json", {"texts": texts, "metadatas": metadatas})
+        if lists is not None:
+            save_array(part.base + ".lists.npy", lists.astype(np.int32))
+        return part
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def count(self) -> int:
+        """Rows not masked as deleted"""
+        return len(self) - len(self.deleted)
+
+    def live_rows(self) -> Optional[np.ndarray]:
+        """Rows not masked as deleted, or None when none are"""
+        deleted = self.deleted
+        if not deleted:
+            return None
+        return np.setdiff1d(np.arange(len(self)), np.fromiter(deleted, dtype=np.int64), assume_unique=True)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if self._vectors is None:
+            self._vectors = load_array(self.base + ".npy")
+        return self._vectors
+
+    @property
+    def ids(self) -> List[str]:
+        if self._ids is None:
+            with open(self.base + ".ids.json", 'r') as f:
+                self._ids = json.load(f)
+        return self._ids
+
+    @property
+    def rows(self) -> Dict[str, int]:
+        if self._rows is None:
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        return self._rows
+
+    @property
+    def docs(self) -> Dict[str, List]:
+        if self._docs is None:
+            with open(self.base + ".docs.json", 'r') as f:
+                self._docs = json.load(f)
+        return self._docs
+
+    @property
+    def lists(self) -> Optional[np.ndarray]:
+        """IVF list of every row, if the store has an IVF index"""
+        if self._lists is None and os.path.exists(self.base + ".lists.npy"):
+            self._lists = load_array(self.base + ".lists.npy")
+        return self._lists
+
+    def write_lists(self, lists: np.ndarray):
+        save_array(self.base + ".lists.npy", lists.astype(np.int32))
+        self._lists = None
+
+    def write_metadatas(self, metadatas: List[Dict[str, Any]]):
+        docs = {"texts": self.docs["texts"], "metadatas": metadatas}
+        save_json(self.base + ".docs.json", docs)
+        self._docs = docs
+
+    def document(self, row: int) -> Document:
+        docs = self.docs
+        return Document(page_content=docs["texts"][row], metadata=dict(docs["metadatas"][row]))
+
+    def matching_rows(self, where: Dict[str, Any]) -> np.ndarray:
+        metadatas = self.docs["metadatas"]
+        deleted = self.deleted
+        return np.array([row for row, metadata in enumerate(metadatas) if row not in deleted
+                         and all(metadata.get(key) == value for key, value in where.items())], dtype=np.int64)
+
+    def files(self) -> List[str]:
+        return [self.base + suffix for suffix in (".npy", ".ids.json", ".docs.json", ".lists.npy")]
+
+
+class IVFIndex:
+    """Inverted-file index: spherical k-means centroids; a search scans the `nprobe` closest lists"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.centroids: Optional[np.ndarray] = None
+        if os.path.exists(path):
+            self.centroids = np.load(path)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, sample: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            ordered = assignment[order]
+            starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+            sums = np.zeros_like(centroids)
+            sums[ordered[starts]] = np.add.reduceat(sample[order], starts, axis=0)
+            # Lists that lost every vector are reseeded from random samples
+            empty = np.setdiff1d(np.arange(nlist), ordered[starts])
+            sums[empty] = sample[rng.choice(len(sample), len(empty))]
+            centroids = normalize_rows(sums).astype(np.float32)
+        self.centroids = centroids
+        save_array(self.path, centroids)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def probe_mask(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Boolean mask over lists, True for the `nprobe` closest to the query"""
+        scores = self.centroids @ query
+        nprobe = min(nprobe, len(scores))
+        mask = np.zeros(len(scores), dtype=bool)
+        mask[np.argpartition(-scores, nprobe - 1)[:nprobe]] = True
+        return mask
+
+
+class FlatStore(VectorStore):
+    """In-process store of memory-mapped float32 embeddings in per-file segments.
+
+    Every chunk belongs to the segment of its `file_id` (chunks without one,
+    like create_database.py's, are grouped by source). A segment is a list of
+    immutable parts: each write adds a part, and a segment with more than
+    MAX_PARTS parts is merged into one. Startup reads only manifest.json;
+    vectors are memory-mapped and documents loaded when first needed.
+
+    Search is an exact matrix product over the selected segments. With
+    `ivf`, stores of at least `ivf_min_vectors` train an IVF index (sqrt(N)
+    lists, retrained whenever the store doubles), and searches over that
+    many vectors scan only the `nprobe` closest lists; vectors written since
+    the last training are scanned exactly. A filter on file_id alone selects
+    a segment; other filters scan metadata.
+
+    One process writes at a time; others pick up its changes when the
+    manifest changes.
+    """
+
+    name = "flat"
+    MAX_PARTS = 8
+    # Replaced parts stay on disk this long so searches that already picked them can finish
+    RETIRE_SECONDS = 60
+
+    def __init__(self, path: str, embedding_function, ivf: bool = False, nprobe: int = 16,
+                 ivf_min_vectors: int = 10000):
+        self.path = path
+        self.embedding_function = embedding_function
+        self.nprobe = nprobe
+        self.ivf_min_vectors = ivf_min_vectors
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self._lock = threading.RLock()
+        self._segments: Dict[str, List[Part]] = {}
+        self._next_part = 0
+        self._ivf_trained_on = 0
+        self._manifest_mtime: Optional[int] = None
+        # chunk ID -> part, built on the first write
+        self._locations: Optional[Dict[str, Part]] = None
+        self._retired: List[Tuple[float, List[str]]] = []
+        self.ivf = IVFIndex(os.path.join(path, "ivf_centroids.npy")) if ivf else None
+        os.makedirs(path, exist_ok=True)
+        self._orphans_removed = False
+        with self._lock:
+            self._load()
+
+    @staticmethod
+    def segment_of(metadata: Dict[str, Any]) -> str:
+        file_id = metadata.get(SEGMENT_FIELD)
+        return str(file_id) if file_id else f"source:{metadata.get('source', '')}"
+
+    def search(self, embedding: List[float], k: int,
+               where: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        query = normalize_rows(np.asarray(embedding, dtype=np.float32))
+        parts = self._parts(where)
+        probed = None
+        if self.ivf is not None and self.ivf.trained and sum(part.count() for part in parts) >= self.ivf_min_vectors:
+            probed = self.ivf.probe_mask(query, self.nprobe)
+        candidates: List[Tuple[float, Part, int]] = []
+        for part in parts:
+            rows = part.matching_rows(where) if self._needs_scan(where) else part.live_rows()
+            lists = part.lists if probed is not None else None
+            if lists is not None:
+                in_lists = np.flatnonzero(probed[lists])
+                rows = in_lists if rows is None else np.intersect1d(rows, in_lists)
+            scores = part.vectors @ query if rows is None else part.vectors[rows] @ query
+            if not len(scores):
+                continue
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            candidates.extend((float(scores[i]), part, int(i if rows is None else rows[i])) for i in top)
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        return [(part.document(row), cosine_to_relevance(score)) for score, part, row in candidates[:k]]
+
+    def ids(self, where: Optional[Dict[str, Any]] = None, limit: Optional[int] = None) -> List[str]:
+        ids: List[str] = []
+        for part in self._parts(where):
+            rows = part.matching_rows(where) if self._needs_scan(where) else part.live_rows()
+            ids.extend(part.ids if rows is None else (part.ids[row] for row in rows))
+            if limit is not None and len(ids) >= limit:
+                return ids[:limit]
+        return ids
+
+    def get(self, ids: List[str]) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        with self._lock:
+            self._refresh()
+            locations = self._load_locations()
+            found = [(chunk_id, locations[chunk_id]) for chunk_id in ids if chunk_id in locations]
+        return {chunk_id: part.document(part.rows[chunk_id]) for chunk_id, part in found}
+
+    def upsert(self, ids: List[str], documents: List[Document], embeddings: List[List[float]]):
+        if not ids:
+            return
+        vectors = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            obsolete = self._drop(ids)
+            groups: Dict[str, List[int]] = {}
+            for row, doc in enumerate(documents):
+                groups.setdefault(self.segment_of(doc.metadata), []).append(row)
+            for segment, rows in groups.items():
+                part = self._write_part(segment, vectors[rows], [ids[row] for row in rows],
+                                        [documents[row].page_content for row in rows],
+                                        [documents[row].metadata for row in rows])
+                self._segments.setdefault(segment, []).append(part)
+                if len(self._segments[segment]) > self.MAX_PARTS:
+                    obsolete.extend(self._merge(segment))
+            self._maybe_train_ivf()
+            self._save()
+            self._retire(obsolete)
+
+    def update_metadata(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        if not ids:
+            return
+        with self._lock:
+            self._refresh()
+            locations = self._load_locations()
+            updates: Dict[str, Tuple[Part, Dict[int, Dict[str, Any]]]] = {}
+            for chunk_id, metadata in zip(ids, metadatas):
+                part = locations.get(chunk_id)
+                if part is not None:
+                    updates.setdefault(part.name, (part, {}))[1][part.rows[chunk_id]] = metadata
+            for part, changes in updates.values():
+                part.write_metadatas([changes.get(row, metadata)
+                                      for row, metadata in enumerate(part.docs["metadatas"])])
+            self._save()
+
+    def delete(self, ids: List[str]):
+        if not ids:
+            return
+        with self._lock:
+            self._refresh()
+            obsolete = self._drop(ids)
+            self._save()
+            self._retire(obsolete)
+
+    def count(self) -> int:
+        return sum(part.count() for part in self._parts(None))
+
+    def _needs_scan(self, where: Optional[Dict[str, Any]]) -> bool:
+        return bool(where) and set(where) != {SEGMENT_FIELD}
+
+    def _parts(self, where: Optional[Dict[str, Any]]) -> List[Part]:
+        """Parts that can hold chunks matching `where`"""
+        with self._lock:
+            self._refresh()
+            if where and set(where) == {SEGMENT_FIELD}:
+                return list(self._segments.get(str(where[SEGMENT_FIELD]), []))
+            return [part for parts in self._segments.values() for part in parts]
+
+    def _load_locations(self) -> Dict[str, Part]:
+        if self._locations is None:
+            self._locations = {chunk_id: part for parts in self._segments.values() for part in parts
+                               for row, chunk_id in enumerate(part.ids) if row not in part.deleted}
+        return self._locations
+
+    def _write_part(self, segment: str, vectors: np.ndarray, ids: List[str], texts: List[str],
+                    metadatas: List[Dict[str, Any]], lists: Optional[np.ndarray] = None) -> Part:
+        name = f"p{self._next_part:08d}"
+        self._next_part += 1
+        part = Part.write(self.path, name, segment, vectors, ids, texts, metadatas, lists)
+        locations = self._load_locations()
+        for chunk_id in ids:
+            locations[chunk_id] = part
+        return part
+
+    def _write_live(self, segment: str, parts: List[Part]) -> Part:
+        """Write the rows of `parts` not masked as deleted as one new part"""
+        vectors, ids, texts, metadatas, lists = [], [], [], [], []
+        for part in parts:
+            keep = part.live_rows()
+            if keep is None:
+                keep = np.arange(len(part))
+            docs = part.docs
+            vectors.append(part.vectors[keep])
+            ids.extend(part.ids[row] for row in keep)
+            texts.extend(docs["texts"][row] for row in keep)
+            metadatas.extend(docs["metadatas"][row] for row in keep)
+            lists.append(part.lists[keep] if part.lists is not None else None)
+        return self._write_part(segment, np.concatenate(vectors), ids, texts, metadatas,
+                                np.concatenate(lists) if all(item is not None for item in lists) else None)
+
+    def _drop(self, ids: List[str]) -> List[Part]:
+        """Mask chunks as deleted; returns the parts replaced because most of their rows were.
+
+        Rewriting only past half keeps deleting a file batch by batch linear:
+        each rewrite at least halves the part.
+        """
+        locations = self._load_locations()
+        by_part: Dict[str, Tuple[Part, Set[int]]] = {}
+        for chunk_id in ids:
+            part = locations.pop(chunk_id, None)
+            if part is not None:
+                by_part.setdefault(part.name, (part, set()))[1].add(part.rows[chunk_id])
+        obsolete = []
+        for part, dropped in by_part.values():
+            part.deleted = part.deleted | dropped
+            if 2 * len(part.deleted) <= len(part):
+                continue
+            parts = self._segments[part.segment]
+            index = parts.index(part)
+            if part.count():
+                parts[index] = self._write_live(part.segment, [part])
+            else:
+                del parts[index]
+                if not parts:
+                    del self._segments[part.segment]
+            obsolete.append(part)
+        return obsolete
+
+    def _merge(self, segment: str) -> List[Part]:
+        parts = self._segments[segment]
+        self._segments[segment] = [self._write_live(segment, parts)]
+        return parts
+
+    def _maybe_train_ivf(self):
+        """Train the IVF index once the store is large enough, and retrain it whenever it has doubled"""
+        if self.ivf is None:
+            return
+        parts = [part for parts in self._segments.values() for part in parts]
+        total = sum(part.count() for part in parts)
+        if total < self.ivf_min_vectors or (self.ivf.trained and total < 2 * self._ivf_trained_on):
+            return
+        with instrumentation.span("vector_store.ivf_train"):
+            nlist = max(16, min(4096, int(math.sqrt(total))))
+            # 64 training vectors per list is plenty for k-means and bounds the cost; positions
+            # index the live rows of all parts in turn, so deleted rows are never picked
+            picks = np.sort(np.random.default_rng(0).choice(total, min(total, 64 * nlist), replace=False))
+            sample, start = [], 0
+            for part in parts:
+                live = part.live_rows()
+                count = len(part) if live is None else len(live)
+                rows = picks[(picks >= start) & (picks < start + count)] - start
+                if len(rows):
+                    sample.append(part.vectors[rows if live is None else live[rows]])
+                start += count
+            self.ivf.train(np.asarray(np.concatenate(sample), dtype=np.float32), nlist)
+            for part in parts:
+                part.write_lists(self.ivf.assign(np.asarray(part.vectors)))
+        self._ivf_trained_on = total
+
+    def _save(self):
+        save_json(self.manifest_path, {
+            "next_part": self._next_part,
+            "ivf_trained_on": self._ivf_trained_on,
+            "segments": {segment: [part.name for part in parts] for segment, parts in self._segments.items()},
+            "deleted": {part.name: sorted(part.deleted) for parts in self._segments.values()
+                        for part in parts if part.deleted},
+        })
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'r') as f:
+            manifest = json.load(f)
+        known = {part.name: part for parts in self._segments.values() for part in parts}
+        self._next_part = manifest["next_part"]
+        self._ivf_trained_on = manifest.get("ivf_trained_on", 0)
+        self._segments = {
+            segment: [known.get(name) or Part(self.path, name, segment) for name in names]
+            for segment, names in manifest["segments"].items()
+        }
+        deleted = manifest.get("deleted", {})
+        for parts in self._segments.values():
+            for part in parts:
+                part.deleted = frozenset(deleted.get(part.name, ()))
+        self._locations = None
+        self._manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+
+    def _refresh(self):
+        """Reload the manifest if another process changed it"""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._manifest_mtime:
+            self._load()
+            if self.ivf is not None:
+                self.ivf = IVFIndex(self.ivf.path)
+
+    def _retire(self, parts: List[Part]):
+        """Delete the files of parts replaced more than RETIRE_SECONDS ago and queue these"""
+        if not self._orphans_removed:
+            # Deferred from open so startup only reads the manifest
+            self._remove_orphans()
+            self._orphans_removed = True
+        now = time.monotonic()
+        while self._retired and now - self._retired[0][0] >= self.RETIRE_SECONDS:
+            self._remove_files(self._retired.pop(0)[1])
+        if parts:
+            self._retired.append((now, [path for part in parts for path in part.files()]))
+
+    def _remove_orphans(self):
+        """Delete part files left by a crashed write or an earlier process's retired parts"""
+        referenced = {part.name for parts in self._segments.values() for part in parts}
+        self._remove_files([os.path.join(self.path, filename) for filename in os.listdir(self.path)
+                            if filename.startswith("p") and (filename.endswith(".tmp")
+                                                             or filename.split(".", 1)[0] not in referenced)])
+
+    @staticmethod
+    def _remove_files(paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                pass  # still memory-mapped by a search (Windows); removed as an orphan on the next open
+
+
+def create_vector_store(path: str, embedding_function, backend: Optional[str] = None) -> VectorStore:
+    """Build the configured backend; Chroma unless VECTOR_BACKEND=flat or ivf"""
+    backend = (backend or os.getenv('VECTOR_BACKEND') or "chroma").lower()
+    if backend == "chroma":
+        return ChromaStore(path, embedding_function)
+    if backend in ("flat", "ivf"):
+        return FlatStore(os.path.join(path, "flat"), embedding_function, ivf=backend == "ivf",
+                         nprobe=int(os.getenv('VECTOR_IVF_NPROBE', '16')),
+                         ivf_min_vectors=int(os.getenv('VECTOR_IVF_MIN_VECTORS', '10000')))
+    raise ValueError(f"Unknown vector backend: {backend} (expected one of {', '.join(BACKENDS)})")
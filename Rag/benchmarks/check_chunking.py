@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAG_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(RAG_DIR, "agentic_rag"))
+sys.path.insert(0, BENCH_DIR)
+
+from run_benchmarks import REAL_CORPUS, make_synthetic_corpus
+
+
+def load_pages(paths: List[str], repeat: int) -> List:
+    """Parse the corpus once and repeat its pages so pooled splitting has enough work"""
+    from pipeline import parse_file
+
+    pages = []
+    for path in paths:
+        _, _, documents = parse_file(path, os.path.basename(path), None)
+        pages.extend(documents)
+    return pages * repeat
+
+
+def size_distribution(sizes: List[int]) -> Dict[str, float]:
+    ordered = sorted(sizes) or [0]
+    return {"min": ordered[0], "p50": ordered[len(ordered) // 2], "p95": ordered[int(0.95 * (len(ordered) - 1))],
+            "max": ordered[-1], "mean": sum(ordered) / len(ordered)}
+
+
+def check_offsets(pages: List, chunks: List) -> int:
+    """Count chunks whose start_index/end_index do not point back at their text"""
+    texts = {(page.metadata.get("source"), page.metadata.get("page")): page.page_content for page in pages}
+    bad = 0
+    for chunk in chunks:
+        text = texts[(chunk.metadata.get("source"), chunk.metadata.get("page"))]
+        if text[chunk.metadata["start_index"]:chunk.metadata["end_index"]] != chunk.page_content:
+            bad += 1
+    return bad
+
+
+def run_legacy(pages: List) -> Dict:
+    """The previous 500/50-character RecursiveCharacterTextSplitter, for comparison"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from context import count_tokens
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50, length_function=len,
+                                              add_start_index=True)
+    start = time.perf_counter()
+    chunks = splitter.split_documents(pages)
+    seconds = time.perf_counter() - start
+    return {
+        "chunks": len(chunks),
+        "seconds": seconds,
+        "chunks_per_sec": len(chunks) / seconds if seconds else 0.0,
+        "tokens": size_distribution([count_tokens(chunk.page_content) for chunk in chunks]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure chunking throughput and chunk sizes.")
+    parser.add_argument("--files", nargs="*", help="corpus files (default: AI.pdf plus a synthetic corpus)")
+    parser.add_argument("--repeat", type=int, default=20, help="times to repeat the parsed pages")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--legacy", action="store_true",
+                        help="also run the old character splitter (needs langchain's text splitters)")
+    args = parser.parse_args()
+
+    from chunking import ChunkingEngine
+
+    paths = args.files or REAL_CORPUS + make_synthetic_corpus(tempfile.mkdtemp(prefix="rag_chunk_check_"), 5, 2000)
+    pages = load_pages(paths, args.repeat)
+    report: Dict[str, Dict] = {}
+    baseline, failures = None, []
+    for workers in dict.fromkeys(args.workers):
+        engine = ChunkingEngine(workers=workers)
+        chunks = engine.split_documents(pages)
+        report.setdefault("profiles", {file_type: profile.to_dict() for file_type, profile in engine.profiles.items()})
+        report[f"engine_workers_{workers}"] = engine.stats.to_dict()
+        bad = check_offsets(pages, chunks)
+        if bad:
+            failures.append(f"{bad} chunks with wrong offsets (workers={workers})")
+        texts = [chunk.page_content for chunk in chunks]
+        if baseline is None:
+            baseline = texts
+        elif texts != baseline:
+            failures.append(f"workers={workers} produced different chunks than workers={args.workers[0]}")
+    if args.legacy:
+        report["legacy_500_chars"] = run_legacy(pages)
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        print("\n".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAG_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(RAG_DIR, "agentic_rag"))
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np
+from run_benchmarks import QUESTIONS, REAL_CORPUS, make_synthetic_corpus
+
+
+def load_chunks(paths: List[str]) -> List[str]:
+    """Split the corpus exactly like FileLoaderAgent does"""
+    from chunking import ChunkingEngine
+    from pipeline import parse_file
+
+    chunker = ChunkingEngine()
+    texts = []
+    for path in paths:
+        _, _, documents = parse_file(path, "check", None)
+        texts.extend(chunk.page_content for chunk in chunker.split_documents(documents))
+    return texts
+
+
+def embed_all(backend: str, model_name: str, texts: List[str], queries: List[str],
+              threads: int, batch_size: int) -> Dict:
+    """Embed chunks and queries with one backend (no cache) and time it"""
+    from embedding_backends import EmbeddingSettings, create_embeddings
+
+    start = time.perf_counter()
+    embeddings = create_embeddings(model_name, EmbeddingSettings(backend, threads, batch_size))
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunk_vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    embed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    query_vectors = np.asarray([embeddings.embed_query(query) for query in queries], dtype=np.float32)
+    query_seconds = time.perf_counter() - start
+    return {
+        "chunks": chunk_vectors,
+        "queries": query_vectors,
+        "load_seconds": load_seconds,
+        "chunks_per_sec": len(texts) / embed_seconds if embed_seconds else 0.0,
+        "query_ms": query_seconds / max(len(queries), 1) * 1000,
+    }
+
+
+def top_k(chunk_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> np.ndarray:
+    chunks = chunk_vectors / np.linalg.norm(chunk_vectors, axis=1, keepdims=True)
+    queries = query_vectors / np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return np.argsort(-(queries @ chunks.T), axis=1)[:, :k]
+
+
+def compare(baseline: Dict, candidate: Dict, k: int) -> Dict:
+    """Retrieval overlap@k and embedding similarity of a candidate against the baseline"""
+    base_top = top_k(baseline["chunks"], baseline["queries"], k)
+    cand_top = top_k(candidate["chunks"], candidate["queries"], k)
+    overlaps = [len(set(b) & set(c)) / k for b, c in zip(base_top, cand_top)]
+    top1 = [b[0] == c[0] for b, c in zip(base_top, cand_top)]
+
+    base = baseline["chunks"] / np.linalg.norm(baseline["chunks"], axis=1, keepdims=True)
+    cand = candidate["chunks"] / np.linalg.norm(candidate["chunks"], axis=1, keepdims=True)
+    cosine = np.sum(base * cand, axis=1)
+    return {
+        f"overlap_at_{k}": float(np.mean(overlaps)),
+        f"min_overlap_at_{k}": float(np.min(overlaps)),
+        "top1_agreement": float(np.mean(top1)),
+        "mean_chunk_cosine": float(np.mean(cosine)),
+        "min_chunk_cosine": float(np.min(cosine)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an embedding backend's retrieval against float32 torch.")
+    parser.add_argument("--backend", choices=("int8", "onnx"), default="int8")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--files", nargs="*", help="corpus files (default: AI.pdf plus a synthetic corpus)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-overlap", type=float, default=0.8,
+                        help="exit non-zero when mean overlap@k falls below this")
+    args = parser.parse_args()
+
+    paths = args.files or REAL_CORPUS + make_synthetic_corpus(tempfile.mkdtemp(prefix="rag_embed_check_"), 5, 2000)
+    texts = load_chunks(paths)
+    # Questions plus chunk prefixes as queries, so the check also covers the corpus' own vocabulary
+    queries = QUESTIONS + [text[:80] for text in texts[::max(1, len(texts) // 40)]]
+
+    baseline = embed_all("torch", args.model, texts, queries, args.threads, args.batch_size)
+    candidate = embed_all(args.backend, args.model, texts, queries, args.threads, args.batch_size)
+    accuracy = compare(baseline, candidate, args.k)
+
+    report = {
+        "backend": args.backend,
+        "chunks": len(texts),
+        "queries": len(queries),
+        "accuracy": accuracy,
+        "speed": {name: {key: run[key] for key in ("load_seconds", "chunks_per_sec", "query_ms")}
+                  for name, run in (("torch", baseline), (args.backend, candidate))},
+    }
+    print(json.dumps(report, indent=2))
+    if accuracy[f"overlap_at_{args.k}"] < args.min_overlap:
+        print(f"Overlap@{args.k} below {args.min_overlap}: {args.backend} is not a safe drop-in for this corpus.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAG_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(RAG_DIR, "agentic_rag"))
+sys.path.insert(0, BENCH_DIR)
+
+from mock_llm_server import start_server
+from run_benchmarks import percentiles
+
+MESSAGES = [{"role": "user", "content": "Answer the question based only on the following context: ..."}]
+
+
+def run_load(call: Callable[[], object], requests: int, concurrency: int) -> Dict:
+    """Send `requests` completions from `concurrency` threads; count successes and time each one"""
+    def one(_):
+        start = time.perf_counter()
+        try:
+            call()
+            return True, time.perf_counter() - start
+        except Exception:
+            return False, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests)))
+    return {
+        "success_rate": sum(ok for ok, _ in outcomes) / requests,
+        "latency": percentiles([seconds for ok, seconds in outcomes if ok]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare a bare OpenAI client with the LLM gateway against a fault-injecting mock LLM."
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--drop-rate", type=float, default=0.02)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--hedge", action="store_true", help="hedge completions slower than the recent p95")
+    parser.add_argument("--fail-primary", action="store_true",
+                        help="make the primary model always fail so every request falls back")
+    parser.add_argument("--min-success", type=float, default=0.99,
+                        help="exit non-zero when the gateway's success rate falls below this")
+    args = parser.parse_args()
+
+    from openai import OpenAI
+    from llm_gateway import LLMGateway, LLMSettings
+
+    primary, fallback = "mock/primary", "mock/fallback"
+    server = start_server(latency_ms=args.latency_ms, error_rate=args.error_rate, error_status=args.error_status,
+                          drop_rate=args.drop_rate, slow_rate=args.slow_rate, slow_ms=args.slow_ms,
+                          fail_models=[primary] if args.fail_primary else [], seed=0)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    bare = OpenAI(base_url=base_url, api_key="mock", max_retries=0)
+    baseline = run_load(lambda: bare.chat.completions.create(model=primary, messages=MESSAGES),
+                        args.requests, args.concurrency)
+
+    gateway = LLMGateway(primary, base_url, api_key="mock",
+                         settings=LLMSettings(timeout=args.slow_ms / 1000 * 2, backoff_base=0.05, backoff_max=1,
+                                              hedge=args.hedge, hedge_min_ms=args.latency_ms * 2,
+                                              fallback_models=[fallback], max_connections=args.concurrency * 2))
+    resilient = run_load(lambda: gateway.complete(MESSAGES), args.requests, args.concurrency)
+
+    report = {
+        "faults": {key: getattr(args, key) for key in ("error_rate", "error_status", "drop_rate", "slow_rate",
+                                                       "slow_ms", "fail_primary")},
+        "bare_client": baseline,
+        "gateway": dict(resilient, **gateway.stats),
+        "server_requests": server.requests,
+    }
+    print(json.dumps(report, indent=2))
+    server.shutdown()
+    if resilient["success_rate"] < args.min_success:
+        print(f"Gateway success rate {resilient['success_rate']:.3f} is below {args.min_success}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAG_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(RAG_DIR, "agentic_rag"))
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np
+from run_benchmarks import percentiles
+
+
+def make_vectors(count: int, dim: int, files: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, one cluster per file, so filtered and unfiltered search both matter"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((files, dim)).astype(np.float32)
+    vectors = centers[np.arange(count) % files] + 0.8 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build(backend: str, path: str, vectors: np.ndarray, files: int, batch_size: int = 256) -> float:
+    """Write every vector through the store interface, file by file like an ingest, and return the seconds taken"""
+    from langchain.schema import Document
+    from vector_store import create_vector_store
+
+    store = create_vector_store(path, None, backend)
+    start = time.perf_counter()
+    for file_index in range(files):
+        rows = np.arange(file_index, len(vectors), files)
+        for begin in range(0, len(rows), batch_size):
+            batch = rows[begin:begin + batch_size]
+            store.upsert([f"c{row}" for row in batch],
+                         [Document(page_content=f"chunk {row}", metadata={"file_id": f"f{file_index}"})
+                          for row in batch],
+                         vectors[batch].tolist())
+    return time.perf_counter() - start
+
+
+def run_queries(store, queries: np.ndarray, k: int, files: int) -> Dict:
+    """Unfiltered and per-file searches; returns result IDs and latencies"""
+    results: Dict[str, List] = {"all": [], "file": []}
+    latencies: Dict[str, List[float]] = {"all": [], "file": []}
+    for index, query in enumerate(queries):
+        for scope, where in (("all", None), ("file", {"file_id": f"f{index % files}"})):
+            start = time.perf_counter()
+            hits = store.search(query.tolist(), k, where=where)
+            latencies[scope].append(time.perf_counter() - start)
+            results[scope].append([doc.page_content for doc, _ in hits])
+    return {"results": results, "latency": {scope: percentiles(samples) for scope, samples in latencies.items()}}
+
+
+def recall(candidate: List[List[str]], exact: List[List[str]]) -> float:
+    return float(np.mean([len(set(c) & set(e)) / max(len(e), 1) for c, e in zip(candidate, exact)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector store backends on synthetic embeddings.")
+    parser.add_argument("--backends", nargs="+", choices=("chroma", "flat", "ivf"), default=["flat", "ivf"])
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-recall", type=float, default=0.9,
+                        help="exit non-zero when an approximate backend's recall@k falls below this")
+    args = parser.parse_args()
+
+    from vector_store import create_vector_store
+
+    vectors = make_vectors(args.vectors, args.dim, args.files)
+    queries = make_vectors(args.queries, args.dim, args.files, seed=1)
+    work_dir = tempfile.mkdtemp(prefix="rag_vector_check_")
+    report, exact = {}, None
+    try:
+        for backend in ["flat"] + [backend for backend in args.backends if backend != "flat"]:
+            path = os.path.join(work_dir, backend)
+            build_seconds = build(backend, path, vectors, args.files)
+            start = time.perf_counter()
+            store = create_vector_store(path, None, backend)
+            open_ms = (time.perf_counter() - start) * 1000
+            run = run_queries(store, queries, args.k, args.files)
+            if backend == "flat":
+                exact = run["results"]
+            report[backend] = {
+                "build_vectors_per_sec": args.vectors / build_seconds if build_seconds else 0.0,
+                "open_ms": open_ms,
+                "latency": run["latency"],
+                "recall_at_k": {scope: recall(run["results"][scope], exact[scope]) for scope in exact},
+            }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {backend: result for backend, result in report.items() if backend in args.backends}
+    print(json.dumps(report, indent=2))
+    low = [backend for backend, result in report.items() if result["recall_at_k"]["all"] < args.min_recall]
+    if low:
+        print(f"Recall@{args.k} below {args.min_recall} for: {', '.join(low)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
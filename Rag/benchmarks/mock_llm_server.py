@@ -0,0 +1,138 @@
+"""Minimal OpenAI-compatible chat completions server for offline benchmarks.
+
+Answers every /chat/completions request with a canned reply after a fixed
+latency, optionally streamed as server-sent events. Faults can be injected
+to exercise retries, hedging and fallback: a share of requests fails with an
+HTTP error or a dropped connection, a share is answered after a long tail
+latency, and named models are always unavailable. Start it standalone with
+
+    python mock_llm_server.py --port 8765 --latency-ms 200
+    python mock_llm_server.py --error-rate 0.1 --slow-rate 0.05 --slow-ms 3000 --fail-model qwen/qwen3-30b-a3b:free
+
+and point the agents at it with LLM_BASE_URL=http://127.0.0.1:8765/v1
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("Based on the provided context, artificial intelligence is the field of computer science "
+         "concerned with building systems that perform tasks which normally require human intelligence.")
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path: {self.path}"}})
+            return
+
+        settings = self.server.settings
+        model = body.get("model", "mock")
+        with self.server.lock:
+            fault_roll, slow_roll = self.server.rng.random(), self.server.rng.random()
+            self.server.requests += 1
+        if model in settings["fail_models"]:
+            self._send_json(503, {"error": {"message": f"Model {model} is unavailable"}})
+            return
+        if fault_roll < settings["drop_rate"]:
+            self.close_connection = True  # no response at all
+            return
+        if fault_roll < settings["drop_rate"] + settings["error_rate"]:
+            status = settings["error_status"]
+            self._send_json(status, {"error": {"message": f"Injected fault ({status})"}},
+                            {"Retry-After": "1"} if status == 429 else None)
+            return
+        slow = slow_roll < settings["slow_rate"]
+        time.sleep((settings["slow_ms"] if slow else settings["latency_ms"]) / 1000)
+        prompt_tokens = sum(len(message.get("content", "").split()) for message in body.get("messages", []))
+        words = REPLY.split(" ")
+        if body.get("stream"):
+            self._stream(model, words, settings["token_interval_ms"] / 1000)
+            return
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": REPLY}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                      "total_tokens": prompt_tokens + len(words)},
+        })
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, model: str, words: list, interval: float):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for index, word in enumerate(words):
+            delta = {"content": word if index == 0 else " " + word}
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(interval)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def start_server(port: int = 0, latency_ms: float = 200, token_interval_ms: float = 5,
+                 error_rate: float = 0.0, error_status: int = 503, drop_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_ms: float = 2000, fail_models=(), seed=None) -> ThreadingHTTPServer:
+    """Start the mock server in a daemon thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockLLMHandler)
+    server.daemon_threads = True
+    server.settings = {"latency_ms": latency_ms, "token_interval_ms": token_interval_ms,
+                       "error_rate": error_rate, "error_status": error_status, "drop_rate": drop_rate,
+                       "slow_rate": slow_rate, "slow_ms": slow_ms, "fail_models": set(fail_models)}
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI-compatible LLM server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--token-interval-ms", type=float, default=5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of connections closed without a response")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of requests answered after --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--fail-model", action="append", default=[], help="model that always returns 503")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    server = start_server(args.port, args.latency_ms, args.token_interval_ms, args.error_rate, args.error_status,
+                          args.drop_rate, args.slow_rate, args.slow_ms, args.fail_model, args.seed)
+    print(f"Mock LLM listening on http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
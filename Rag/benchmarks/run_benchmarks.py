@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RAG_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(RAG_DIR, "agentic_rag"))
+sys.path.insert(0, os.path.join(RAG_DIR, "simple_rag"))
+sys.path.insert(0, BENCH_DIR)
+
+from mock_llm_server import start_server
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REAL_CORPUS = [os.path.join(RAG_DIR, "simple_rag", "data", "books", "AI.pdf")]
+QUESTIONS = [
+    "what is artificial intelligence",
+    "what are the applications of AI",
+    "explain machine learning",
+    "what is an expert system",
+    "what are the advantages of AI",
+    "what are the disadvantages of AI",
+    "who coined the term artificial intelligence",
+    "what is natural language processing",
+]
+VOCABULARY = ("system data model learning network agent search knowledge reasoning vector "
+              "retrieval language query index document embedding neural planning robot vision").split()
+
+
+def stage_snapshot(runtime) -> Dict[str, Tuple[int, float]]:
+    """(count, total seconds) of each query stage so far"""
+    snapshot = {}
+    for stage in ("embed", "search", "rerank", "llm"):
+        timing = runtime.timings.get(f"query.{stage}", {})
+        snapshot[stage] = (timing.get("count", 0), timing.get("total", 0.0))
+    return snapshot
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 and mean in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {"p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "mean_ms": statistics.mean(ordered) * 1000, "count": len(ordered)}
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total / (1024 * 1024)
+
+
+def make_synthetic_corpus(directory: str, files: int, words: int, seed: int = 0) -> List[str]:
+    """Write deterministic pseudo-text files for repeatable ingest runs"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(files):
+        sentences = []
+        for _ in range(words // 12):
+            sentence = " ".join(rng.choice(VOCABULARY) for _ in range(12))
+            sentences.append(sentence.capitalize() + ".")
+        path = os.path.join(directory, f"synthetic_{index:04d}.txt")
+        with open(path, 'w', encoding="utf-8") as f:
+            f.write("\n".join(sentences))
+        paths.append(path)
+    return paths
+
+
+def bench_agents(work_dir: str, corpus: List[str], queries: int, rerank: bool = False) -> Dict:
+    """Ingest, query and delete through the agentic system's agents"""
+    from agents import DeleteAgent, FileLoaderAgent, QueryAgent
+    from file_manager import FileManager, INDEXED
+    from runtime import get_runtime
+
+    chroma_path = os.path.join(work_dir, "chroma")
+    metadata_path = os.path.join(work_dir, "file_metadata.json")
+    runtime = get_runtime(chroma_path)
+    file_manager = FileManager(metadata_path)
+    loader = FileLoaderAgent(chroma_path, runtime=runtime)
+    # Disable the answer cache so every query measures the full path
+    query_agent = QueryAgent(chroma_path, runtime=runtime, use_cache=False, rerank=rerank)
+    delete_agent = DeleteAgent(chroma_path, metadata_path, runtime=runtime, file_manager=file_manager)
+
+    with runtime.timed("startup.bench"):
+        runtime.store
+
+    ingest_start = time.perf_counter()
+    file_ids, chunks, failures = [], 0, []
+    for path in corpus:
+        file_id = file_manager.register_file(path, os.path.splitext(path)[1][1:])
+        success, message, counts = loader.process_file(path, file_id)
+        if not success:
+            failures.append(message)
+            continue
+        file_manager.update_file_status(file_id, INDEXED)
+        file_ids.append(file_id)
+        chunks += counts["chunks"]
+    ingest_seconds = time.perf_counter() - ingest_start
+
+    # Reopen the populated store to measure its startup cost
+    runtime.close_store()
+    start = time.perf_counter()
+    runtime.store
+    store_open_ms = (time.perf_counter() - start) * 1000
+
+    totals, stages = [], {"embed": [], "search": [], "rerank": [], "llm": []}
+    for index in range(queries):
+        question = QUESTIONS[index % len(QUESTIONS)]
+        file_id = file_ids[index % len(file_ids)]
+        before = stage_snapshot(runtime)
+        start = time.perf_counter()
+        answer = query_agent.query_database(question, file_id)
+        totals.append(time.perf_counter() - start)
+        if answer.startswith("Error"):
+            failures.append(answer)
+        # Only stages this query ran: no hits skip the LLM, clear-cut results skip the re-ranker
+        after = stage_snapshot(runtime)
+        for stage, (count, total) in after.items():
+            if count > before[stage][0]:
+                stages[stage].append(total - before[stage][1])
+    if not rerank:
+        del stages["rerank"]
+
+    store_mb = dir_size_mb(chroma_path)
+    delete_times = []
+    for _ in file_ids:
+        start = time.perf_counter()
+        delete_agent.delete_file_by_number("1")
+        delete_times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    delete_agent.compactor.wait()
+    compaction_seconds = time.perf_counter() - start
+    file_manager.close()
+
+    return {
+        "files": len(corpus),
+        "chunks": chunks,
+        "ingest_seconds": ingest_seconds,
+        "ingest_files_per_sec": len(file_ids) / ingest_seconds if ingest_seconds else 0.0,
+        "ingest_chunks_per_sec": chunks / ingest_seconds if ingest_seconds else 0.0,
+        "chunking": runtime.chunker.stats.to_dict(),
+        "embedding_cold_start_ms": runtime.timings.get("startup.embedding_model", {}).get("first", 0.0) * 1000,
+        "store_open_ms": store_open_ms,
+        "query_latency": percentiles(totals),
+        "query_stage_latency": {stage: percentiles(samples) for stage, samples in stages.items()},
+        "delete_latency": percentiles(delete_times),
+        "compaction_seconds": compaction_seconds,
+        "store_size_mb": store_mb,
+        "store_size_after_compaction_mb": dir_size_mb(chroma_path),
+        "failures": failures[:10],
+    }
+
+
+def bench_create_database(work_dir: str, corpus: List[str]) -> Dict:
+    """Time a full create_database.py build and an incremental re-run"""
+    import create_database
+
+    data_path = os.path.join(work_dir, "books")
+    os.makedirs(data_path, exist_ok=True)
+    for path in corpus:
+        shutil.copy(path, data_path)
+    create_database.CHROMA_PATH = os.path.join(work_dir, "simple_chroma")
+    create_database.DATA_PATH = data_path
+
+    start = time.perf_counter()
+    create_database.generate_data_store(rebuild=True)
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    create_database.generate_data_store()
+    incremental_seconds = time.perf_counter() - start
+
+    return {
+        "files": len(corpus),
+        "full_build_seconds": full_seconds,
+        "incremental_noop_seconds": incremental_seconds,
+        "store_size_mb": dir_size_mb(create_database.CHROMA_PATH),
+    }
+
+
+def compare(current: Dict, baseline_path: str) -> List[str]:
+    """List relative changes of numeric results against an earlier run"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    lines = []
+
+    def walk(new, old, prefix):
+        for key, value in new.items():
+            if key not in old:
+                continue
+            name = f"{prefix}.{key}" if prefix else key
+            if isinstance(value, dict) and isinstance(old[key], dict):
+                walk(value, old[key], name)
+            elif isinstance(value, (int, float)) and isinstance(old[key], (int, float)) and old[key]:
+                change = (value - old[key]) / old[key]
+                lines.append(f"{name}: {old[key]:.2f} -> {value:.2f} ({change:+.1%})")
+
+    walk(current["results"], baseline.get("results", {}), "")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end RAG benchmarks against a local mock LLM.")
+    parser.add_argument("--synthetic-files", type=int, default=20)
+    parser.add_argument("--synthetic-words", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results",
+                                                         f"bench_{datetime.now():%Y%m%d_%H%M%S}.json"))
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary work directory")
+    parser.add_argument("--embedding-backend", choices=("torch", "int8", "onnx"), default="torch")
+    parser.add_argument("--rerank", action="store_true", help="enable cross-encoder re-ranking in QueryAgent")
+    parser.add_argument("--vector-backend", choices=("chroma", "flat", "ivf"), default="chroma")
+    args = parser.parse_args()
+    os.environ["EMBEDDING_BACKEND"] = args.embedding_backend
+    os.environ["VECTOR_BACKEND"] = args.vector_backend
+
+    server = start_server(latency_ms=args.llm_latency_ms)
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ.setdefault("API_KEY", "mock")
+
+    work_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        synthetic = make_synthetic_corpus(os.path.join(work_dir, "synthetic"),
+                                          args.synthetic_files, args.synthetic_words)
+        results = {
+            "real": bench_agents(os.path.join(work_dir, "real"), REAL_CORPUS, args.queries, args.rerank),
+            "synthetic": bench_agents(os.path.join(work_dir, "synth_store"), synthetic, args.queries, args.rerank),
+            "create_database": bench_create_database(os.path.join(work_dir, "simple"), REAL_CORPUS + synthetic),
+        }
+        results["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "settings": vars(args),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        print("\n".join(["Changes against baseline:"] + compare(report, args.compare)))
+
+
+if __name__ == "__main__":
+    main()
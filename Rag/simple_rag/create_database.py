@@ -1,82 +1,155 @@
 # from langchain.document_loaders import DirectoryLoader
-from langchain_community.document_loaders import DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-# from langchain.embeddings import OpenAIEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-import openai 
 from dotenv import load_dotenv
+import argparse
+import glob
+import json
 import os
 import shutil
+import sys
 
 from langchain_community.document_loaders import (
-    DirectoryLoader,
     TextLoader,
     PyPDFLoader,
 )
 
+# Share the embedding/vector-store runtime with the agentic system
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agentic_rag"))
+from runtime import get_runtime
+from incremental import assign_chunk_ids, file_sha256, sync_chunks
+
 load_dotenv()
 
 CHROMA_PATH = "chroma"
 DATA_PATH = "data/books"
+MANIFEST_NAME = "ingest_manifest.json"
 
-
-def main():
-    generate_data_store()
-
-
-def generate_data_store():
-    documents = load_documents()
-    chunks = split_text(documents)
-    save_to_chroma(chunks)
+# Define custom loader mappings for different file types
+LOADER_MAPPING = {
+    ".txt": lambda path: TextLoader(path, encoding="utf-8"),
+    ".pdf": lambda path: PyPDFLoader(path)  # If you still want .md files
+}
 
 
-def load_documents():
-    # Define custom loader mappings for different file types
-    loader_mapping = {
-        ".txt": lambda path: TextLoader(path, encoding="utf-8"),
-        ".pdf": lambda path: PyPDFLoader(path)  # If you still want .md files
-    }
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the Chroma database from DATA_PATH.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="wipe the database and re-embed every file instead of updating incrementally")
+    parser.add_argument("--embedding-backend", choices=("torch", "int8", "onnx"),
+                        help="embedding runtime (default: EMBEDDING_BACKEND or torch); rebuild after switching")
+    parser.add_argument("--embedding-threads", type=int, help="CPU threads for the embedding model")
+    parser.add_argument("--embedding-batch-size", type=int, help="texts per embedding forward pass")
+    parser.add_argument("--vector-backend", choices=("chroma", "flat", "ivf"),
+                        help="vector store (default: VECTOR_BACKEND or chroma); rebuild after switching")
+    parser.add_argument("--chunk-tokens", type=int, help="tokens per chunk for every file type (default 128)")
+    parser.add_argument("--chunk-overlap", type=int, help="tokens shared by neighbouring chunks (default 16)")
+    parser.add_argument("--chunk-workers", type=int, help="processes used to split large files (default: CPU count)")
+    args = parser.parse_args()
+    # The shared runtime reads these when it loads the model
+    for name, value in (("EMBEDDING_BACKEND", args.embedding_backend), ("EMBEDDING_THREADS", args.embedding_threads),
+                        ("EMBEDDING_BATCH_SIZE", args.embedding_batch_size), ("VECTOR_BACKEND", args.vector_backend),
+                        ("CHUNK_TOKENS", args.chunk_tokens), ("CHUNK_OVERLAP_TOKENS", args.chunk_overlap),
+                        ("CHUNK_WORKERS", args.chunk_workers)):
+        if value is not None:
+            os.environ[name] = str(value)
+    generate_data_store(rebuild=args.rebuild)
+
+
+def generate_data_store(rebuild: bool = False):
+    if rebuild and os.path.exists(CHROMA_PATH):
+        # Clear out the database first.
+        get_runtime(CHROMA_PATH).close_store()
+        shutil.rmtree(CHROMA_PATH)
 
+    # Each file's entry holds its content hash and the chunk profile it was split with,
+    # so new chunk settings re-chunk it; entries from older runs (a bare hash) never match
+    chunker = get_runtime(CHROMA_PATH).chunker
+    manifest = load_manifest()
+    current = {path: {"hash": file_sha256(path), "chunking": chunker.fingerprint(os.path.splitext(path)[1][1:])}
+               for path in list_files()}
+    changed = [path for path, entry in current.items() if manifest.get(path) != entry]
+    removed = [path for path in manifest if path not in current]
+    print(f"Found {len(current)} files: {len(changed)} new or changed, "
+          f"{len(current) - len(changed)} unchanged, {len(removed)} removed.")
+
+    for path in removed:
+        remove_from_chroma(path)
+        del manifest[path]
+    for path in changed:
+        documents = load_documents([path])
+        chunks = split_text(documents)
+        save_to_chroma(path, chunks)
+        manifest[path] = current[path]
+        # Save after every file so an interrupted run resumes where it stopped
+        save_manifest(manifest)
+    save_manifest(manifest)
+    chunk_report = chunker.report()
+    if chunk_report:
+        print(chunk_report)
+
+
+def list_files() -> list[str]:
+    paths = []
+    for ext in LOADER_MAPPING:
+        paths.extend(glob.glob(os.path.join(DATA_PATH, "**", f"*{ext}"), recursive=True))
+    return sorted(paths)
+
+
+def load_manifest() -> dict:
+    manifest_path = os.path.join(CHROMA_PATH, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest: dict):
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    manifest_path = os.path.join(CHROMA_PATH, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def load_documents(paths: list[str]):
     all_docs = []
-    for ext, loader_cls in loader_mapping.items():
-        loader = DirectoryLoader(DATA_PATH, glob=f"**/*{ext}", loader_cls=loader_cls)
-        docs = loader.load()
-        all_docs.extend(docs)
+    for path in paths:
+        loader_cls = LOADER_MAPPING[os.path.splitext(path)[1].lower()]
+        all_docs.extend(loader_cls(path).load())
 
-    print(f"Loaded {len(all_docs)} documents from multiple file types.")
+    print(f"Loaded {len(all_docs)} documents from {len(paths)} files.")
     return all_docs
 
 
 def split_text(documents: list[Document]):
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=50,
-        length_function=len,
-        add_start_index=True,
-    )
-    chunks = text_splitter.split_documents(documents)
+    # Same chunking engine (token sizes, per-type profiles) as the agentic loader
+    chunks = get_runtime(CHROMA_PATH).chunker.split_documents(documents)
     print(f"Split {len(documents)} documents into {len(chunks)} chunks.")
 
-    document = chunks[10]
-    print(document.page_content)
-    print(document.metadata)
+    if chunks:
+        document = chunks[min(10, len(chunks) - 1)]
+        print(document.page_content)
+        print(document.metadata)
 
     return chunks
 
 
-def save_to_chroma(chunks: list[Document]):
-    # Clear out the database first.
-    if os.path.exists(CHROMA_PATH):
-        shutil.rmtree(CHROMA_PATH)
-    embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    # Create a new DB from the documents.
-    db = Chroma.from_documents(
-        chunks, embedding_function, persist_directory=CHROMA_PATH
-    )
-    db.persist()
-    print(f"Saved {len(chunks)} chunks to {CHROMA_PATH}.")
+def save_to_chroma(path: str, chunks: list[Document]):
+    runtime = get_runtime(CHROMA_PATH)
+    hits_before, misses_before = runtime.embedding_function.counters()
+    ids = assign_chunk_ids(chunks, path)
+    added, removed, unchanged = sync_chunks(runtime.store, {"source": path}, chunks, ids)
+    hits, misses = runtime.embedding_function.counters()
+    print(f"Saved {len(chunks)} chunks of {path} to {CHROMA_PATH} "
+          f"({added} embedded, {unchanged} unchanged, {removed} removed; "
+          f"embedding cache {hits - hits_before} hits, {misses - misses_before} misses).")
+
+
+def remove_from_chroma(path: str):
+    store = get_runtime(CHROMA_PATH).store
+    ids = store.ids(where={"source": path})
+    store.delete(ids)
+    print(f"Removed {len(ids)} chunks of deleted file {path}.")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,10 @@
 import os
-from openai import OpenAI
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.prompts import ChatPromptTemplate
+import sys
+
+# Share the embedding/vector-store runtime with the agentic system
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agentic_rag"))
+from runtime import get_runtime
+from context import assemble_context
 
 CHROMA_PATH = "../chroma"
 
@@ -16,35 +18,36 @@ Answer the question based only on the following context:
 Answer the question based on the above context: {question}
 """
 
-# Initialize the OpenAI-compatible client for OpenRouter
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv('API_KEY'),  # Make sure API_KEY is set in .env or environment
-)
-
 def main():
+    # Load libraries, embeddings and the vector database while the user types
+    runtime = get_runtime(CHROMA_PATH)
+    warm_up = runtime.warm_up(background=True)
+
     # Ask the user for input
     query_text = input("Ask a question: ")
 
-    # Load embeddings and vector database
-    embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+    from langchain.prompts import ChatPromptTemplate
+
+    # OpenRouter (or LLM_BASE_URL) behind a pooled client with timeouts, retries and fallback models
+    llm = runtime.llm_gateway("qwen/qwen3-30b-a3b:free")
+
+    warm_up.join()
 
     # Search for relevant content
-    results = db.similarity_search_with_relevance_scores(query_text, k=3)
+    with runtime.timed("query.search"):
+        results = runtime.similarity_search_by_vector(runtime.embedding_function.embed_query(query_text), k=3)
     if len(results) == 0:
         print("No relevant results found in the knowledge base.")
         return
 
     # Build prompt
-    context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
+    context_text, results, _tokens = assemble_context(results)
     prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
     prompt = prompt_template.format(context=context_text, question=query_text)
 
     # Call the LLM
     try:
-        completion = client.chat.completions.create(
-            model="qwen/qwen3-30b-a3b:free",
+        completion = llm.complete(
             messages=[{"role": "user", "content": prompt}],
             temperature=0.7,
             max_tokens=512
@@ -54,6 +57,7 @@ def main():
         sources = [doc.metadata.get("source", None) for doc, _score in results]
         formatted_response = f"Response: {response_text}\nSources: {set(sources)}"
         print(formatted_response)
+        print(runtime.report())
 
     except Exception as e:
         print(f"LLM call failed: {e}")
@@ -0,0 +1,47 @@
+from bm25_index import BM25Index, SegmentBuilder, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("What is the A* search, and why?") == ["search"]
+
+
+def test_search_ranks_matching_chunks_and_filters_by_file(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.index_file("f1", ["f1:0", "f1:1"], ["heuristic search with admissible heuristics",
+                                              "sorting algorithms in linear time"])
+    index.index_file("f2", ["f2:0"], ["heuristic functions guide the search"])
+
+    results = index.search("admissible heuristic search", k=10)
+    assert [chunk_id for chunk_id, _ in results] == ["f1:0", "f2:0"]
+    assert [chunk_id for chunk_id, _ in index.search("heuristic", k=10, file_ids=["f2"])] == ["f2:0"]
+    assert index.search("heuristic", k=10, file_ids=["missing"]) == []
+
+
+def test_reindexing_a_file_replaces_its_postings(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.index_file("f1", ["f1:0"], ["graph traversal"])
+    builder = SegmentBuilder()
+    builder.add("f1:1", "dynamic programming")
+    index.commit_segment("f1", builder)
+
+    assert index.search("graph", k=5) == []
+    assert [chunk_id for chunk_id, _ in index.search("dynamic", k=5)] == ["f1:1"]
+    assert index.total_length == 2 and "graph" not in index.doc_freq
+
+
+def test_segments_persist_and_removal_deletes_them(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.index_file("f1", ["f1:0"], ["graph traversal"])
+    index.index_file("f2", ["f2:0"], ["graph coloring"])
+    index.remove_file("f1")
+
+    reopened = BM25Index(str(tmp_path))
+    assert [chunk_id for chunk_id, _ in reopened.search("graph", k=5)] == ["f2:0"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["f2.pkl"]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]], k=60)
+    assert [item for item, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+    assert reciprocal_rank_fusion([]) == []
@@ -0,0 +1,40 @@
+import pytest
+from chunking import ChunkProfile, split_page
+from context import count_tokens
+
+PROSE = "\n\n".join(
+    " ".join(f"Sentence {paragraph}.{index} covers search algorithms and their heuristics in some detail."
+             for index in range(8))
+    for paragraph in range(6)
+)
+WORDS = " ".join(f"word{index}" for index in range(3000))
+
+
+@pytest.mark.parametrize("text", [PROSE, WORDS], ids=["prose", "words"])
+def test_chunks_overlap_by_up_to_overlap_tokens(text):
+    profile = ChunkProfile(chunk_tokens=128, overlap_tokens=16)
+    spans = split_page(text, profile)
+    assert len(spans) > 2
+    for (_, previous_end, _, _), (start, _, _, _) in zip(spans, spans[1:]):
+        assert start < previous_end, "consecutive chunks do not overlap"
+        # The overlap starts on a word boundary and stays near the configured size
+        assert text[start - 1].isspace()
+        assert count_tokens(text[start:previous_end]) <= profile.overlap_tokens + 2
+
+
+def test_zero_overlap_chunks_are_contiguous():
+    spans = split_page(PROSE, ChunkProfile(chunk_tokens=64, overlap_tokens=0))
+    for (_, previous_end, _, _), (start, _, _, _) in zip(spans, spans[1:]):
+        assert start >= previous_end
+        assert not PROSE[previous_end:start].strip()
+
+
+def test_chunks_respect_size_and_offsets():
+    profile = ChunkProfile(chunk_tokens=64, overlap_tokens=8)
+    spans = split_page(PROSE, profile)
+    for start, end, tokens, _ in spans:
+        chunk = PROSE[start:end]
+        assert chunk == chunk.strip()
+        assert tokens <= profile.chunk_tokens
+    covered = "".join(PROSE[start:end] for start, end, _, _ in spans)
+    assert all(word in covered for word in PROSE.split())
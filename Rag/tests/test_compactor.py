@@ -0,0 +1,153 @@
+import sqlite3
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain.schema")
+from langchain.schema import Document
+from agents import DeleteAgent
+from bm25_index import BM25Index
+from compactor import Compactor
+from file_manager import FileManager, JSONMetadataStore
+from query_cache import QueryCache
+from vector_store import ChromaStore, FlatStore
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0, float(index % 5)] for index, text in enumerate(texts)]
+
+
+class RecordingStore(FlatStore):
+    """FlatStore that records the size of every delete batch"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    def delete(self, ids):
+        self.batches.append(len(ids))
+        super().delete(ids)
+
+
+class StuckStore(RecordingStore):
+    def delete(self, ids):
+        self.batches.append(len(ids))
+
+
+class DeferredStore:
+    """Reclaims like Chroma: nothing until the store is reopened"""
+
+    def __init__(self):
+        self.size_before = None
+        self.freed = None
+
+    def ids(self, where=None, limit=None):
+        return []
+
+    def reclaim(self, size_before=None):
+        self.size_before = size_before
+        return True
+
+    def reclaimed(self):
+        freed, self.freed = self.freed, None
+        return freed
+
+
+def make_runtime(tmp_path, store):
+    return SimpleNamespace(chroma_path=str(tmp_path / "chroma"), has_store=lambda: True, store=store,
+                           open_store=lambda: store, bm25=BM25Index(str(tmp_path / "bm25")),
+                           query_cache=QueryCache())
+
+
+def add_file(manager, runtime, tmp_path, name: str, chunks: int) -> str:
+    path = tmp_path / name
+    path.write_text("text")
+    file_id = manager.register_file(str(path), "txt")
+    ids = [f"{file_id}:{index}" for index in range(chunks)]
+    texts = [f"{name} chunk {index}" for index in range(chunks)]
+    runtime.store.add(ids, [Document(page_content=text, metadata={"file_id": file_id}) for text in texts])
+    runtime.bm25.index_file(file_id, ids, texts)
+    return file_id
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return FileManager(str(tmp_path / "meta.json"), store=JSONMetadataStore(str(tmp_path / "meta.json")))
+
+
+def test_delete_tombstones_at_once_and_compacts_in_batches(manager, tmp_path):
+    runtime = make_runtime(tmp_path, RecordingStore(str(tmp_path / "flat"), FakeEmbeddings()))
+    doomed = add_file(manager, runtime, tmp_path, "a.txt", 10)
+    kept = add_file(manager, runtime, tmp_path, "b.txt", 2)
+    compactor = Compactor(runtime, manager, batch_size=3)
+    agent = DeleteAgent(runtime=runtime, file_manager=manager, compactor=compactor)
+
+    assert agent.delete_file_by_number("1").startswith("Successfully deleted file: a.txt")
+    assert manager.get_file_info(doomed) is None
+    assert runtime.bm25.search("chunk", k=20, file_ids=[doomed]) == []
+    compactor.wait()
+
+    assert runtime.store.batches == [3, 3, 3, 1]
+    assert runtime.store.ids({"file_id": doomed}) == []
+    assert len(runtime.store.ids({"file_id": kept})) == 2
+    assert manager.get_tombstoned_files() == {}
+    assert manager.store.get(doomed) is None
+    assert compactor.report().startswith("Compaction: 1 files, 10 chunks removed")
+
+
+def test_a_batch_that_makes_no_progress_keeps_the_tombstone(manager, tmp_path):
+    runtime = make_runtime(tmp_path, StuckStore(str(tmp_path / "flat"), FakeEmbeddings()))
+    file_id = add_file(manager, runtime, tmp_path, "a.txt", 4)
+    manager.tombstone_file(file_id, chunk_count=4)
+    compactor = Compactor(runtime, manager, batch_size=3)
+    compactor.start()
+    compactor.wait()
+
+    assert runtime.store.batches == [3]
+    assert "made no progress" in compactor.last_error
+    assert file_id in manager.get_tombstoned_files()
+
+
+def test_deferred_reclaim_is_pending_until_the_store_reopens(manager, tmp_path):
+    store = DeferredStore()
+    runtime = make_runtime(tmp_path, store)
+    (tmp_path / "chroma").mkdir()
+    (tmp_path / "chroma" / "data").write_bytes(b"x" * 4096)
+    file_id = add_file(manager, SimpleNamespace(store=FlatStore(str(tmp_path / "flat"), FakeEmbeddings()),
+                                                bm25=runtime.bm25), tmp_path, "a.txt", 1)
+    manager.tombstone_file(file_id)
+    compactor = Compactor(runtime, manager)
+    compactor.start()
+    compactor.wait()
+
+    assert store.size_before == 4096
+    assert "0.0 MB freed (more pending" in compactor.report()
+    store.freed = 3 * 1024 * 1024
+    assert "3.0 MB freed" in compactor.report() and "pending" not in compactor.report()
+    assert compactor.bytes_freed == 3 * 1024 * 1024
+
+
+def test_chroma_vacuum_measures_from_the_size_in_the_marker(tmp_path):
+    sqlite_path = tmp_path / "chroma.sqlite3"
+    conn = sqlite3.connect(sqlite_path)
+    conn.execute("CREATE TABLE t (v BLOB)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(b"x" * 4096,) for _ in range(200)])
+    conn.commit()
+    conn.execute("DELETE FROM t")
+    conn.commit()
+    conn.close()
+    size_before = sqlite_path.stat().st_size
+
+    store = object.__new__(ChromaStore)
+    store.path = str(tmp_path)
+    assert store.reclaim(size_before) is True
+    assert store.reclaim(1) is True  # a second cycle keeps the first baseline
+
+    reopened = object.__new__(ChromaStore)
+    reopened.path = str(tmp_path)
+    reopened._vacuum_if_pending()
+    assert not (tmp_path / ChromaStore.VACUUM_MARKER).exists()
+    freed = reopened.reclaimed()
+    assert freed == size_before - sqlite_path.stat().st_size and freed > 100 * 4096
+    assert reopened.reclaimed() is None
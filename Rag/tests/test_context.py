@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("langchain.schema")
+from langchain.schema import Document
+from context import assemble_context, count_tokens, drop_near_duplicates, merge_adjacent
+
+PAGE = "alpha beta gamma delta epsilon zeta eta theta iota kappa"
+
+
+def chunk(start: int, end: int, score: float = 0.5, page: int = 0):
+    metadata = {"file_id": "f1", "source": "/docs/a.pdf", "page": page, "start_index": start, "end_index": end,
+                "tokens": count_tokens(PAGE[start:end])}
+    return Document(page_content=PAGE[start:end], metadata=metadata), score
+
+
+def test_merge_adjacent_spans_the_last_merged_chunk():
+    results = [chunk(0, 16, 0.4), chunk(11, 30, 0.9), chunk(31, 39, 0.2), chunk(6, 10, 0.1)]
+    (doc, score), = merge_adjacent(results)
+    assert doc.page_content == "alpha beta gamma delta epsilon zeta eta"
+    assert score == 0.9
+    start, end = doc.metadata["start_index"], doc.metadata["end_index"]
+    assert (start, end) == (0, 39)
+    assert PAGE[start:end] == doc.page_content
+    assert doc.metadata["tokens"] == count_tokens(doc.page_content)
+
+
+def test_merge_adjacent_keeps_separate_pages_and_gaps_apart():
+    results = [chunk(0, 10), chunk(0, 10, page=1), chunk(40, 50), (Document(page_content="loose"), 0.3)]
+    merged = merge_adjacent(results)
+    assert len(merged) == 4
+    assert merged[-1][0].page_content == "loose"
+
+
+def test_near_duplicates_keep_the_best_scored_copy():
+    text = "the quick brown fox jumps over the lazy dog near the river bank"
+    results = [(Document(page_content=text), 0.4), (Document(page_content=text + " today"), 0.8),
+               (Document(page_content="an unrelated chunk about something else entirely"), 0.5)]
+    kept = drop_near_duplicates(results)
+    assert [score for _, score in kept] == [0.8, 0.5]
+
+
+def test_assemble_context_packs_best_chunks_into_the_budget():
+    results = [(Document(page_content=f"chunk {index} " + "word " * 40), 1.0 - index / 10) for index in range(5)]
+    budget = 2 * count_tokens(results[0][0].page_content) + count_tokens("\n\n---\n\n")
+    context_text, used, tokens = assemble_context(results, max_tokens=budget)
+    assert [score for _, score in used] == [1.0, 0.9]
+    assert tokens <= budget
+    assert context_text.startswith("chunk 0") and "chunk 1" in context_text
+
+
+def test_assemble_context_truncates_an_oversized_best_chunk():
+    results = [(Document(page_content="word " * 500), 0.9)]
+    context_text, used, tokens = assemble_context(results, max_tokens=50)
+    assert len(used) == 1
+    assert 0 < tokens <= 50
+    assert context_text
+
+
+def test_assemble_context_without_budget_uses_everything():
+    results = [(Document(page_content="first chunk text"), 0.9), (Document(page_content="second one here"), 0.5)]
+    context_text, used, _ = assemble_context(results, max_tokens=None)
+    assert len(used) == 2
+    assert context_text == "first chunk text\n\n---\n\nsecond one here"
@@ -0,0 +1,45 @@
+import os
+import sys
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("langchain_community.document_loaders")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simple_rag"))
+import create_database
+from chunking import ChunkingEngine, ChunkProfile
+from runtime import get_runtime
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """create_database over a one-file corpus; returns the list of paths saved per run"""
+    data = tmp_path / "books"
+    data.mkdir()
+    (data / "a.txt").write_text("Search algorithms explore a state space.")
+    monkeypatch.setattr(create_database, "CHROMA_PATH", str(tmp_path / "chroma"))
+    monkeypatch.setattr(create_database, "DATA_PATH", str(data))
+    saved = []
+    monkeypatch.setattr(create_database, "save_to_chroma", lambda path, chunks: saved.append(path))
+    return saved
+
+
+def test_new_chunk_settings_rechunk_unchanged_files(database):
+    create_database.generate_data_store()
+    create_database.generate_data_store()
+    assert len(database) == 1
+
+    get_runtime(create_database.CHROMA_PATH)._chunker = ChunkingEngine(
+        {"default": ChunkProfile(chunk_tokens=64, overlap_tokens=8)}, workers=1)
+    create_database.generate_data_store()
+    assert len(database) == 2
+    create_database.generate_data_store()
+    assert len(database) == 2
+
+
+def test_hash_only_entries_from_older_runs_are_rechunked(database):
+    path = create_database.list_files()[0]
+    create_database.save_manifest({path: create_database.file_sha256(path)})
+    create_database.generate_data_store()
+    assert database == [path]
+    entry = create_database.load_manifest()[path]
+    assert entry["chunking"] == get_runtime(create_database.CHROMA_PATH).chunker.fingerprint("txt")
@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_core.embeddings")
+from embedding_cache import DIGEST_SIZE, EmbeddingCache, text_digest
+
+
+def test_cache_round_trips_and_sees_rows_added_by_another_instance(tmp_path):
+    first = EmbeddingCache(str(tmp_path), "model/a", initial_capacity=2)
+    second = EmbeddingCache(str(tmp_path), "model/a", initial_capacity=2)
+    digests = [text_digest(f"text {index}") for index in range(5)]
+    first.add(digests[:3], [[float(index), 1.0] for index in range(3)])
+    # The second instance picks up the first one's rows, including the grown matrix, before appending
+    second.add(digests[2:], [[99.0, 99.0], [3.0, 1.0], [4.0, 1.0]])
+
+    reopened = EmbeddingCache(str(tmp_path), "model/a")
+    assert len(reopened) == 5
+    assert [list(vector) for vector in reopened.lookup(digests)] == [[float(index), 1.0] for index in range(5)]
+
+
+def test_torn_key_append_is_cut_off(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    cache.add([text_digest("one")], [[1.0, 0.0]])
+    with open(cache.keys_path, 'ab') as f:
+        f.write(text_digest("torn")[:10])  # a crash mid-append
+
+    reopened = EmbeddingCache(str(tmp_path), "model")
+    assert len(reopened) == 1
+    reopened.add([text_digest("two")], [[0.0, 1.0]])
+    with open(cache.keys_path, 'rb') as f:
+        assert len(f.read()) == 2 * DIGEST_SIZE
+    assert list(EmbeddingCache(str(tmp_path), "model").lookup([text_digest("two")])[0]) == [0.0, 1.0]
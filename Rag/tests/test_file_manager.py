@@ -0,0 +1,128 @@
+import os
+import json
+import sqlite3
+import threading
+import pytest
+import file_manager
+from file_manager import (FileManager, JSONMetadataStore, SQLiteMetadataStore, TOMBSTONE, INDEXED,
+                          create_metadata_store)
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def manager(request, tmp_path):
+    fm = FileManager(str(tmp_path / "file_metadata.json"),
+                     store=create_metadata_store(str(tmp_path / "file_metadata.json"), request.param))
+    yield fm
+    fm.close()
+
+
+def test_json_metadata_migrates_to_sqlite_once(tmp_path):
+    legacy_path = tmp_path / "file_metadata.json"
+    legacy = {
+        "aaaa0001": {"file_path": "/docs/a.pdf", "file_type": "pdf", "filename": "a.pdf",
+                     "created_at": "2024-01-01T00:00:00", "status": "processed", "content_hash": "abc"},
+        "aaaa0002": {"file_path": "/docs/b.txt", "file_type": "txt", "filename": "b.txt",
+                     "created_at": "2024-01-02T00:00:00", "status": "processed"},
+    }
+    legacy_path.write_text(json.dumps(legacy))
+
+    store = create_metadata_store(str(legacy_path))
+    assert isinstance(store, SQLiteMetadataStore)
+    assert not legacy_path.exists() and (tmp_path / "file_metadata.json.migrated").exists()
+    assert store.all() == legacy  # order, core fields and extra fields survive
+    assert store.id_by_path("/docs/b.txt") == "aaaa0002"
+    store.close()
+
+    # A second open finds nothing left to migrate and keeps the rows
+    reopened = create_metadata_store(str(legacy_path))
+    assert list(reopened.all()) == ["aaaa0001", "aaaa0002"]
+    reopened.close()
+
+
+def test_numbers_follow_registration_order_and_skip_tombstones(manager):
+    first = manager.register_file("/docs/a.pdf", "pdf")
+    second, third = manager.register_files([("/docs/b.pdf", "pdf"), ("/docs/c.pdf", "pdf")])
+    assert [manager.get_file_id_by_number(str(n)) for n in (1, 2, 3)] == [first, second, third]
+    assert manager.get_file_id_by_number("0") is None
+    assert manager.get_file_id_by_number("x") is None
+
+    manager.tombstone_file(second)
+    assert manager.count_files() == 2
+    assert manager.get_file_id_by_number("2") == third
+    assert manager.get_file_id_by_number("3") is None
+
+
+def test_tombstoned_files_are_hidden_from_lookups(manager):
+    file_id = manager.register_file("/docs/a.pdf", "pdf")
+    manager.tombstone_file(file_id, chunks=12)
+    assert manager.get_file_info(file_id) is None
+    assert manager.find_file_by_path("/docs/a.pdf") is None
+    assert manager.find_files_by_name("a.pdf") == []
+    assert file_id not in manager.get_all_files()
+    assert manager.get_tombstoned_files()[file_id]["status"] == TOMBSTONE
+
+    manager.delete_file(file_id)
+    assert manager.get_tombstoned_files() == {}
+
+
+def test_load_writes_never_resurrect_a_deleted_file(manager):
+    file_id = manager.register_file("/docs/a.pdf", "pdf")
+    assert manager.claim_file(file_id, status="queued")
+    manager.tombstone_file(file_id)
+    assert not manager.update_live_file(file_id, status=INDEXED)
+    assert not manager.release_file(file_id, status=INDEXED)
+    assert manager.get_tombstoned_files()[file_id]["status"] == TOMBSTONE
+    assert not manager.claim_file(file_id)
+
+
+def test_claim_is_refused_while_another_live_process_holds_it(manager, monkeypatch):
+    file_id = manager.register_file("/docs/a.pdf", "pdf")
+    manager.update_file_info(file_id, ingest_owner=f"{file_manager.socket.gethostname()}:{os.getppid()}")
+    assert not manager.claim_file(file_id)
+
+    # The holder died: its claim is taken over
+    monkeypatch.setattr(file_manager, "_pid_alive", lambda pid: False)
+    assert manager.claim_file(file_id, status="queued")
+    assert manager.get_file_info(file_id)["ingest_owner"] == file_manager.process_owner()
+    assert manager.release_file(file_id, status=INDEXED)
+    assert manager.get_file_info(file_id)["ingest_owner"] == ""
+
+
+def test_json_listing_is_safe_while_another_thread_registers(tmp_path):
+    path = str(tmp_path / "file_metadata.json")
+    manager = FileManager(path, store=JSONMetadataStore(path))
+    stop = threading.Event()
+
+    def register():
+        index = 0
+        while not stop.is_set():
+            manager.register_file(f"/docs/{index}.pdf", "pdf")
+            index += 1
+
+    writer = threading.Thread(target=register)
+    writer.start()
+    try:
+        for _ in range(200):
+            manager.get_all_files()
+            manager.get_tombstoned_files()
+    finally:
+        stop.set()
+        writer.join()
+    assert os.listdir(tmp_path) == ["file_metadata.json"]  # no temp files left behind
+
+
+def test_sqlite_close_closes_every_thread_connection(tmp_path):
+    store = SQLiteMetadataStore(str(tmp_path / "meta.sqlite3"))
+    threads = [threading.Thread(target=store.all) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    connections = [conn for _, conn in store._connections]
+    store.close()
+    assert store._connections == []
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+    assert store.count() == 0  # reopens on use
+    store.close()
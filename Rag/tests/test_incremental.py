@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain.schema")
+from langchain.schema import Document
+from incremental import assign_chunk_ids, sync_chunks
+from vector_store import FlatStore
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.fail = False
+
+    def embed_documents(self, texts):
+        if self.fail:
+            raise RuntimeError("embedding backend down")
+        return [[float(len(text)), 1.0, float(index % 5)] for index, text in enumerate(texts)]
+
+
+def chunks(*texts):
+    documents = [Document(page_content=text, metadata={"source": "a.txt", "page": page})
+                 for page, text in enumerate(texts)]
+    return documents, assign_chunk_ids(documents, "a.txt")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FlatStore(str(tmp_path), FakeEmbeddings())
+    sync_chunks(store, {"source": "a.txt"}, *chunks("graph traversal", "breadth first search"))
+    return store
+
+
+def test_only_changed_chunks_are_embedded_and_stale_ones_removed(store):
+    documents, ids = chunks("breadth first search", "dynamic programming")
+    assert sync_chunks(store, {"source": "a.txt"}, documents, ids) == (1, 1, 1)
+    assert sorted(store.ids({"source": "a.txt"})) == sorted(ids)
+    assert store.get([ids[0]])[ids[0]].metadata["page"] == 0  # moved up a page
+
+
+def test_a_failed_embed_keeps_the_previous_chunks(store):
+    before = sorted(store.ids({"source": "a.txt"}))
+    store.embedding_function.fail = True
+    with pytest.raises(RuntimeError):
+        sync_chunks(store, {"source": "a.txt"}, *chunks("dynamic programming"))
+    assert sorted(store.ids({"source": "a.txt"})) == before
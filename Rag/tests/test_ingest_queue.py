@@ -0,0 +1,111 @@
+from types import SimpleNamespace
+import pytest
+import file_manager
+from file_manager import FileManager, JSONMetadataStore, EMBEDDING, FAILED, INDEXED, PARSING, TOMBSTONE
+from ingest_queue import IngestQueue
+
+
+class FakeLoader:
+    """Stands in for FileLoaderAgent; records the file's status as the load sees it"""
+
+    def __init__(self, manager: FileManager, error: str = "", on_start=None):
+        self.manager = manager
+        self.error = error
+        self.on_start = on_start or (lambda file_id: None)
+        self.statuses = []
+        self.discarded = []
+        self.removed = []
+        self.ingest = SimpleNamespace(discard_checkpoint=self.discarded.append)
+        self.runtime = SimpleNamespace(bm25=SimpleNamespace(remove_file=self.removed.append))
+
+    def process_file(self, file_path, file_id, content_hash=None, on_progress=None):
+        try:
+            self.statuses.append(self.manager.get_file_info(file_id)["status"])
+            self.on_start(file_id)
+            on_progress("parsing", {"pages": 1, "chunks": 3, "added": 0, "unchanged": 0})
+            on_progress("embedding", {"pages": 1, "chunks": 3, "added": 3, "unchanged": 0})
+            self.statuses.append(self.manager.get_file_info(file_id)["status"])
+        except Exception as e:
+            return False, f"Error processing file: {e}", {}
+        if self.error:
+            return False, self.error, {}
+        return True, "done", {"chunks": 3}
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return FileManager(str(tmp_path / "meta.json"), store=JSONMetadataStore(str(tmp_path / "meta.json")))
+
+
+def register(manager: FileManager, tmp_path, name: str = "a.txt") -> tuple:
+    path = tmp_path / name
+    path.write_text("some text to load")
+    return manager.register_file(str(path), "txt"), str(path)
+
+
+def test_a_load_moves_through_queued_parsing_embedding_indexed(manager, tmp_path):
+    file_id, path = register(manager, tmp_path)
+    loader = FakeLoader(manager)
+    ingest = IngestQueue(loader, manager, workers=1)
+    job = ingest.submit(file_id, path)
+    assert manager.get_file_info(file_id)["status"] == "queued"
+
+    ingest.start()
+    ingest.wait()
+    assert loader.statuses == [PARSING, EMBEDDING]
+    info = manager.get_file_info(file_id)
+    assert info["status"] == INDEXED and info["chunk_count"] == 3 and info["ingest_owner"] == ""
+    assert info["content_hash"]
+    assert job.state == INDEXED and ingest.files_indexed == 1
+
+
+def test_a_failed_load_records_its_error(manager, tmp_path):
+    file_id, path = register(manager, tmp_path)
+    ingest = IngestQueue(FakeLoader(manager, error="Error processing file: bad PDF"), manager, workers=1)
+    ingest.start()
+    ingest.submit(file_id, path)
+    ingest.wait()
+    info = manager.get_file_info(file_id)
+    assert (info["status"], info["error"]) == (FAILED, "Error processing file: bad PDF")
+    assert ingest.job(file_id).describe() == "failed: Error processing file: bad PDF"
+    assert ingest.files_failed == 1
+
+
+def test_start_resumes_loads_left_unfinished_by_a_dead_process(manager, tmp_path, monkeypatch):
+    file_id, path = register(manager, tmp_path)
+    done_id, _ = register(manager, tmp_path, "b.txt")
+    manager.update_file_info(file_id, status=EMBEDDING, ingest_owner=f"{file_manager.socket.gethostname()}:999999")
+    manager.update_file_info(done_id, status=INDEXED)
+    monkeypatch.setattr(file_manager, "_pid_alive", lambda pid: False)
+
+    loader = FakeLoader(manager)
+    ingest = IngestQueue(loader, manager, workers=1)
+    ingest.start()
+    ingest.wait()
+    assert manager.get_file_info(file_id)["status"] == INDEXED
+    assert ingest.job(done_id) is None  # finished loads are not redone
+    assert len(loader.statuses) == 2
+
+
+def test_deleting_a_file_mid_load_cancels_it_and_keeps_it_deleted(manager, tmp_path):
+    file_id, path = register(manager, tmp_path)
+    compacted = []
+    loader = FakeLoader(manager, on_start=manager.tombstone_file)
+    ingest = IngestQueue(loader, manager, compactor=SimpleNamespace(submit=lambda *args: compacted.append(args[0])),
+                         workers=1)
+    ingest.start()
+    ingest.submit(file_id, path)
+    ingest.wait()
+    assert manager.get_tombstoned_files()[file_id]["status"] == TOMBSTONE
+    assert loader.statuses == [PARSING]  # stopped at the first progress report
+    assert (loader.discarded, loader.removed, compacted) == ([file_id], [file_id], [file_id])
+    assert ingest.job(file_id) is None
+    assert ingest.submit(file_id, path) is None
+
+
+def test_a_file_claimed_by_another_live_process_is_not_loaded(manager, tmp_path):
+    file_id, path = register(manager, tmp_path)
+    manager.update_file_info(file_id, ingest_owner="other-host:1")
+    ingest = IngestQueue(FakeLoader(manager), manager, workers=1)
+    assert ingest.submit(file_id, path) is None
+    assert ingest.job(file_id) is None
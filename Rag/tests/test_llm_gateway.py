@@ -0,0 +1,63 @@
+import os
+import sys
+import asyncio
+import pytest
+
+openai = pytest.importorskip("openai")
+pytest.importorskip("httpx")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from mock_llm_server import REPLY, start_server
+from llm_gateway import LLMGateway, LLMSettings
+
+MESSAGES = [{"role": "user", "content": "What is artificial intelligence?"}]
+
+
+@pytest.fixture
+def mock_llm():
+    """Start a mock LLM server with the given faults; returns (server, base_url)"""
+    servers = []
+
+    def start(**faults):
+        server = start_server(latency_ms=0, token_interval_ms=0, seed=0, **faults)
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def gateway(base_url: str, max_retries: int = 2) -> LLMGateway:
+    settings = LLMSettings(max_retries=max_retries, backoff_base=0.001, backoff_max=0.01, hedge=False,
+                           fallback_models=["backup"])
+    return LLMGateway("primary", base_url=base_url, api_key="test", settings=settings)
+
+
+def test_bad_request_fails_at_once_without_retry_or_fallback(mock_llm):
+    server, base_url = mock_llm(error_rate=1.0, error_status=400)
+    llm = gateway(base_url)
+    with pytest.raises(openai.BadRequestError):
+        llm.complete(MESSAGES)
+    assert server.requests == 1
+    assert llm.stats["retries"] == 0 and llm.stats["fallbacks"] == 0
+
+
+def test_unavailable_model_is_retried_then_falls_back(mock_llm):
+    server, base_url = mock_llm(fail_models=["primary"])
+    llm = gateway(base_url, max_retries=2)
+    completion = llm.complete(MESSAGES)
+    assert completion.choices[0].message.content == REPLY
+    assert completion.model == "backup"
+    assert server.requests == 4  # three tries on the primary, one on the fallback
+    assert llm.stats["retries"] == 2 and llm.stats["fallbacks"] == 1
+
+
+def test_async_calls_work_across_event_loops(mock_llm):
+    _, base_url = mock_llm()
+    llm = gateway(base_url)
+    for _ in range(2):
+        completion = asyncio.run(llm.acomplete(MESSAGES))
+        assert completion.choices[0].message.content == REPLY
+    # The client of the first, closed loop was dropped when the second loop made its own
+    assert len(llm._async_clients) == 1
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_community.document_loaders")
+from bm25_index import BM25Index
+from chunking import ChunkingEngine
+from pipeline import BulkIngestPipeline
+from query_cache import QueryCache
+from vector_store import FlatStore
+
+OLD = "Graph traversal visits every vertex once.\n\nBreadth first search uses a queue."
+NEW = "Dynamic programming stores subproblem answers.\n\nMemoization caches recursive calls."
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.fail = False
+
+    def embed_documents(self, texts):
+        if self.fail:
+            raise RuntimeError("embedding backend down")
+        return [[float(len(text)), 1.0, float(index % 5)] for index, text in enumerate(texts)]
+
+    def counters(self):
+        return 0, 0
+
+
+class FailingStore(FlatStore):
+    fail = False
+
+    def upsert(self, ids, documents, embeddings):
+        if self.fail:
+            raise OSError("disk full")
+        super().upsert(ids, documents, embeddings)
+
+
+@pytest.fixture
+def setup(tmp_path):
+    embeddings = FakeEmbeddings()
+    runtime = SimpleNamespace(store=FailingStore(str(tmp_path / "flat"), embeddings), embedding_function=embeddings,
+                              chunker=ChunkingEngine(workers=1), bm25=BM25Index(str(tmp_path / "bm25")),
+                              query_cache=QueryCache())
+    path = tmp_path / "a.txt"
+    path.write_text(OLD)
+    done = []
+    pipeline = BulkIngestPipeline(runtime, parse_workers=1)
+    pipeline.run([(str(path), "f1", None)], on_file_done=lambda *args: done.append(args))
+    return runtime, pipeline, path, done
+
+
+def searchable(runtime, word: str):
+    return [chunk_id for chunk_id, _ in runtime.bm25.search(word, k=10)]
+
+
+@pytest.mark.parametrize("failing", ["embed", "write"])
+def test_a_failed_reload_keeps_the_previous_version(setup, failing):
+    runtime, pipeline, path, done = setup
+    old_ids = sorted(runtime.store.ids({"file_id": "f1"}))
+    assert old_ids and searchable(runtime, "traversal") and len(done) == 1
+
+    path.write_text(NEW)
+    if failing == "embed":
+        runtime.embedding_function.fail = True
+    else:
+        runtime.store.fail = True
+    with pytest.raises((RuntimeError, OSError)):
+        pipeline.run([(str(path), "f1", done[0][1])], on_file_done=lambda *args: done.append(args))
+
+    assert len(done) == 1  # the new version was never reported as done
+    assert sorted(runtime.store.ids({"file_id": "f1"})) == old_ids
+    assert searchable(runtime, "traversal") and not searchable(runtime, "memoization")
+
+
+def test_a_successful_reload_replaces_the_previous_version(setup):
+    runtime, pipeline, path, done = setup
+    old_ids = set(runtime.store.ids({"file_id": "f1"}))
+    path.write_text(NEW)
+    stats = pipeline.run([(str(path), "f1", done[0][1])], on_file_done=lambda *args: done.append(args))
+
+    assert stats.removed == len(old_ids)
+    assert not old_ids & set(runtime.store.ids({"file_id": "f1"}))
+    assert searchable(runtime, "memoization") and not searchable(runtime, "traversal")
+    assert done[-1][0] == "f1" and done[-1][2] == stats.chunks
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("numpy")
+import query_cache
+from query_cache import QueryCache, normalize_query
+
+MODEL = "mock-model"
+
+
+def test_normalize_query_ignores_case_spacing_and_trailing_punctuation():
+    assert normalize_query("  What is  A* search?? ") == normalize_query("what is a* search")
+
+
+def test_exact_hits_match_the_normalized_question_file_k_and_model():
+    cache = QueryCache()
+    cache.put("What is BM25?", "f1", 5, MODEL, None, "a ranking function", cost=2.0)
+    assert cache.get_exact("what is bm25", "f1", 5, MODEL) == "a ranking function"
+    assert cache.get_exact("what is bm25", "f2", 5, MODEL) is None
+    assert cache.get_exact("what is bm25", "f1", 8, MODEL) is None
+    assert cache.stats["exact_hits"] == 1 and cache.stats["saved_seconds"] > 0
+
+
+def test_semantic_hits_need_the_similarity_threshold():
+    cache = QueryCache(similarity_threshold=0.95)
+    cache.put("what is bm25", "f1", 5, MODEL, [1.0, 0.0, 0.0], "a ranking function", cost=1.0)
+    assert cache.get_semantic([0.99, 0.05, 0.0], "f1", 5, MODEL) == "a ranking function"
+    assert cache.get_semantic([0.5, 0.5, 0.5], "f1", 5, MODEL) is None
+    assert cache.get_semantic([1.0, 0.0, 0.0], "f2", 5, MODEL) is None
+    assert cache.stats["semantic_hits"] == 1 and cache.stats["misses"] == 2
+
+
+def test_entries_expire_and_are_evicted_least_recently_used(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, "time", lambda: now[0])
+    cache = QueryCache(max_entries=2, ttl_seconds=60)
+    cache.put("q1", "f1", 5, MODEL, None, "a1", cost=1.0)
+    cache.put("q2", "f1", 5, MODEL, None, "a2", cost=1.0)
+    assert cache.get_exact("q1", "f1", 5, MODEL) == "a1"  # q2 is now least recently used
+    cache.put("q3", "f1", 5, MODEL, None, "a3", cost=1.0)
+    assert cache.get_exact("q2", "f1", 5, MODEL) is None
+    assert cache.get_exact("q1", "f1", 5, MODEL) == "a1"
+
+    now[0] += 61
+    assert cache.get_exact("q1", "f1", 5, MODEL) is None
+
+
+def test_invalidate_file_drops_its_answers_from_memory_and_disk(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = QueryCache(persist_path=path)
+    cache.put("q1", "f1", 5, MODEL, [1.0, 0.0], "about f1", cost=1.0)
+    cache.put("q1", "f2", 5, MODEL, [1.0, 0.0], "about f2", cost=1.0)
+    cache.invalidate_file("f1")
+    assert cache.get_exact("q1", "f1", 5, MODEL) is None
+
+    reopened = QueryCache(persist_path=path)
+    assert reopened.get_exact("q1", "f1", 5, MODEL) is None
+    assert reopened.get_exact("q1", "f2", 5, MODEL) == "about f2"
+    assert reopened.get_semantic([1.0, 0.0], "f2", 5, MODEL) == "about f2"
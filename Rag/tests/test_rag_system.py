@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+import pytest
+from file_manager import FileManager, JSONMetadataStore, EMBEDDING, INDEXED
+from rag_system import ConversationalRAGSystem
+
+
+class FakeQueryAgent:
+    def __init__(self):
+        self.calls = []
+
+    def query_database(self, query, file_scope):
+        self.calls.append((query, file_scope))
+        return f"answer to {query}"
+
+
+@pytest.fixture
+def system(tmp_path):
+    """A system over three files, the second still loading; nothing heavy is started"""
+    rag = object.__new__(ConversationalRAGSystem)
+    rag.file_manager = FileManager(str(tmp_path / "meta.json"), store=JSONMetadataStore(str(tmp_path / "meta.json")))
+    rag.query_agent = FakeQueryAgent()
+    rag.ingest_queue = SimpleNamespace(job=lambda file_id: None)
+    rag.ids = []
+    for name, status in (("a.txt", INDEXED), ("b.txt", EMBEDDING), ("c.txt", INDEXED)):
+        file_id = rag.file_manager.register_file(str(tmp_path / name), "txt")
+        rag.file_manager.update_file_info(file_id, status=status)
+        rag.ids.append(file_id)
+    return rag
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("1 this is a question", "query_specific"),  # "this" contains "hi"
+    ("2 how do I load a list", "query_specific"),
+    ("1,3 compare the two", "query_specific"),
+    ("1 , 3 compare", "query_specific"),
+    ("all what is ai", "query_specific"),
+    ("ALL What is AI", "query_specific"),
+    ("hi", "help"),
+    ("load docs/history.txt", "load_file"),
+    ("list", "list_files"),
+    ("delete 2", "delete_file"),
+    ("stats export metrics.json", "stats"),
+    ("jobs", "jobs"),
+    ("allow me", "unknown"),
+])
+def test_detect_intent(system, text, intent):
+    assert system._detect_intent(text)[0] == intent
+
+
+def test_a_comma_list_resolves_to_each_file(system):
+    scope, query, error = system._resolve_query("1, 3 compare the two")
+    assert (scope, query, error) == ([system.ids[0], system.ids[2]], "compare the two", None)
+
+
+def test_all_resolves_to_the_indexed_files_only(system):
+    scope, query, error = system._resolve_query("all what is ai")
+    assert (scope, query, error) == ([system.ids[0], system.ids[2]], "what is ai", None)
+
+
+def test_a_file_still_loading_is_refused(system):
+    _, _, error = system._resolve_query("1,2 compare")
+    assert error == "b.txt is not ready yet (embedding). Type 'list' to follow its progress."
+    _, _, error = system._resolve_query("4,1 compare")
+    assert error.startswith("Invalid file number: 4")
+
+
+def test_a_single_number_resolves_to_one_file(system):
+    assert system._resolve_query("3 this question") == (system.ids[2], "this question", None)
+
+
+def test_process_input_queries_across_files(system):
+    assert system.process_input("1,3 compare them") == "answer to compare them"
+    assert system.query_agent.calls == [("compare them", [system.ids[0], system.ids[2]])]
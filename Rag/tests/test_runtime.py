@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("numpy")
+import runtime
+from embedding_backends import EmbeddingSettings
+from runtime import RAGRuntime, get_runtime
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Record every model load instead of loading one"""
+    calls = []
+    monkeypatch.setattr(runtime, "_embedding_models", {})
+    monkeypatch.setattr(runtime, "create_embeddings",
+                        lambda model_name, settings: calls.append((model_name, settings.backend)) or FakeEmbeddings())
+    return calls
+
+
+def test_stores_share_one_embedding_model(tmp_path, loads):
+    first = RAGRuntime(str(tmp_path / "a"), embedding_cache_dir=str(tmp_path / "cache"))
+    second = RAGRuntime(str(tmp_path / "b"), embedding_cache_dir=str(tmp_path / "cache"))
+    assert first.embedding_function.embeddings is second.embedding_function.embeddings
+    assert loads == [(runtime.EMBEDDING_MODEL, "torch")]
+
+
+def test_other_models_and_backends_load_their_own(tmp_path, loads):
+    for model_name, backend in (("m1", "torch"), ("m2", "torch"), ("m1", "int8"), ("m1", "torch")):
+        RAGRuntime(str(tmp_path / model_name / backend), model_name=model_name,
+                   embedding_settings=EmbeddingSettings(backend=backend),
+                   embedding_cache_dir=str(tmp_path / "cache")).embedding_function
+    assert loads == [("m1", "torch"), ("m2", "torch"), ("m1", "int8")]
+
+
+def test_get_runtime_refuses_a_second_model_for_the_same_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(runtime, "_runtimes", {})
+    opened = get_runtime(str(tmp_path / "chroma"), "m1")
+    assert get_runtime(str(tmp_path / "chroma")) is opened
+    assert get_runtime(str(tmp_path / "chroma"), "m1") is opened
+    with pytest.raises(ValueError, match="already open with embedding model m1"):
+        get_runtime(str(tmp_path / "chroma"), "m2")
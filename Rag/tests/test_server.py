@@ -0,0 +1,185 @@
+import json
+import asyncio
+import pytest
+import server
+from server import EmbeddingBatcher, RAGServer
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.batches = []
+
+    def embed_queries(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+class FakeFileManager:
+    files = {"f1": {"filename": "a.pdf", "status": "indexed"}, "f2": {"filename": "b.pdf", "status": "indexed"}}
+
+    def get_file_id_by_number(self, number):
+        ids = list(self.files)
+        return ids[int(number) - 1] if 1 <= int(number) <= len(ids) else None
+
+    def get_file_info(self, file_id):
+        return self.files.get(file_id)
+
+    def get_all_files(self):
+        return dict(self.files)
+
+
+class FakeQueryAgent:
+    async def aquery_database(self, question, file_scope, embed=None):
+        vector = await embed(question)
+        return f"answer to {question!r} over {file_scope} ({vector[0]:.0f})"
+
+
+class FakeIngestQueue:
+    def job(self, file_id):
+        return None
+
+
+class FakeSystem:
+    """The parts of ConversationalRAGSystem the server calls"""
+
+    def __init__(self):
+        self.file_manager = FakeFileManager()
+        self.query_agent = FakeQueryAgent()
+        self.ingest_queue = FakeIngestQueue()
+        self.loads = []
+        self.inputs = []
+
+    def _load_file(self, path):
+        self.loads.append(("file", path))
+        return f"Loading {path}"
+
+    def _load_many(self, target):
+        self.loads.append(("many", target))
+        return f"Loading everything under {target}"
+
+    def check_query(self, file_scope, query):
+        return None
+
+    def indexed_file_ids(self):
+        return list(self.file_manager.files)
+
+    async def aprocess_input(self, text, embed=None):
+        self.inputs.append(text)
+        return f"handled {text}"
+
+
+@pytest.fixture
+def api():
+    app = RAGServer(system=FakeSystem())
+    app.batcher = EmbeddingBatcher(FakeEmbeddings(), max_batch=8, max_wait_ms=5)
+    return app
+
+
+def exchange(app, raw: bytes):
+    """Send raw bytes to a live server and return (status, JSON body)"""
+    async def run():
+        listener = await asyncio.start_server(app._handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(raw)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            await app.batcher.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+    return asyncio.run(run())
+
+
+def post(app, path: str, payload) -> tuple:
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    return exchange(app, f"POST {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                         .encode() + body)
+
+
+def test_routes_dispatch_by_path_and_method(api):
+    status, body = asyncio.run(api._dispatch("GET", "/files", b""))
+    assert status == 200
+    assert [(item["id"], item["number"]) for item in body["files"]] == [("f1", 1), ("f2", 2)]
+    assert asyncio.run(api._dispatch("GET", "/nope", b""))[0] == 404
+    assert asyncio.run(api._dispatch("PUT", "/files", b""))[0] == 405
+
+
+def test_load_goes_straight_to_the_loader(api, tmp_path):
+    # "history" contains "hi", which the chat parser would read as a help request
+    status, body = post(api, "/load", {"path": "docs/history.txt"})
+    assert (status, body["message"]) == (200, "Loading docs/history.txt")
+    post(api, "/load", {"path": 'docs/say "hello".txt'})
+    post(api, "/load", {"path": str(tmp_path)})
+    post(api, "/load", {"path": "docs/*.pdf"})
+    assert api.system.loads == [("file", "docs/history.txt"), ("file", 'docs/say "hello".txt'),
+                                ("many", str(tmp_path)), ("many", "docs/*.pdf")]
+
+
+@pytest.mark.parametrize("path, payload", [
+    ("/query", [1]),
+    ("/query", "question"),
+    ("/query", {"file": 1, "question": 5}),
+    ("/query", {"file": {"id": "f1"}, "question": "what?"}),
+    ("/query", {"file": True, "question": "what?"}),
+    ("/query", {"file": [], "question": "what?"}),
+    ("/query", {"file": 1, "question": "   "}),
+    ("/load", {"path": ["a.pdf"]}),
+    ("/load", {}),
+    ("/input", {"text": 3}),
+    ("/input", b"not json"),
+])
+def test_malformed_bodies_get_400(api, path, payload):
+    status, body = post(api, path, payload)
+    assert status == 400, body
+    assert api.system.loads == [] and api.system.inputs == []
+
+
+def test_query_resolves_numbers_ids_lists_and_all(api):
+    assert post(api, "/query", {"file": 2, "question": "what?"}) == (
+        200, {"file_id": "f2", "answer": "answer to 'what?' over f2 (5)"})
+    assert post(api, "/query", {"file": ["1", "f2"], "question": "why?"})[1]["file_id"] == ["f1", "f2"]
+    assert post(api, "/query", {"file": "all", "question": "how?"})[1]["file_id"] == ["f1", "f2"]
+    assert post(api, "/query", {"file": 9, "question": "what?"})[0] == 404
+
+
+def test_unreadable_requests_get_400_or_413_and_close(api):
+    assert exchange(api, b"garbage\r\n\r\n")[0] == 400
+    assert exchange(api, b"POST /load HTTP/1.1\r\nContent-Length: abc\r\n\r\n")[0] == 400
+    too_big = server.MAX_BODY_BYTES + 1
+    assert exchange(api, f"POST /load HTTP/1.1\r\nContent-Length: {too_big}\r\n\r\n".encode())[0] == 413
+
+
+def test_batcher_embeds_concurrent_queries_in_one_pass():
+    embeddings = FakeEmbeddings()
+
+    async def run():
+        batcher = EmbeddingBatcher(embeddings, max_batch=4, max_wait_ms=50)
+        try:
+            return await asyncio.gather(*(batcher.embed("q" * n) for n in range(1, 7)))
+        finally:
+            await batcher.close()
+
+    vectors = asyncio.run(run())
+    assert vectors == [[float(n)] for n in range(1, 7)]
+    # Capped at max_batch: the first four share a pass, the rest follow in the next
+    assert [len(batch) for batch in embeddings.batches] == [4, 2]
+
+
+def test_batcher_failure_reaches_every_waiting_query():
+    class Broken:
+        def embed_queries(self, texts):
+            raise RuntimeError("model crashed")
+
+    async def run():
+        batcher = EmbeddingBatcher(Broken(), max_wait_ms=20)
+        try:
+            return await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+        finally:
+            await batcher.close()
+
+    assert [str(error) for error in asyncio.run(run())] == ["model crashed", "model crashed"]
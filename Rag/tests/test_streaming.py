@@ -0,0 +1,97 @@
+from contextlib import nullcontext
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain.schema")
+from langchain.schema import Document
+from bm25_index import BM25Index
+from chunking import ChunkingEngine, ChunkProfile
+from streaming import StreamingIngest
+from vector_store import FlatStore
+
+PAGES = [f"Page {number} covers topic {number} of the manual in a short paragraph." for number in range(6)]
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0, float(index % 5)] for index, text in enumerate(texts)]
+
+
+class PageLoader:
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def lazy_load(self):
+        for number, text in enumerate(PAGES):
+            yield Document(page_content=text, metadata={"source": self.file_path, "page": number})
+
+
+class Interrupt(Exception):
+    pass
+
+
+def interrupt_at_embedding(batch: int):
+    """on_progress that aborts before the given (1-based) batch is written"""
+    seen = [0]
+
+    def report(stage, counts):
+        if stage == "embedding":
+            seen[0] += 1
+            if seen[0] == batch:
+                raise Interrupt()
+    return report
+
+
+def make_ingest(tmp_path, name: str = "chroma", chunker=None) -> StreamingIngest:
+    runtime = SimpleNamespace(chroma_path=str(tmp_path / name), store=FlatStore(str(tmp_path / name), FakeEmbeddings()),
+                              bm25=BM25Index(str(tmp_path / f"{name}_bm25")), timed=lambda name: nullcontext(),
+                              chunker=chunker or ChunkingEngine(workers=1))
+    return StreamingIngest(runtime, batch_size=2)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "manual.txt"
+    path.write_text("\n".join(PAGES))
+    return str(path)
+
+
+def test_an_interrupted_load_resumes_after_the_last_committed_batch(tmp_path, source):
+    ingest = make_ingest(tmp_path)
+    with pytest.raises(Interrupt):
+        ingest.run(source, "f1", PageLoader(source), "txt", on_progress=interrupt_at_embedding(2))
+    assert len(ingest.runtime.store.ids({"file_id": "f1"})) == 2
+
+    counts = ingest.run(source, "f1", PageLoader(source), "txt")
+    assert counts["resumed_pages"] == 2
+    assert (counts["added"], counts["unchanged"], counts["removed"]) == (4, 2, 0)
+    assert not (tmp_path / "chroma_ingest" / "f1.json").exists()
+
+    clean = make_ingest(tmp_path, "clean")
+    clean.run(source, "f1", PageLoader(source), "txt")
+    assert sorted(ingest.runtime.store.ids({"file_id": "f1"})) == sorted(clean.runtime.store.ids({"file_id": "f1"}))
+    assert [chunk_id for chunk_id, _ in ingest.runtime.bm25.search("topic", k=10)] == \
+        [chunk_id for chunk_id, _ in clean.runtime.bm25.search("topic", k=10)]
+
+
+def test_new_chunk_settings_restart_from_the_first_page(tmp_path, source):
+    ingest = make_ingest(tmp_path)
+    with pytest.raises(Interrupt):
+        ingest.run(source, "f1", PageLoader(source), "txt", on_progress=interrupt_at_embedding(2))
+
+    ingest.chunker = ChunkingEngine({"default": ChunkProfile(chunk_tokens=64, overlap_tokens=8)}, workers=1)
+    counts = ingest.run(source, "f1", PageLoader(source), "txt")
+    assert counts["resumed_pages"] == 0
+    assert counts["pages"] == len(PAGES)
+    assert len(ingest.runtime.store.ids({"file_id": "f1"})) == counts["chunks"]
+
+
+def test_changed_content_restarts_from_the_first_page(tmp_path, source):
+    ingest = make_ingest(tmp_path)
+    with pytest.raises(Interrupt):
+        ingest.run(source, "f1", PageLoader(source), "txt", on_progress=interrupt_at_embedding(2))
+
+    counts = ingest.run(source, "f1", PageLoader(source), "txt", content_hash="edited")
+    assert counts["resumed_pages"] == 0
+    assert counts["added"] + counts["unchanged"] == counts["chunks"]
@@ -0,0 +1,93 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain.schema")
+from langchain.schema import Document
+import vector_store
+from vector_store import FlatStore
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(text)), 1.0, float(index % 7)] for index, text in enumerate(texts)]
+
+
+class SignedEmbeddings:
+    """Deleted-to-be chunks point the other way, so they are easy to spot in a sample"""
+
+    def embed_documents(self, texts):
+        return [[-1.0 if text.startswith("dead") else 1.0, float(index % 7), 1.0] for index, text in enumerate(texts)]
+
+
+def documents(file_id: str, count: int):
+    return [Document(page_content=f"{file_id} chunk {index}", metadata={"file_id": file_id, "page": index})
+            for index in range(count)]
+
+
+@pytest.fixture
+def rows_written(monkeypatch):
+    """Count the rows written to new parts"""
+    written = [0]
+    write = vector_store.Part.write.__func__
+
+    def counting(cls, directory, name, segment, vectors, ids, *args, **kwargs):
+        written[0] += len(ids)
+        return write(cls, directory, name, segment, vectors, ids, *args, **kwargs)
+
+    monkeypatch.setattr(vector_store.Part, "write", classmethod(counting))
+    return written
+
+
+def test_batched_deletes_rewrite_each_row_a_bounded_number_of_times(tmp_path, rows_written):
+    store = FlatStore(str(tmp_path), FakeEmbeddings())
+    store.add([f"A:{index}" for index in range(1000)], documents("A", 1000))
+    store.add(["B:0"], documents("B", 1))
+    rows_written[0] = 0
+
+    ids = store.ids({"file_id": "A"})
+    for start in range(0, 900, 50):
+        store.delete(ids[start:start + 50])
+    # Rewriting the whole part per batch would copy ~8,500 rows
+    assert rows_written[0] <= 1000
+    assert store.count() == 101
+    assert store.ids({"file_id": "A"}) == ids[900:]
+
+
+def test_masked_rows_are_invisible_and_survive_a_reopen(tmp_path):
+    store = FlatStore(str(tmp_path), FakeEmbeddings())
+    store.add([f"A:{index}" for index in range(10)], documents("A", 10))
+    store.delete(["A:0", "A:1", "A:2"])
+
+    for current in (store, FlatStore(str(tmp_path), FakeEmbeddings())):
+        assert current.count() == 7
+        assert "A:0" not in current.ids()
+        assert current.get(["A:0", "A:3"]).keys() == {"A:3"}
+        hits = current.search([9.0, 1.0, 0.0], 10, where={"file_id": "A"})
+        assert len(hits) == 7
+        assert all(not doc.page_content.endswith((" 0", " 1", " 2")) for doc, _ in hits)
+        assert len(current.ids({"page": 1})) == 0
+
+
+def test_deleting_every_chunk_of_a_file_removes_its_segment(tmp_path):
+    store = FlatStore(str(tmp_path), FakeEmbeddings())
+    store.add([f"A:{index}" for index in range(4)], documents("A", 4))
+    store.delete(["A:0"])
+    store.delete(["A:1", "A:2", "A:3"])
+    assert "A" not in store._segments
+    assert store.count() == 0
+
+
+def test_ivf_trains_on_live_rows_only(tmp_path, monkeypatch):
+    store = FlatStore(str(tmp_path), SignedEmbeddings(), ivf=True, ivf_min_vectors=500)
+    store.add([f"A:{index}" for index in range(400)],
+              [Document(page_content=f"{'dead' if index < 200 else 'live'} {index}", metadata={"file_id": "A"})
+               for index in range(400)])
+    store.delete([f"A:{index}" for index in range(200)])  # masked, not rewritten
+    samples = []
+    train = store.ivf.train
+    monkeypatch.setattr(store.ivf, "train", lambda sample, nlist: samples.append(sample) or train(sample, nlist))
+    store.add([f"B:{index}" for index in range(300)], documents("B", 300))
+
+    sample, = samples
+    assert len(sample) == store.count() == 500
+    assert (sample[:, 0] > 0).all()